@@ -160,4 +160,5 @@ def gerar_dashboard_bi_final(caminho_prontuarios, caminho_dicionario, arquivo_sa
     print(f"✅ Dashboard BI Finalizado: {arquivo_saida}")
 
 # Execução
-gerar_dashboard_bi_final("analise/prontuarios_auditados/", "codigos_cid/ICD-11-com-descricoes.json")
\ No newline at end of file
+if __name__ == "__main__":
+    gerar_dashboard_bi_final("analise/prontuarios_auditados/", "codigos_cid/ICD-11-com-descricoes.json")
\ No newline at end of file
@@ -0,0 +1,400 @@
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from comum.cliente_ollama import OLLAMA_MAX_EM_VOO
+from pipeline import BACKENDS, ETAPAS, FUNCOES_ETAPA, FUNCOES_LOTE, carregar_etapa
+
+# --- CONFIGURAÇÕES ---
+# Executar a partir da raiz do projeto
+PASTA_PRONTUARIOS = "semclinbr/prontuarios"
+PASTA_XML = "semclinbr/prontuarios_xml"
+ARQUIVO_TRADUCAO = "semclinbr/traducao_entidades.json"
+DICIONARIO_CID = "codigos_cid/ICD-11-pt-clean.json"
+PASTA_RESULTADOS = "benchmark/resultados"
+AMOSTRA_PADRAO = 50
+
+# Comparação: piora relativa de vazão, p95 ou aumento de memória na etapa acima de TOLERANCIA é regressão;
+# nas taxas de acerto dos caches, queda absoluta acima de TOLERANCIA_ACERTO
+TOLERANCIA = 0.10
+TOLERANCIA_ACERTO = 0.05
+DIFERENCA_MINIMA_LATENCIA = 0.005  # s; abaixo disso a variação do p95 é ruído (ex: ingestão em ms)
+DIFERENCA_MINIMA_MEMORIA = 20     # MB; abaixo disso a variação do aumento de RSS é ruído
+INTERVALO_RSS = 0.02              # s entre as amostras de memória residente durante uma etapa
+
+# Benchmark ponta a ponta sobre um subconjunto do SemClinBR: ingestão (XML -> JSON),
+# classifica, busca, escolha, auditoria e análise, uma etapa por vez (a saída de uma,
+# em memória, é a entrada da próxima), para isolar a vazão de cada uma. O resultado
+# (JSON) traz, por etapa: prontuários/s, percentis de latência por prontuário e por
+# chamada à LLM, tokens, memória (pico e aumento durante a etapa) e acerto dos caches. "comparar" aponta as
+# regressões entre duas execuções (código de saída 1 se houver alguma).
+
+ORDEM = ["ingestao"] + list(ETAPAS) + ["analise"]
+
+def percentis(valores):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    posicao = lambda p: ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados))) - 1))]
+    return {
+        "n": len(ordenados),
+        "media": round(sum(ordenados) / len(ordenados), 4),
+        "p50": round(posicao(50), 4),
+        "p95": round(posicao(95), 4),
+        "p99": round(posicao(99), 4),
+    }
+
+def pico_rss_mb():
+    """Pico de memória residente do processo até agora (ru_maxrss vem em KB no Linux)."""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def rss_atual_mb():
+    """Memória residente atual do processo (de /proc/self/statm); None fora do Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return paginas * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+class MonitorRSS:
+    """
+    Amostra a memória residente numa thread enquanto a etapa roda, para medidas por etapa
+    (o ru_maxrss é do processo inteiro e só cresce). Uso: with MonitorRSS() as memoria: ...
+    """
+    def __init__(self, intervalo=INTERVALO_RSS):
+        self.intervalo = intervalo
+        self.inicio = None
+        self.pico = None
+        self.parar = threading.Event()
+
+    def _amostrar(self):
+        while not self.parar.wait(self.intervalo):
+            self.pico = max(self.pico, rss_atual_mb())
+
+    def __enter__(self):
+        self.inicio = self.pico = rss_atual_mb()
+        if self.inicio is not None:
+            self.thread = threading.Thread(target=self._amostrar, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *erro):
+        if self.inicio is not None:
+            self.parar.set()
+            self.thread.join()
+            self.pico = max(self.pico, rss_atual_mb())
+
+    def resumo(self):
+        if self.inicio is None:
+            return {"pico_rss_mb": None, "aumento_rss_mb": None}
+        return {"pico_rss_mb": round(self.pico, 1), "aumento_rss_mb": round(self.pico - self.inicio, 1)}
+
+def taxa(acertos, faltas):
+    return round(acertos / (acertos + faltas), 4) if acertos + faltas else None
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def selecionar_amostra(pasta, tamanho, semente=None):
+    """Os primeiros `tamanho` arquivos em ordem de nome ou, com semente, uma amostra aleatória reprodutível."""
+    arquivos = sorted(f for f in os.listdir(pasta) if f.endswith('.json'))
+    if semente is None or tamanho >= len(arquivos):
+        return arquivos[:tamanho]
+    return sorted(random.Random(semente).sample(arquivos, tamanho))
+
+def medir(funcao, itens, workers):
+    """Aplica funcao a cada item com `workers` threads; retorna (resultados ok, latências, erros, duração)."""
+    def cronometrar(item):
+        inicio = time.perf_counter()
+        try:
+            return funcao(item), time.perf_counter() - inicio, None
+        except Exception as e:
+            return None, time.perf_counter() - inicio, e
+
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        saidas = list(executor.map(cronometrar, itens))
+    duracao = time.monotonic() - inicio
+
+    resultados, latencias, erros = [], [], 0
+    for resultado, latencia, erro in saidas:
+        latencias.append(latencia)
+        if erro:
+            erros += 1
+            print(f"   Erro: {erro}")
+        else:
+            resultados.append(resultado)
+    return resultados, latencias, erros, duracao
+
+def medir_lote(funcao_lote, itens):
+    """
+    Como medir, para etapas em lote (lista -> (índice, resultado) à medida que ficam prontos):
+    a latência de cada prontuário é o tempo até ele sair da função.
+    """
+    resultados = [None] * len(itens)
+    latencias, erros = [], 0
+    inicio = time.perf_counter()
+    try:
+        for i, resultado in funcao_lote(itens):
+            resultados[i] = resultado
+            latencias.append(time.perf_counter() - inicio)
+    except Exception as e:
+        erros = sum(1 for r in resultados if r is None)
+        print(f"   Erro: {e}")
+    duracao = time.perf_counter() - inicio
+    return [r for r in resultados if r is not None], latencias, erros, duracao
+
+def contadores(modulo):
+    """Fotografia dos contadores que o módulo da etapa expõe (cliente, caches, parada antecipada)."""
+    c = {}
+    cliente = getattr(modulo, "cliente", None)
+    if cliente:
+        c["chamadas"] = len(cliente.latencias)
+        c["tokens_entrada"] = cliente.tokens_entrada
+        c["tokens_saida"] = cliente.tokens_saida
+    cache = getattr(modulo, "cache_embeddings", None)
+    if cache:
+        c["cache_embeddings"] = (cache.acertos_memoria + cache.acertos_disco, cache.faltas)
+    for nome in ("cache_decisoes", "indice_lexico"):
+        objeto = getattr(modulo, nome, None)
+        if objeto:
+            c[nome] = (objeto.acertos, objeto.faltas)
+    contagem = getattr(modulo, "contagem_tokens", None)
+    if contagem:
+        c["tokens_gerados"] = contagem.gerados
+    for nome in ("auditorias_puladas", "escolhas_evitadas"):
+        if hasattr(modulo, nome):
+            c[nome] = getattr(modulo, nome)
+    return c
+
+def resumir_etapa(nome, backend, n_entrada, resultados, latencias, erros, duracao, workers, memoria, antes=None, depois=None, modulo=None):
+    r = {
+        "backend": backend,
+        "workers": workers,
+        "prontuarios": n_entrada,
+        "erros": erros,
+        "duracao_s": round(duracao, 3),
+        "prontuarios_por_s": round(len(resultados) / duracao, 3) if duracao else None,
+        "latencia_prontuario_s": percentis(latencias),
+        "latencia_chamada_s": None,
+        "tokens_entrada": None,
+        "tokens_saida": None,
+        "taxas_acerto": {},
+        # Pico durante a etapa e quanto ele passou da memória do início dela
+        **memoria.resumo(),
+    }
+    if antes is not None:
+        if "chamadas" in depois:
+            r["latencia_chamada_s"] = percentis(modulo.cliente.latencias[antes["chamadas"]:depois["chamadas"]])
+            r["chamadas"] = depois["chamadas"] - antes["chamadas"]
+            r["tokens_entrada"] = depois["tokens_entrada"] - antes["tokens_entrada"]
+            r["tokens_saida"] = depois["tokens_saida"] - antes["tokens_saida"]
+        if "tokens_gerados" in depois:
+            r["tokens_saida"] = depois["tokens_gerados"] - antes["tokens_gerados"]
+        for nome in ("cache_embeddings", "cache_decisoes", "indice_lexico"):
+            if nome in depois:
+                # O índice léxico é carregado na primeira consulta, já durante a etapa
+                acertos, faltas = antes.get(nome, (0, 0))
+                r["taxas_acerto"][nome] = taxa(depois[nome][0] - acertos, depois[nome][1] - faltas)
+        for nome in ("auditorias_puladas", "escolhas_evitadas"):
+            if nome in depois:
+                r[nome] = depois[nome] - antes[nome]
+    return r
+
+def medir_ingestao(nomes, workers):
+    """XML -> (texto, entidades) do semclinbr/processar_prontuarios.py para os prontuários da amostra."""
+    from semclinbr.processar_prontuarios import carregar_traducoes, extrair_prontuario
+    traducoes = carregar_traducoes(ARQUIVO_TRADUCAO)
+    caminhos = [os.path.join(PASTA_XML, os.path.splitext(n)[0] + ".xml") for n in nomes]
+    caminhos = [c for c in caminhos if os.path.exists(c)]
+    with MonitorRSS() as memoria:
+        resultados, latencias, erros, duracao = medir(lambda c: extrair_prontuario(c, traducoes), caminhos, workers)
+    return resumir_etapa("ingestao", None, len(caminhos), resultados, latencias, erros, duracao, workers, memoria)
+
+def medir_analise(lista_dados):
+    """Dashboard de coocorrência (analise/relacao_cids/analise_cid.py) sobre os prontuários auditados."""
+    from analise.relacao_cids.analise_cid import gerar_dashboard_bi_final
+    with tempfile.TemporaryDirectory() as pasta:
+        for i, dados in enumerate(lista_dados):
+            with open(os.path.join(pasta, f"{i}.json"), 'w', encoding='utf-8') as f:
+                json.dump(dados, f, ensure_ascii=False)
+        saida = os.path.join(pasta, "dashboard.html")
+        with MonitorRSS() as memoria:
+            resultados, latencias, erros, duracao = medir(
+                lambda _: gerar_dashboard_bi_final(pasta, DICIONARIO_CID, saida), [None], 1)
+    # Uma chamada para a pasta inteira: a vazão é a dos prontuários analisados
+    return resumir_etapa("analise", None, len(lista_dados), lista_dados if not erros else [],
+                         latencias, erros, duracao, 1, memoria)
+
+def executar(backends, amostra=AMOSTRA_PADRAO, semente=None, workers=OLLAMA_MAX_EM_VOO, ate="analise",
+             usar_cache=True, saida=None, rotulo=None):
+    nomes = selecionar_amostra(PASTA_PRONTUARIOS, amostra, semente)
+    etapas_medidas = ORDEM[:ORDEM.index(ate) + 1]
+    print(f"Benchmark: {len(nomes)} prontuários de {PASTA_PRONTUARIOS} | etapas: {', '.join(etapas_medidas)}\n")
+
+    resultado = {
+        "meta": {
+            "rotulo": rotulo,
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": commit_atual(),
+            "backends": backends,
+            "amostra": len(nomes),
+            "semente": semente,
+            "workers": workers,
+            "cache_embeddings": usar_cache,
+            "python": sys.version.split()[0],
+            "cpus": os.cpu_count(),
+        },
+        "etapas": {},
+    }
+
+    if "ingestao" in etapas_medidas:
+        resultado["etapas"]["ingestao"] = medir_ingestao(nomes, workers)
+
+    lista_dados = []
+    for nome_arquivo in nomes:
+        with open(os.path.join(PASTA_PRONTUARIOS, nome_arquivo), 'r', encoding='utf-8') as f:
+            lista_dados.append(json.load(f))
+
+    for etapa in ETAPAS:
+        if etapa not in etapas_medidas:
+            break
+        modulo = carregar_etapa(backends[etapa], etapa)
+        if etapa == "busca_embedding" and usar_cache:
+            modulo.cache_embeddings = modulo.CacheEmbeddings()
+        # Mesma regra do pipeline: o MedGemma local atende uma thread por vez, em lotes se a etapa os tiver
+        local = getattr(modulo, "SERVIDOR_MODELO", None) == ""
+        medgemma_local = backends[etapa] == "medgemma" and local
+        n_workers = 1 if medgemma_local else workers
+        funcao_lote = getattr(modulo, FUNCOES_LOTE.get(etapa, ""), None) if medgemma_local else None
+
+        antes = contadores(modulo)
+        n_entrada = len(lista_dados)
+        with MonitorRSS() as memoria:
+            if funcao_lote:
+                lista_dados, latencias, erros, duracao = medir_lote(funcao_lote, lista_dados)
+            else:
+                lista_dados, latencias, erros, duracao = medir(getattr(modulo, FUNCOES_ETAPA[etapa]), lista_dados, n_workers)
+        resultado["etapas"][etapa] = resumir_etapa(etapa, backends[etapa], n_entrada, lista_dados, latencias, erros,
+                                                   duracao, n_workers, memoria, antes, contadores(modulo), modulo)
+        if funcao_lote:
+            resultado["etapas"][etapa]["tamanho_lote"] = modulo.TAMANHO_LOTE_MAX
+        if getattr(modulo, "cache_embeddings", None):
+            modulo.cache_embeddings.fechar()
+            modulo.cache_embeddings = None
+
+    if "analise" in etapas_medidas:
+        resultado["etapas"]["analise"] = medir_analise(lista_dados)
+
+    for etapa, r in resultado["etapas"].items():
+        chamada = r["latencia_chamada_s"]
+        print(f"[{etapa}] {r['prontuarios_por_s']} prontuários/s | p50/p95/p99 por prontuário "
+              f"{r['latencia_prontuario_s']['p50'] if r['latencia_prontuario_s'] else '-'}/"
+              f"{r['latencia_prontuario_s']['p95'] if r['latencia_prontuario_s'] else '-'}/"
+              f"{r['latencia_prontuario_s']['p99'] if r['latencia_prontuario_s'] else '-'}s"
+              + (f" | por chamada {chamada['p50']}/{chamada['p95']}/{chamada['p99']}s" if chamada else "")
+              + (f" | tokens {r['tokens_entrada']} -> {r['tokens_saida']}" if r["tokens_saida"] is not None else "")
+              + "".join(f" | {k} {v}" for k, v in r["taxas_acerto"].items())
+              + f" | RSS pico {r['pico_rss_mb']} MB (+{r['aumento_rss_mb']} MB)")
+    # O pico do processo inteiro fica só no cabeçalho: ele inclui o que as etapas anteriores alocaram
+    resultado["meta"]["pico_rss_processo_mb"] = pico_rss_mb()
+
+    saida = saida or os.path.join(PASTA_RESULTADOS, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    pasta = os.path.dirname(saida)
+    if pasta and not os.path.exists(pasta): os.makedirs(pasta)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados salvos em {saida}")
+    return resultado
+
+def comparar(base, novo, tolerancia=TOLERANCIA, tolerancia_acerto=TOLERANCIA_ACERTO):
+    """Compara duas execuções etapa por etapa; retorna a lista de regressões (textos)."""
+    regressoes = []
+
+    def verificar(etapa, metrica, antigo, atual, maior_melhor, diferenca_minima=0):
+        if antigo is None or atual is None:
+            return
+        if antigo == 0:
+            # Ex: etapa que não alocava memória; qualquer aumento conta (filtrado por diferenca_minima)
+            variacao = 0.0 if atual == 0 else float("inf") if atual > 0 else float("-inf")
+        else:
+            variacao = (atual - antigo) / antigo
+        piorou = variacao < -tolerancia if maior_melhor else variacao > tolerancia
+        piorou = piorou and abs(atual - antigo) >= diferenca_minima
+        marca = "REGRESSÃO" if piorou else ""
+        print(f"  {etapa:22} {metrica:28} {antigo:>10} -> {atual:<10} {variacao * 100:+6.1f}% {marca}")
+        if piorou:
+            regressoes.append(f"{etapa}: {metrica} {antigo} -> {atual} ({variacao * 100:+.1f}%)")
+
+    print(f"Base: {base['meta'].get('rotulo') or base['meta']['data']} ({base['meta'].get('commit')}) | "
+          f"Novo: {novo['meta'].get('rotulo') or novo['meta']['data']} ({novo['meta'].get('commit')})")
+    if base["meta"].get("amostra") != novo["meta"].get("amostra") or base["meta"].get("backends") != novo["meta"].get("backends"):
+        print("  [!] Amostra ou backends diferentes entre as execuções; a comparação pode não ser justa.")
+
+    for etapa in ORDEM:
+        if etapa not in base["etapas"] or etapa not in novo["etapas"]:
+            continue
+        b, n = base["etapas"][etapa], novo["etapas"][etapa]
+        verificar(etapa, "prontuarios_por_s", b["prontuarios_por_s"], n["prontuarios_por_s"], True)
+        for chave in ("latencia_prontuario_s", "latencia_chamada_s"):
+            if b.get(chave) and n.get(chave):
+                verificar(etapa, f"{chave}.p95", b[chave]["p95"], n[chave]["p95"], False, DIFERENCA_MINIMA_LATENCIA)
+        verificar(etapa, "aumento_rss_mb", b.get("aumento_rss_mb"), n.get("aumento_rss_mb"), False, DIFERENCA_MINIMA_MEMORIA)
+        if n["erros"] > b["erros"]:
+            regressoes.append(f"{etapa}: erros {b['erros']} -> {n['erros']}")
+            print(f"  {etapa:22} {'erros':28} {b['erros']:>10} -> {n['erros']:<10} REGRESSÃO")
+        for cache, antiga in b["taxas_acerto"].items():
+            atual = n["taxas_acerto"].get(cache)
+            if antiga is not None and atual is not None and antiga - atual > tolerancia_acerto:
+                regressoes.append(f"{etapa}: acerto do {cache} {antiga} -> {atual}")
+                print(f"  {etapa:22} {'acerto ' + cache:28} {antiga:>10} -> {atual:<10} REGRESSÃO")
+    return regressoes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta das etapas sobre o SemClinBR.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_exec = sub.add_parser("executar", help="Roda as etapas sobre uma amostra e grava os resultados em JSON.")
+    p_exec.add_argument("--backend", choices=BACKENDS, default="llama3", help="Backend padrão de todas as etapas.")
+    for etapa in ETAPAS:
+        p_exec.add_argument(f"--{etapa.split('_')[0]}", choices=BACKENDS, help=f"Backend da etapa {etapa}.")
+    p_exec.add_argument("--amostra", type=int, default=AMOSTRA_PADRAO, help="Nº de prontuários.")
+    p_exec.add_argument("--semente", type=int, help="Amostra aleatória reprodutível (padrão: os primeiros por nome).")
+    p_exec.add_argument("--workers", type=int, default=OLLAMA_MAX_EM_VOO, help="Threads por etapa.")
+    p_exec.add_argument("--ate", choices=ORDEM, default="analise", help="Última etapa medida.")
+    p_exec.add_argument("--sem-cache", action="store_true", help="Não usa o cache de embeddings de consulta.")
+    p_exec.add_argument("--rotulo", help="Nome da execução (aparece na comparação).")
+    p_exec.add_argument("--saida", help=f"Arquivo de resultados (padrão: {PASTA_RESULTADOS}/<data>.json).")
+
+    p_comp = sub.add_parser("comparar", help="Aponta regressões entre duas execuções (código de saída 1 se houver).")
+    p_comp.add_argument("base")
+    p_comp.add_argument("novo")
+    p_comp.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Piora relativa aceita (0.10 = 10%%).")
+    p_comp.add_argument("--tolerancia-acerto", type=float, default=TOLERANCIA_ACERTO, help="Queda absoluta aceita nas taxas de acerto.")
+    args = parser.parse_args()
+
+    if args.comando == "executar":
+        backends = {etapa: getattr(args, etapa.split('_')[0]) or args.backend for etapa in ETAPAS}
+        executar(backends, args.amostra, args.semente, args.workers, args.ate, not args.sem_cache, args.saida, args.rotulo)
+    else:
+        with open(args.base, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        with open(args.novo, 'r', encoding='utf-8') as f:
+            novo = json.load(f)
+        regressoes = comparar(base, novo, args.tolerancia, args.tolerancia_acerto)
+        print(f"\n{len(regressoes)} regressão(ões)." if regressoes else "\nNenhuma regressão.")
+        sys.exit(1 if regressoes else 0)
@@ -1,5 +1,12 @@
+import argparse
 import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
 
 # Configurações conforme seu ambiente Docker
 PORTA = "8080"
@@ -12,37 +19,179 @@ HEADERS = {
     'API-Version': 'v2'
 }
 
-def obter_descricao_docker(codigo):
+# Modo concorrente: número de requisições simultâneas e teto de requisições por segundo (None = sem teto)
+MAX_WORKERS = 16
+TAXA_MAXIMA = None
+
+# Cache em disco das respostas da API (serve também de checkpoint para retomar execuções)
+ARQUIVO_CACHE = 'cache_api_cid.sqlite'
+CHECKPOINT_A_CADA = 200
+
+class CacheAPI:
+    """
+    Cache SQLite das consultas à API, por versão da CID.
+    Guarda separadamente a resolução codigo -> stemId e a definição de cada entidade.
+    Falhas de rede ficam marcadas como 'erro' e são tentadas de novo na próxima execução.
+    """
+    def __init__(self, caminho=ARQUIVO_CACHE, versao=VERSAO):
+        self.versao = versao
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS lookup (
+            versao TEXT, codigo TEXT, status TEXT, entity_id TEXT,
+            PRIMARY KEY (versao, codigo))""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS definicao (
+            versao TEXT, entity_id TEXT, descricao TEXT,
+            PRIMARY KEY (versao, entity_id))""")
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.escritas = 0
+
+    def obter_lookup(self, codigo):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT status, entity_id FROM lookup WHERE versao = ? AND codigo = ?",
+                (self.versao, codigo)).fetchone()
+
+    def salvar_lookup(self, codigo, status, entity_id=None):
+        self._escrever("INSERT OR REPLACE INTO lookup VALUES (?, ?, ?, ?)",
+                       (self.versao, codigo, status, entity_id))
+
+    def obter_definicao(self, entity_id):
+        with self.lock:
+            linha = self.conn.execute(
+                "SELECT descricao FROM definicao WHERE versao = ? AND entity_id = ?",
+                (self.versao, entity_id)).fetchone()
+        return linha[0] if linha else None
+
+    def salvar_definicao(self, entity_id, descricao):
+        self._escrever("INSERT OR REPLACE INTO definicao VALUES (?, ?, ?)",
+                       (self.versao, entity_id, descricao))
+
+    def _escrever(self, sql, parametros):
+        with self.lock:
+            self.conn.execute(sql, parametros)
+            self.escritas += 1
+            if self.escritas % CHECKPOINT_A_CADA == 0:
+                self.conn.commit()
+
+    def fechar(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+class LimitadorTaxa:
+    """
+    Limita o número de chamadas por segundo compartilhado entre as threads.
+    Cada chamada a aguardar() reserva o próximo horário livre.
+    """
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo else 0.0
+        self.proximo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def aguardar(self):
+        if not self.intervalo:
+            return
+        with self.lock:
+            agora = time.monotonic()
+            horario = max(self.proximo, agora)
+            self.proximo = horario + self.intervalo
+        espera = horario - agora
+        if espera > 0:
+            time.sleep(espera)
+
+def criar_sessao(tamanho_pool=MAX_WORKERS):
+    """Cria uma sessão HTTP keep-alive com pool do tamanho da concorrência."""
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=tamanho_pool)
+    sessao.mount("http://", adaptador)
+    sessao.mount("https://", adaptador)
+    sessao.headers.update(HEADERS)
+    return sessao
+
+def obter_descricao_docker(codigo, sessao=None, limitador=None, cache=None):
     """
     Busca a descrição no Docker local usando a lógica de 
     forçar o localhost para evitar erro 401.
+    Retorna "" quando o código não tem definição e None quando a consulta falhou.
     """
+    http = sessao or requests
+    entity_id = None
+
+    if cache:
+        lookup = cache.obter_lookup(codigo)
+        if lookup and lookup[0] == 'ausente':
+            return ""
+        if lookup and lookup[0] == 'ok':
+            entity_id = lookup[1]
+            descricao = cache.obter_definicao(entity_id)
+            if descricao is not None:
+                return descricao
+
     try:
         # 1. Faz o lookup do identificador para pegar o ID interno
-        lookup_url = f"{BASE_URL}/codeinfo/{codigo}"
-        res_lookup = requests.get(lookup_url, headers=HEADERS, timeout=5)
-        
-        if res_lookup.status_code == 200:
+        if entity_id is None:
+            lookup_url = f"{BASE_URL}/codeinfo/{codigo}"
+            if limitador: limitador.aguardar()
+            res_lookup = http.get(lookup_url, headers=HEADERS, timeout=5)
+
+            if res_lookup.status_code == 404:
+                if cache: cache.salvar_lookup(codigo, 'ausente')
+                return ""
+            if res_lookup.status_code != 200:
+                if cache: cache.salvar_lookup(codigo, 'erro')
+                return None
+
             data = res_lookup.json()
             # Extrai o ID numérico final da URI (ex: 257068234)
             entity_id = data.get('stemId').split('/')[-1]
+            if cache: cache.salvar_lookup(codigo, 'ok', entity_id)
             
-            # 2. Busca detalhes forçando o localhost
-            local_uri = f"{BASE_URL}/{entity_id}"
-            res_detalhes = requests.get(local_uri, headers=HEADERS, timeout=5)
-            
-            if res_detalhes.status_code == 200:
-                detalhes = res_detalhes.json()
-                # Pega a definição. Se não existir, retorna string vazia para tratar depois.
-                return detalhes.get('definition', {}).get('@value', "")
+        # 2. Busca detalhes forçando o localhost
+        local_uri = f"{BASE_URL}/{entity_id}"
+        if limitador: limitador.aguardar()
+        res_detalhes = http.get(local_uri, headers=HEADERS, timeout=5)
+        
+        if res_detalhes.status_code == 200:
+            detalhes = res_detalhes.json()
+            # Pega a definição. Se não existir, retorna string vazia para tratar depois.
+            descricao = detalhes.get('definition', {}).get('@value', "")
+            if cache: cache.salvar_definicao(entity_id, descricao)
+            return descricao
         
-        return ""
+        return None
     except Exception:
-        return ""
+        if cache and entity_id is None: cache.salvar_lookup(codigo, 'erro')
+        return None
+
+def enriquecer_concorrente(dados, max_workers=MAX_WORKERS, taxa_maxima=TAXA_MAXIMA, cache=None):
+    """
+    Enriquece os itens com um pool de threads e sessão compartilhada.
+    Cada thread encadeia codeinfo -> detalhes do seu código, então enquanto uma
+    aguarda o lookup outras já estão buscando definições. A ordem de saída é a de entrada.
+    """
+    total = len(dados)
+    sessao = criar_sessao(max_workers)
+    limitador = LimitadorTaxa(taxa_maxima)
+    descricoes = [None] * total
+    inicio = time.monotonic()
+
+    def tarefa(i):
+        descricoes[i] = obter_descricao_docker(dados[i]['identificador'], sessao, limitador, cache)
 
-def processar():
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for feitos, _ in enumerate(executor.map(tarefa, range(total)), 1):
+            if feitos % 10 == 0 or feitos == total:
+                taxa = feitos / max(time.monotonic() - inicio, 1e-9)
+                print(f"Progresso: [{feitos}/{total}] - {taxa:.1f} itens/s", end='\r')
+
+    sessao.close()
+    return descricoes
+
+def processar(concorrente=False, max_workers=MAX_WORKERS, taxa_maxima=TAXA_MAXIMA, usar_cache=True):
     arquivo_entrada = 'ICD-11-pt-clean.json'
     arquivo_saida = 'ICD-11-com-descricoes.json'
+    arquivo_falhas = 'ICD-11-falhas.txt'
 
     print(f"Lendo {arquivo_entrada}...")
     with open(arquivo_entrada, 'r', encoding='utf-8') as f:
@@ -50,15 +199,39 @@ def processar():
 
     total = len(dados)
     resultado_final = []
+    falhas = []
+    inicio = time.monotonic()
+
+    # O cache guarda cada resposta assim que chega: uma execução interrompida
+    # retoma de onde parou e só os códigos que falharam voltam para a API
+    cache = CacheAPI() if usar_cache else None
 
     print(f"Iniciando enriquecimento de {total} itens. Aguarde...")
 
+    try:
+        if concorrente:
+            print(f"Modo concorrente: {max_workers} workers, teto de {taxa_maxima or 'sem limite'} req/s")
+            descricoes = enriquecer_concorrente(dados, max_workers, taxa_maxima, cache)
+        else:
+            descricoes = []
+            for i, item in enumerate(dados):
+                descricoes.append(obter_descricao_docker(item['identificador'], cache=cache))
+
+                # Feedback de progresso no terminal
+                if (i + 1) % 10 == 0 or (i + 1) == total:
+                    print(f"Progresso: [{i+1}/{total}] - Último: {item['identificador']}", end='\r')
+    finally:
+        if cache: cache.fechar()
+
     for i, item in enumerate(dados):
         codigo = item['identificador']
         valor_original = item['valor']
         
-        # Busca a descrição no Docker
-        descricao = obter_descricao_docker(codigo)
+        # Falhas saem vazias no JSON, mas ficam registradas à parte para nova tentativa
+        descricao = descricoes[i]
+        if descricao is None:
+            falhas.append(codigo)
+            descricao = ""
         
         # Cria o novo objeto mantendo os dados originais e somando a descrição
         novo_item = {
@@ -68,16 +241,26 @@ def processar():
         }
         
         resultado_final.append(novo_item)
-        
-        # Feedback de progresso no terminal
-        if (i + 1) % 10 == 0 or (i + 1) == total:
-            print(f"Progresso: [{i+1}/{total}] - Último: {codigo}", end='\r')
 
     # Salva o novo JSON
     with open(arquivo_saida, 'w', encoding='utf-8') as f:
         json.dump(resultado_final, f, ensure_ascii=False, indent=2)
 
+    with open(arquivo_falhas, 'w', encoding='utf-8') as f:
+        f.writelines(codigo + "\n" for codigo in falhas)
+
+    duracao = time.monotonic() - inicio
     print(f"\n\nSucesso! Arquivo '{arquivo_saida}' gerado com as descrições.")
+    if falhas:
+        print(f"Atenção: {len(falhas)} códigos falharam (lista em '{arquivo_falhas}'). Rode novamente para tentar apenas esses.")
+    print(f"{total} itens em {duracao:.1f}s ({total / max(duracao, 1e-9):.1f} itens/s)")
 
 if __name__ == "__main__":
-    processar()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Enriquece o CID-11 com as descrições da API local.")
+    parser.add_argument("--concorrente", action="store_true", help="Usa pool de threads com sessão keep-alive.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Requisições simultâneas no modo concorrente.")
+    parser.add_argument("--taxa", type=float, default=TAXA_MAXIMA, help="Teto de requisições por segundo.")
+    parser.add_argument("--sem-cache", action="store_true", help="Ignora o cache em disco e consulta a API para todos os códigos.")
+    args = parser.parse_args()
+
+    processar(args.concorrente, args.workers, args.taxa, not args.sem_cache)
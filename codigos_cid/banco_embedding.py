@@ -0,0 +1,131 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import requests
+
+# --- CONFIGURAÇÕES ---
+# Executar a partir da raiz do projeto (mesmos caminhos usados pelo busca_embedding.py)
+OLLAMA_API_EMBED_LOTE = "http://localhost:11434/api/embed"
+EMBED_MODEL = "mxbai-embed-large"
+PASTA_CATALOGO = "codigos_cid/codigos_cid_jsons"
+PASTA_BANCOS = "embedding_cid"
+TAMANHO_LOTE = 256
+
+# Cada capítulo gera dois arquivos em PASTA_BANCOS:
+#   {capitulo}.npy         matriz float32 (itens x dimensão), linhas normalizadas (norma L2 = 1)
+#   {capitulo}.meta.jsonl  uma linha por item, na mesma ordem: {"id", "text", "hash"}
+# O hash cobre modelo + texto, então só itens novos/alterados voltam a ser codificados.
+
+def montar_texto(item):
+    """Texto indexado para cada código (mesmo formato dos bancos já existentes)."""
+    return f"Representação de doença CID-11: {item.get('valor', '')}. Definição: {item.get('descricao', '')}"
+
+def calcular_hash(texto, modelo=EMBED_MODEL):
+    return hashlib.sha256(f"{modelo}\0{texto}".encode("utf-8")).hexdigest()
+
+def codificar_lote(sessao, textos, modelo=EMBED_MODEL):
+    """Gera os embeddings de uma lista de textos em uma única chamada ao Ollama."""
+    response = sessao.post(OLLAMA_API_EMBED_LOTE, json={"model": modelo, "input": textos}, timeout=600)
+    response.raise_for_status()
+    return np.asarray(response.json()["embeddings"], dtype=np.float32)
+
+def normalizar(matriz):
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+def carregar_banco_existente(capitulo):
+    """Retorna (metadados, {hash: vetor}) do banco atual do capítulo (vazios se ainda não existe)."""
+    caminho_matriz = os.path.join(PASTA_BANCOS, f"{capitulo}.npy")
+    caminho_meta = os.path.join(PASTA_BANCOS, f"{capitulo}.meta.jsonl")
+    if not (os.path.exists(caminho_matriz) and os.path.exists(caminho_meta)):
+        return [], {}
+
+    matriz = np.load(caminho_matriz)
+    with open(caminho_meta, 'r', encoding='utf-8') as f:
+        metadados = [json.loads(linha) for linha in f if linha.strip()]
+
+    if len(metadados) != len(matriz):
+        print(f"   Aviso: banco {capitulo} inconsistente, será reconstruído do zero.")
+        return [], {}
+
+    # Bancos convertidos do formato .jsonl antigo não têm hash e são recodificados
+    return metadados, {meta["hash"]: matriz[i] for i, meta in enumerate(metadados) if meta.get("hash")}
+
+def salvar_banco(capitulo, matriz, metadados):
+    """Grava matriz e metadados em arquivos temporários e troca no final (sem banco pela metade)."""
+    caminho_matriz = os.path.join(PASTA_BANCOS, f"{capitulo}.npy")
+    caminho_meta = os.path.join(PASTA_BANCOS, f"{capitulo}.meta.jsonl")
+
+    with open(caminho_matriz + ".tmp", 'wb') as f:
+        np.save(f, np.ascontiguousarray(matriz, dtype=np.float32))
+    with open(caminho_meta + ".tmp", 'w', encoding='utf-8') as f:
+        for meta in metadados:
+            f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+
+    os.replace(caminho_matriz + ".tmp", caminho_matriz)
+    os.replace(caminho_meta + ".tmp", caminho_meta)
+
+def construir_capitulo(sessao, nome_arquivo, modelo=EMBED_MODEL, tamanho_lote=TAMANHO_LOTE):
+    """Atualiza o banco de um capítulo e retorna quantos itens precisaram ser codificados."""
+    capitulo = nome_arquivo.split('_')[0]
+    with open(os.path.join(PASTA_CATALOGO, nome_arquivo), 'r', encoding='utf-8') as f:
+        itens = json.load(f)
+
+    metadados = []
+    for item in itens:
+        texto = montar_texto(item)
+        metadados.append({"id": item["identificador"], "text": texto, "hash": calcular_hash(texto, modelo)})
+
+    metadados_antigos, vetores_por_hash = carregar_banco_existente(capitulo)
+    if [m["hash"] for m in metadados] == [m.get("hash") for m in metadados_antigos]:
+        print(f"   {capitulo}: {len(itens)} itens, nada mudou.")
+        return 0
+
+    pendentes = [m for m in metadados if m["hash"] not in vetores_por_hash]
+    for inicio in range(0, len(pendentes), tamanho_lote):
+        lote = pendentes[inicio:inicio + tamanho_lote]
+        vetores = normalizar(codificar_lote(sessao, [m["text"] for m in lote], modelo))
+        for meta, vetor in zip(lote, vetores):
+            vetores_por_hash[meta["hash"]] = vetor
+
+    if metadados:
+        matriz = np.stack([vetores_por_hash[m["hash"]] for m in metadados])
+    else:
+        matriz = np.zeros((0, 0), dtype=np.float32)
+    salvar_banco(capitulo, matriz, metadados)
+
+    print(f"   {capitulo}: {len(itens)} itens, {len(pendentes)} codificados, {len(itens) - len(pendentes)} reaproveitados.")
+    return len(pendentes)
+
+def construir_bancos(capitulos=None, modelo=EMBED_MODEL, tamanho_lote=TAMANHO_LOTE):
+    if not os.path.exists(PASTA_BANCOS): os.makedirs(PASTA_BANCOS)
+
+    arquivos = sorted(f for f in os.listdir(PASTA_CATALOGO) if f.endswith('.json'))
+    if capitulos:
+        arquivos = [f for f in arquivos if f.split('_')[0] in capitulos]
+
+    print(f"Construindo bancos de {len(arquivos)} capítulos com {modelo} (lotes de {tamanho_lote})...")
+    sessao = requests.Session()
+    inicio = time.monotonic()
+    total_codificados = 0
+
+    for nome_arquivo in arquivos:
+        total_codificados += construir_capitulo(sessao, nome_arquivo, modelo, tamanho_lote)
+
+    duracao = time.monotonic() - inicio
+    print(f"\nConcluído: {total_codificados} itens codificados em {duracao:.1f}s "
+          f"({total_codificados / max(duracao, 1e-9):.1f} itens/s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Constrói os bancos de embeddings por capítulo da CID-11.")
+    parser.add_argument("--capitulos", nargs="*", help="Capítulos a atualizar (ex: 05 06 V). Padrão: todos.")
+    parser.add_argument("--modelo", default=EMBED_MODEL, help="Modelo de embedding do Ollama.")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Textos por chamada ao /api/embed.")
+    args = parser.parse_args()
+
+    construir_bancos(args.capitulos, args.modelo, args.lote)
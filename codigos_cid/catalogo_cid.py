@@ -0,0 +1,135 @@
+import mmap
+import struct
+
+# Catálogo binário compacto dos códigos CID-11, pensado para ser aberto com mmap.
+#
+# Layout (little-endian):
+#   cabeçalho   MAGICO, versão, nº de linhas, nº de capítulos
+#   capítulos   (offset, tamanho) da chave de cada capítulo no bloco de textos
+#   linhas      capítulo + (offset, tamanho) de código, título e descrição
+#   índice      nº das linhas ordenadas pelo código (busca binária código -> linha)
+#   textos      todas as strings em UTF-8, concatenadas
+MAGICO = b"CIDC"
+VERSAO_FORMATO = 1
+
+CABECALHO = struct.Struct("<4sIII")
+CAPITULO = struct.Struct("<II")
+LINHA = struct.Struct("<BxxxIIIIII")
+INDICE = struct.Struct("<I")
+
+def escrever_catalogo(caminho, capitulos):
+    """
+    Grava o catálogo a partir de uma lista de (chave_capitulo, itens),
+    onde itens são os dicionários do JSON (identificador, valor, descricao).
+    """
+    textos = bytearray()
+
+    def guardar(texto):
+        dados = (texto or "").encode("utf-8")
+        offset = len(textos)
+        textos.extend(dados)
+        return offset, len(dados)
+
+    tabela_capitulos = []
+    linhas = []
+    codigos = []
+    for id_capitulo, (chave, itens) in enumerate(capitulos):
+        tabela_capitulos.append(guardar(chave))
+        for item in itens:
+            codigo = guardar(item.get("identificador", ""))
+            titulo = guardar(item.get("valor", ""))
+            descricao = guardar(item.get("descricao", ""))
+            linhas.append((id_capitulo, *codigo, *titulo, *descricao))
+            codigos.append(item.get("identificador", "").encode("utf-8"))
+
+    indice = sorted(range(len(linhas)), key=lambda i: codigos[i])
+
+    with open(caminho, "wb") as f:
+        f.write(CABECALHO.pack(MAGICO, VERSAO_FORMATO, len(linhas), len(tabela_capitulos)))
+        for entrada in tabela_capitulos:
+            f.write(CAPITULO.pack(*entrada))
+        for linha in linhas:
+            f.write(LINHA.pack(*linha))
+        for i in indice:
+            f.write(INDICE.pack(i))
+        f.write(textos)
+
+class CatalogoCID:
+    """
+    Leitura do catálogo via mmap: nada é carregado até ser acessado e
+    vários processos compartilham as mesmas páginas do cache do sistema.
+    """
+    def __init__(self, caminho):
+        self.arquivo = open(caminho, "rb")
+        self.mm = mmap.mmap(self.arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magico, versao, self.total, total_capitulos = CABECALHO.unpack_from(self.mm, 0)
+        if magico != MAGICO or versao != VERSAO_FORMATO:
+            raise ValueError(f"Arquivo {caminho} não é um catálogo CID válido (versão {VERSAO_FORMATO}).")
+
+        self.inicio_capitulos = CABECALHO.size
+        self.inicio_linhas = self.inicio_capitulos + total_capitulos * CAPITULO.size
+        self.inicio_indice = self.inicio_linhas + self.total * LINHA.size
+        self.inicio_textos = self.inicio_indice + self.total * INDICE.size
+
+        self.capitulos = [
+            self._texto(*CAPITULO.unpack_from(self.mm, self.inicio_capitulos + i * CAPITULO.size))
+            for i in range(total_capitulos)
+        ]
+
+    def __len__(self):
+        return self.total
+
+    def __contains__(self, codigo):
+        return self.buscar_linha(codigo) is not None
+
+    def _texto(self, offset, tamanho):
+        inicio = self.inicio_textos + offset
+        return self.mm[inicio:inicio + tamanho].decode("utf-8")
+
+    def _bytes(self, offset, tamanho):
+        inicio = self.inicio_textos + offset
+        return self.mm[inicio:inicio + tamanho]
+
+    def _campos(self, linha):
+        return LINHA.unpack_from(self.mm, self.inicio_linhas + linha * LINHA.size)
+
+    def codigo(self, linha):
+        return self._texto(*self._campos(linha)[1:3])
+
+    def capitulo(self, linha):
+        return self.capitulos[self._campos(linha)[0]]
+
+    def linha(self, linha):
+        """Retorna a linha no mesmo formato dos JSONs por capítulo, mais a chave do capítulo."""
+        cap, cod_off, cod_len, tit_off, tit_len, desc_off, desc_len = self._campos(linha)
+        return {
+            "identificador": self._texto(cod_off, cod_len),
+            "valor": self._texto(tit_off, tit_len),
+            "descricao": self._texto(desc_off, desc_len),
+            "capitulo": self.capitulos[cap],
+        }
+
+    def buscar_linha(self, codigo):
+        """Busca binária no índice ordenado; retorna o nº da linha ou None."""
+        alvo = codigo.encode("utf-8")
+        baixo, alto = 0, self.total
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            linha = INDICE.unpack_from(self.mm, self.inicio_indice + meio * INDICE.size)[0]
+            atual = self._bytes(*self._campos(linha)[1:3])
+            if atual < alvo:
+                baixo = meio + 1
+            elif atual > alvo:
+                alto = meio
+            else:
+                return linha
+        return None
+
+    def buscar(self, codigo):
+        linha = self.buscar_linha(codigo)
+        return self.linha(linha) if linha is not None else None
+
+    def fechar(self):
+        self.mm.close()
+        self.arquivo.close()
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+# --- CONFIGURAÇÕES ---
+# Executar a partir da raiz do projeto (lê os bancos gerados pelo banco_embedding.py)
+PASTA_BANCOS = "embedding_cid"
+NOME_INDICE = "indice_ivf"
+N_LISTAS = 256
+N_ITERACOES = 15
+AMOSTRA_TREINO = 20000
+NPROBE = 8
+
+# Índice IVF-flat sobre todo o catálogo (todos os capítulos juntos):
+#   - k-means esférico separa os vetores em N_LISTAS grupos (centróides normalizados);
+#   - os vetores são gravados reordenados por grupo, então cada lista é um bloco contíguo;
+#   - a busca compara a consulta com os centróides, abre só os NPROBE grupos mais próximos
+#     e faz a busca exata dentro deles. NPROBE maior = mais recall e mais latência.
+# Arquivos em PASTA_BANCOS:
+#   indice_ivf.vetores.npy   vetores reordenados (float32, mapeado com mmap na busca)
+#   indice_ivf.npz           centróides, offsets das listas, capítulo e linha de cada vetor
+
+def normalizar(matriz):
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+def capitulos_disponiveis():
+    return sorted(f[:-len(".meta.jsonl")] for f in os.listdir(PASTA_BANCOS) if f.endswith(".meta.jsonl"))
+
+def carregar_catalogo():
+    """Junta os bancos de todos os capítulos: (matriz, capitulo de cada linha, linha dentro do capítulo, tamanhos)."""
+    matrizes, capitulos, linhas, tamanhos = [], [], [], {}
+    for capitulo in capitulos_disponiveis():
+        matriz = np.load(os.path.join(PASTA_BANCOS, f"{capitulo}.npy"))
+        if matriz.size == 0:
+            continue
+        matrizes.append(normalizar(matriz.astype(np.float32)))
+        capitulos.extend([capitulo] * len(matriz))
+        linhas.append(np.arange(len(matriz), dtype=np.int32))
+        tamanhos[capitulo] = len(matriz)
+    return np.concatenate(matrizes), np.array(capitulos), np.concatenate(linhas), tamanhos
+
+def kmeans_esferico(vetores, n_listas, n_iteracoes=N_ITERACOES, semente=0):
+    """K-means por similaridade de cosseno, todo em produtos de matrizes."""
+    rng = np.random.default_rng(semente)
+    centroides = vetores[rng.choice(len(vetores), n_listas, replace=False)].copy()
+    for _ in range(n_iteracoes):
+        grupos = np.argmax(vetores @ centroides.T, axis=1)
+        somas = np.zeros_like(centroides)
+        np.add.at(somas, grupos, vetores)
+        vazios = np.bincount(grupos, minlength=n_listas) == 0
+        # Grupos que ficaram vazios recebem um ponto aleatório para continuar úteis
+        somas[vazios] = vetores[rng.choice(len(vetores), int(vazios.sum()), replace=False)]
+        centroides = normalizar(somas)
+    return centroides
+
+def construir_indice(n_listas=N_LISTAS, amostra_treino=AMOSTRA_TREINO):
+    inicio = time.monotonic()
+    vetores, capitulos, linhas, tamanhos = carregar_catalogo()
+    n_listas = min(n_listas, len(vetores))
+    print(f"Construindo IVF com {n_listas} listas sobre {len(vetores)} vetores de {len(tamanhos)} capítulos...")
+
+    rng = np.random.default_rng(0)
+    treino = vetores if len(vetores) <= amostra_treino else vetores[rng.choice(len(vetores), amostra_treino, replace=False)]
+    centroides = kmeans_esferico(treino, n_listas)
+
+    grupos = np.argmax(vetores @ centroides.T, axis=1)
+    ordem = np.argsort(grupos, kind="stable")
+    offsets = np.zeros(n_listas + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(grupos, minlength=n_listas))
+
+    base = os.path.join(PASTA_BANCOS, NOME_INDICE)
+    with open(base + ".vetores.npy.tmp", "wb") as f:
+        np.save(f, np.ascontiguousarray(vetores[ordem]))
+    with open(base + ".npz.tmp", "wb") as f:
+        np.savez(f, centroides=centroides, offsets=offsets, capitulos=capitulos[ordem],
+                 linhas=linhas[ordem], tamanhos=json.dumps(tamanhos))
+    os.replace(base + ".vetores.npy.tmp", base + ".vetores.npy")
+    os.replace(base + ".npz.tmp", base + ".npz")
+
+    tamanhos_listas = np.diff(offsets)
+    print(f"Índice salvo em {base}.* em {time.monotonic() - inicio:.1f}s "
+          f"(lista média {tamanhos_listas.mean():.0f}, maior {tamanhos_listas.max()}).")
+
+class IndiceIVF:
+    """Índice IVF-flat persistido; busca retorna (capítulo, linha no banco do capítulo, score)."""
+    def __init__(self, pasta=PASTA_BANCOS):
+        base = os.path.join(pasta, NOME_INDICE)
+        dados = np.load(base + ".npz")
+        self.centroides = dados["centroides"]
+        self.offsets = dados["offsets"]
+        self.capitulos = dados["capitulos"]
+        self.linhas = dados["linhas"]
+        self.tamanhos = json.loads(str(dados["tamanhos"]))
+        self.vetores = np.load(base + ".vetores.npy", mmap_mode="r")
+
+    def desatualizado(self, tamanhos_atuais):
+        """Compara o nº de itens por capítulo com os bancos atuais."""
+        return any(self.tamanhos.get(cap) != n for cap, n in tamanhos_atuais.items())
+
+    def buscar(self, consultas, top_k=5, nprobe=NPROBE):
+        """Para cada consulta (já normalizada), retorna a lista [(capitulo, linha, score)] dos Top K."""
+        consultas = np.atleast_2d(consultas).astype(np.float32)
+        nprobe = min(nprobe, len(self.centroides))
+        listas_por_consulta = np.argpartition(-(consultas @ self.centroides.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        resultados = []
+        for consulta, listas in zip(consultas, listas_por_consulta):
+            posicoes = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in listas])
+            if len(posicoes) == 0:
+                resultados.append([])
+                continue
+            scores = self.vetores[posicoes] @ consulta
+            k = min(top_k, len(posicoes))
+            melhores = np.argpartition(-scores, k - 1)[:k]
+            melhores = melhores[np.argsort(-scores[melhores], kind="stable")]
+            resultados.append([
+                (str(self.capitulos[posicoes[i]]), int(self.linhas[posicoes[i]]), float(scores[i]))
+                for i in melhores
+            ])
+        return resultados
+
+def avaliar_recall(n_consultas=500, top_k=5, valores_nprobe=(1, 2, 4, 8, 16, 32, 64), ruido=0.5):
+    """
+    Mede recall@k do IVF contra a busca exata no catálogo inteiro. As consultas são vetores
+    do próprio catálogo com ruído gaussiano, aproximando termos que não são títulos exatos.
+    """
+    vetores, capitulos, linhas, _ = carregar_catalogo()
+    indice = IndiceIVF()
+
+    rng = np.random.default_rng(1)
+    amostra = vetores[rng.choice(len(vetores), min(n_consultas, len(vetores)), replace=False)]
+    consultas = normalizar(amostra + rng.normal(0, ruido / np.sqrt(vetores.shape[1]), amostra.shape).astype(np.float32))
+
+    inicio = time.monotonic()
+    scores = consultas @ vetores.T
+    exatos = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    ms_exato = (time.monotonic() - inicio) * 1000 / len(consultas)
+    verdade = [{(capitulos[i], linhas[i]) for i in linha} for linha in exatos]
+
+    print(f"Busca exata: {ms_exato:.3f} ms/consulta sobre {len(vetores)} vetores")
+    print(f"{'nprobe':>6} | {'recall@' + str(top_k):>9} | {'ms/consulta':>11}")
+    for nprobe in valores_nprobe:
+        inicio = time.monotonic()
+        aproximados = indice.buscar(consultas, top_k, nprobe)
+        ms = (time.monotonic() - inicio) * 1000 / len(consultas)
+        acertos = sum(len(v & {(c, l) for c, l, _ in a}) for v, a in zip(verdade, aproximados))
+        print(f"{nprobe:>6} | {acertos / (len(consultas) * top_k):>9.3f} | {ms:>11.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice aproximado (IVF-flat) sobre todos os capítulos da CID-11.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_construir = sub.add_parser("construir", help="Treina e salva o índice a partir dos bancos.")
+    p_construir.add_argument("--listas", type=int, default=N_LISTAS)
+    p_avaliar = sub.add_parser("avaliar", help="Benchmark de recall@k contra a busca exata.")
+    p_avaliar.add_argument("--consultas", type=int, default=500)
+    p_avaliar.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.comando == "construir":
+        construir_indice(args.listas)
+    else:
+        avaliar_recall(args.consultas, args.k)
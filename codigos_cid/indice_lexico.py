@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+# Raiz do projeto no path (normalização de termos em comum/ e texto dos bancos em codigos_cid/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comum.cache_decisoes import normalizar_termo
+
+# --- CONFIGURAÇÕES ---
+# Executar a partir da raiz do projeto
+PASTA_CATALOGO = "codigos_cid/codigos_cid_jsons"
+ARQUIVO_INDICE = "embedding_cid/indice_lexico.json"  # junto dos bancos e do índice IVF
+
+ORIGEM_LEXICO = "indice_lexico"
+
+# Abreviações comuns nos prontuários, já normalizadas, expandidas antes da busca no índice
+ABREVIACOES = {
+    "dm": "diabetes mellitus",
+    "dm1": "diabetes mellitus tipo 1",
+    "dm2": "diabetes mellitus tipo 2",
+    "has": "hipertensao essencial",
+    "dpoc": "doenca pulmonar obstrutiva cronica",
+    "iam": "infarto agudo do miocardio",
+    "icc": "insuficiencia cardiaca congestiva",
+    "itu": "infeccao do trato urinario",
+    "tb": "tuberculose",
+}
+
+# Complementos que não mudam o conceito: "osteomielite" casa com "Osteomielite, não especificada"
+QUALIFICADORES = [
+    ("nao", "especificado"),
+    ("nao", "especificada"),
+    ("sem", "outra", "especificacao"),
+]
+
+# Índice léxico dos títulos da CID-11: uma trie de tokens normalizados (sem acentos,
+# minúsculas, sem pontuação). Cada nó é um dict token -> nó; a chave "$" guarda os
+# [capitulo, codigo] cujo título termina ali. O arquivo traz também o texto de cada código
+# no formato dos bancos de embedding, para montar as opções sem consultar os bancos.
+
+def tokenizar(texto):
+    return re.findall(r"[a-z0-9]+", normalizar_termo(texto))
+
+def construir_indice(pasta=PASTA_CATALOGO, caminho=ARQUIVO_INDICE):
+    # Import local: quem só consulta o índice (escolha_cid) não precisa do numpy do banco_embedding
+    from codigos_cid.banco_embedding import montar_texto
+    inicio = time.monotonic()
+    trie, textos = {}, {}
+    n_titulos = 0
+    for nome_arquivo in sorted(f for f in os.listdir(pasta) if f.endswith('.json')):
+        capitulo = nome_arquivo.split('_')[0]
+        with open(os.path.join(pasta, nome_arquivo), 'r', encoding='utf-8') as f:
+            itens = json.load(f)
+        for item in itens:
+            tokens = tokenizar(item.get("valor", ""))
+            if not tokens:
+                continue
+            no = trie
+            for token in tokens:
+                no = no.setdefault(token, {})
+            no.setdefault("$", []).append([capitulo, item["identificador"]])
+            textos[item["identificador"]] = montar_texto(item)
+            n_titulos += 1
+
+    pasta_saida = os.path.dirname(caminho)
+    if pasta_saida and not os.path.exists(pasta_saida): os.makedirs(pasta_saida)
+    with open(caminho + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump({"trie": trie, "textos": textos}, f, ensure_ascii=False)
+    os.replace(caminho + ".tmp", caminho)
+    print(f"Índice léxico com {n_titulos} títulos salvo em {caminho} em {time.monotonic() - inicio:.1f}s.")
+
+class IndiceLexico:
+    """Resolve termos que são (quase) exatamente um título da CID-11 no capítulo atribuído."""
+    def __init__(self, caminho=ARQUIVO_INDICE):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+        self.trie = dados["trie"]
+        self.textos = dados["textos"]
+        self.lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    def _no(self, tokens, no=None):
+        no = self.trie if no is None else no
+        for token in tokens:
+            no = no.get(token)
+            if no is None:
+                return None
+        return no
+
+    def candidatos(self, termo):
+        """[capitulo, codigo] dos títulos iguais ao termo (ou ao termo + um qualificador genérico)."""
+        normalizado = " ".join(tokenizar(termo))
+        tokens = ABREVIACOES.get(normalizado, normalizado).split()
+        no = self._no(tokens)
+        if no is None:
+            return []
+        if "$" in no:
+            return no["$"]
+        encontrados = []
+        for qualificador in QUALIFICADORES:
+            final = self._no(qualificador, no)
+            if final and "$" in final:
+                encontrados.extend(final["$"])
+        return encontrados
+
+    def candidatos_no_capitulo(self, termo, capitulo):
+        """Códigos do capítulo cujo título casa com o termo; vazio se nenhum ou se ambíguo (mais de um)."""
+        codigos = {codigo for cap, codigo in self.candidatos(termo) if cap == capitulo}
+        return codigos if len(codigos) == 1 else set()
+
+    def resolver(self, termo, capitulo):
+        """Retorna {codigo: {"confidence_embedding", "text"}} se houver um único código no capítulo, senão None."""
+        codigos = self.candidatos_no_capitulo(termo, capitulo)
+        with self.lock:
+            if not codigos:
+                self.faltas += 1
+                return None
+            self.acertos += 1
+        codigo = codigos.pop()
+        return {codigo: {"confidence_embedding": 1.0, "text": self.textos[codigo]}}
+
+    def resumo(self):
+        consultas = self.acertos + self.faltas
+        taxa = self.acertos / consultas * 100 if consultas else 0
+        return f"Índice léxico: {consultas} termos | {self.acertos} resolvidos por título | acerto {taxa:.1f}%"
+
+def carregar_indice_lexico(caminho=ARQUIVO_INDICE):
+    """Carrega o índice se ele já foi construído; sem ele, o atalho léxico fica desligado."""
+    if not os.path.exists(caminho):
+        return None
+    return IndiceLexico(caminho)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice léxico dos títulos da CID-11 (atalho antes da busca por embeddings).")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("construir", help="Compila o índice a partir dos JSONs por capítulo.")
+    p_buscar = sub.add_parser("buscar", help="Mostra como um termo seria resolvido.")
+    p_buscar.add_argument("termo")
+    p_buscar.add_argument("capitulo", nargs="?")
+    args = parser.parse_args()
+
+    if args.comando == "construir":
+        construir_indice()
+    else:
+        indice = IndiceLexico()
+        inicio = time.perf_counter()
+        candidatos = indice.candidatos(args.termo)
+        print(f"Candidatos ({(time.perf_counter() - inicio) * 1e6:.0f} µs): {candidatos}")
+        if args.capitulo:
+            print(f"Resolução no capítulo {args.capitulo}: {indice.resolver(args.termo, args.capitulo)}")
@@ -1,5 +1,11 @@
 import json
 import os
+import sys
+
+# Raiz do projeto no path, para rodar tanto da raiz quanto de dentro de codigos_cid/
+PASTA_SCRIPT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(PASTA_SCRIPT))
+from codigos_cid.catalogo_cid import escrever_catalogo
 
 # Definição dos capítulos e seus intervalos (baseado na sua tabela)
 # A estrutura é: (Nome do Arquivo, Prefixo/Intervalo de Início)
@@ -34,9 +40,12 @@ capitulos_config = [
     ("X_codigos_extensao.json", "X")
 ]
 
+# Despacho direto pelo primeiro caractere do código: {prefixo: nome do arquivo}
+arquivo_por_prefixo = {prefixo: nome for nome, prefixo in capitulos_config}
+
 def dividir_cid(arquivo_origem):
     # Criar pasta de destino se não existir
-    pasta_destino = 'codigos_cid_jsons'
+    pasta_destino = os.path.join(PASTA_SCRIPT, 'codigos_cid_jsons')
     if not os.path.exists(pasta_destino):
         os.makedirs(pasta_destino)
 
@@ -52,17 +61,14 @@ def dividir_cid(arquivo_origem):
         identificador = item.get('identificador', '')
         if not identificador:
             continue
-        
-        encontrado = False
+
         # Verifica em qual capítulo o código se encaixa pelo primeiro caractere
-        for nome_arquivo, prefixo in capitulos_config:
-            if identificador.startswith(prefixo):
-                resultado_capitulos[nome_arquivo].append(item)
-                encontrado = True
-                break
-        
-        if not encontrado:
+        nome_arquivo = arquivo_por_prefixo.get(identificador[0])
+        if nome_arquivo is None:
             print(f"Aviso: Código {identificador} não se encaixou em nenhum capítulo.")
+            continue
+
+        resultado_capitulos[nome_arquivo].append(item)
 
     # Salvar os 28 arquivos
     for nome_arquivo, conteudo in resultado_capitulos.items():
@@ -71,10 +77,19 @@ def dividir_cid(arquivo_origem):
             json.dump(conteudo, f_out, indent=2, ensure_ascii=False)
         print(f"Arquivo {nome_arquivo} criado com {len(conteudo)} itens.")
 
+    # Catálogo binário único (código, título, descrição, capítulo + índice por código)
+    # para consultas via mmap sem reler os 28 JSONs
+    caminho_catalogo = os.path.join(pasta_destino, 'catalogo_cid.bin')
+    escrever_catalogo(caminho_catalogo, [
+        (nome_arquivo.split('_')[0], conteudo) for nome_arquivo, conteudo in resultado_capitulos.items()
+    ])
+    print(f"Catálogo compacto {caminho_catalogo} criado.")
+
 # Execução do script
 if __name__ == "__main__":
-    arquivo_input = 'ICD-11-com-descricoes.json' 
+    # Entrada e saída ficam em codigos_cid/, de onde quer que o script seja executado
+    arquivo_input = os.path.join(PASTA_SCRIPT, 'ICD-11-com-descricoes.json')
     if os.path.exists(arquivo_input):
         dividir_cid(arquivo_input)
     else:
-        print(f"Erro: O arquivo {arquivo_input} não foi encontrado no diretório atual.")
\ No newline at end of file
+        print(f"Erro: O arquivo {arquivo_input} não foi encontrado.")
\ No newline at end of file
@@ -0,0 +1,165 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+# --- CONFIGURAÇÕES ---
+# Executar a partir da raiz do projeto
+PASTAS_HISTORICO = [
+    "analise/prontuarios_auditados",
+    "processamento/seleciona_labels/prontuarios_vazios_auditados",
+]
+ARQUIVO_CACHE_DECISOES = "processamento/cache_decisoes.json"
+
+# Um termo só é resolvido pelo cache quando o mesmo código foi MANTIDO pela auditoria
+# pelo menos FREQUENCIA_MINIMA vezes e responde por CONCORDANCIA_MINIMA das decisões do termo
+FREQUENCIA_MINIMA = 3
+CONCORDANCIA_MINIMA = 0.9
+
+ORIGEM_CACHE = "cache_decisoes"
+
+# Cache de decisões termo -> código aprendido do histórico auditado:
+#   chave     termo normalizado (minúsculas, sem acentos, espaços simples) + capítulo
+#   contagem  quantas vezes cada código foi MANTIDO para a chave e quantas vezes foi REMOVIDO
+# Os limiares são aplicados na consulta, então podem ser ajustados sem reconstruir o arquivo.
+
+def normalizar_termo(termo):
+    sem_acentos = unicodedata.normalize("NFKD", termo or "").encode("ascii", "ignore").decode("ascii")
+    return " ".join(sem_acentos.lower().split())
+
+def chave(termo, capitulo):
+    return f"{normalizar_termo(termo)}|{capitulo}"
+
+def construir_cache(pastas=PASTAS_HISTORICO, caminho=ARQUIVO_CACHE_DECISOES):
+    """Lê os prontuários auditados e grava, por termo + capítulo, a contagem das decisões de cada código."""
+    mantidos = defaultdict(Counter)
+    removidos = defaultdict(Counter)
+    descricoes = {}
+    n_arquivos = 0
+
+    for pasta in pastas:
+        if not os.path.exists(pasta):
+            print(f"   Pasta {pasta} não existe, ignorada.")
+            continue
+        for nome_arquivo in sorted(f for f in os.listdir(pasta) if f.endswith('.json')):
+            try:
+                with open(os.path.join(pasta, nome_arquivo), 'r', encoding='utf-8') as f:
+                    dados = json.load(f)
+            except Exception as e:
+                print(f"   Erro ao ler {nome_arquivo}: {e}")
+                continue
+            n_arquivos += 1
+
+            for codigo, info in dados.get("labels", {}).items():
+                # Decisões que vieram do próprio cache não contam como evidência nova
+                if info.get("origem") == ORIGEM_CACHE or not info.get("term_original"):
+                    continue
+                k = chave(info["term_original"], info.get("capitulo"))
+                if info.get("decisao") == "MANTER":
+                    mantidos[k][codigo] += 1
+                    descricoes.setdefault(codigo, info.get("descricao_cid", ""))
+                elif info.get("decisao") == "REMOVER":
+                    removidos[k][codigo] += 1
+
+    entradas = {}
+    for k in sorted(set(mantidos) | set(removidos)):
+        entradas[k] = {
+            "mantidos": dict(mantidos[k].most_common()),
+            "removidos": dict(removidos[k].most_common()),
+        }
+
+    pasta = os.path.dirname(caminho)
+    if pasta and not os.path.exists(pasta): os.makedirs(pasta)
+    with open(caminho + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump({"entradas": entradas, "descricoes": descricoes}, f, ensure_ascii=False, indent=2)
+    os.replace(caminho + ".tmp", caminho)
+
+    print(f"Cache de decisões salvo em {caminho}: {len(entradas)} termos de {n_arquivos} prontuários auditados.")
+
+class CacheDecisoes:
+    """
+    Consulta ao cache de decisões com os limiares de frequência e concordância.
+    Sem o arquivo, o cache fica vazio e toda consulta é uma falta.
+    """
+    def __init__(self, caminho=ARQUIVO_CACHE_DECISOES, frequencia_minima=FREQUENCIA_MINIMA,
+                 concordancia_minima=CONCORDANCIA_MINIMA):
+        self.frequencia_minima = frequencia_minima
+        self.concordancia_minima = concordancia_minima
+        self.entradas, self.descricoes = {}, {}
+        self.versao = None
+        if os.path.exists(caminho):
+            with open(caminho, 'rb') as f:
+                conteudo = f.read()
+            self.versao = hashlib.sha256(conteudo).hexdigest()
+            dados = json.loads(conteudo)
+            self.entradas, self.descricoes = dados["entradas"], dados["descricoes"]
+
+        self.lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    def assinatura(self):
+        """Identifica o conteúdo e os limiares em uso (entra no manifesto das etapas)."""
+        return [self.versao, self.frequencia_minima, self.concordancia_minima]
+
+    def decisao_estavel(self, termo, capitulo):
+        """Retorna {"codigo", "descricao_cid", "frequencia", "concordancia"} ou None se não há mapeamento estável."""
+        entrada = self.entradas.get(chave(termo, capitulo))
+        if not entrada or not entrada["mantidos"]:
+            return None
+        codigo, frequencia = max(entrada["mantidos"].items(), key=lambda x: x[1])
+        # Concordância: o código vencedor contra todas as decisões do termo (outros códigos mantidos e ele mesmo removido)
+        total = sum(entrada["mantidos"].values()) + entrada["removidos"].get(codigo, 0)
+        concordancia = frequencia / total
+        if frequencia < self.frequencia_minima or concordancia < self.concordancia_minima:
+            return None
+        return {
+            "codigo": codigo,
+            "descricao_cid": self.descricoes.get(codigo, ""),
+            "frequencia": frequencia,
+            "concordancia": round(concordancia, 3),
+        }
+
+    def consultar(self, termo, capitulo):
+        decisao = self.decisao_estavel(termo, capitulo)
+        with self.lock:
+            if decisao:
+                self.acertos += 1
+            else:
+                self.faltas += 1
+        return decisao
+
+    def resumo(self):
+        consultas = self.acertos + self.faltas
+        taxa = self.acertos / consultas * 100 if consultas else 0
+        return (f"Cache de decisões: {consultas} consultas | {self.acertos} resolvidas pelo histórico | "
+                f"{self.faltas} para a LLM | acerto {taxa:.1f}% "
+                f"(frequência >= {self.frequencia_minima}, concordância >= {self.concordancia_minima})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache de decisões termo -> código a partir dos prontuários auditados.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_construir = sub.add_parser("construir", help="Reconstrói o cache a partir do histórico auditado.")
+    p_construir.add_argument("--pastas", nargs="*", default=PASTAS_HISTORICO)
+    p_construir.add_argument("--saida", default=ARQUIVO_CACHE_DECISOES)
+    p_mostrar = sub.add_parser("mostrar", help="Lista os termos que o cache resolveria com os limiares dados.")
+    p_mostrar.add_argument("--frequencia", type=int, default=FREQUENCIA_MINIMA)
+    p_mostrar.add_argument("--concordancia", type=float, default=CONCORDANCIA_MINIMA)
+    args = parser.parse_args()
+
+    if args.comando == "construir":
+        construir_cache(args.pastas, args.saida)
+    else:
+        cache = CacheDecisoes(frequencia_minima=args.frequencia, concordancia_minima=args.concordancia)
+        estaveis = 0
+        for k in cache.entradas:
+            termo, capitulo = k.rsplit("|", 1)
+            decisao = cache.decisao_estavel(termo, capitulo)
+            if decisao:
+                estaveis += 1
+                print(f"{termo} (cap. {capitulo}) -> {decisao['codigo']} | "
+                      f"{decisao['frequencia']}x, concordância {decisao['concordancia']}")
+        print(f"\n{estaveis} de {len(cache.entradas)} termos com mapeamento estável.")
@@ -0,0 +1,115 @@
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import threading
+
+# Manifesto gravado dentro da pasta de saída de cada etapa. A extensão .jsonl
+# garante que as etapas seguintes (que leem apenas *.json) não o confundam com um prontuário.
+NOME_MANIFESTO = "_manifesto.jsonl"
+# Reprocessamentos (e --forcar) anexam novas linhas; ao carregar, o manifesto é reescrito
+# só com o último registro de cada arquivo quando tem mais que FATOR_COMPACTACAO vezes isso
+FATOR_COMPACTACAO = 2
+
+def hash_arquivo(caminho):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 16), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+def assinatura(*partes):
+    """
+    Hash do que define o resultado de uma etapa além da entrada: funções entram pelo
+    código-fonte (templates de prompt), o resto pelo JSON/repr (constantes, opções).
+    """
+    h = hashlib.sha256()
+    for parte in partes:
+        if callable(parte):
+            texto = inspect.getsource(parte)
+        else:
+            try:
+                texto = json.dumps(parte, ensure_ascii=False, sort_keys=True)
+            except TypeError:
+                texto = repr(parte)
+        h.update(texto.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+class ManifestoEtapa:
+    """
+    Registro por arquivo do que já foi processado: hash da entrada, modelo, hash do
+    template de prompt e caminho de saída. Um arquivo está atualizado quando tudo
+    isso bate e a saída ainda existe. Cada registro é uma linha anexada ao manifesto,
+    então uma interrupção perde no máximo o arquivo em andamento.
+    """
+    def __init__(self, pasta_saida, etapa, modelo, hash_prompt, forcar=False):
+        self.caminho = os.path.join(pasta_saida, NOME_MANIFESTO)
+        self.etapa = etapa
+        self.modelo = modelo
+        self.hash_prompt = hash_prompt
+        self.forcar = forcar
+        self.lock = threading.Lock()
+        self.registros = {}
+
+        if os.path.exists(self.caminho):
+            ultimos = {}  # (etapa, arquivo) -> registro, de todas as etapas que gravam nesta pasta
+            linhas = 0
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                for linha in f:
+                    if linha.strip():
+                        registro = json.loads(linha)
+                        ultimos[(registro.get("etapa"), registro["arquivo"])] = registro
+                        linhas += 1
+            self.registros = {arquivo: r for (e, arquivo), r in ultimos.items() if e == etapa}
+            if linhas > FATOR_COMPACTACAO * len(ultimos):
+                self.compactar(ultimos.values())
+
+    def compactar(self, registros):
+        """Reescreve o manifesto só com os registros dados (troca atômica do arquivo)."""
+        descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(self.caminho) or ".", prefix=NOME_MANIFESTO, suffix=".tmp")
+        with os.fdopen(descritor, 'w', encoding='utf-8') as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        os.replace(temporario, self.caminho)
+
+    def atualizado(self, nome_arquivo, hash_entrada):
+        if self.forcar:
+            return False
+        registro = self.registros.get(nome_arquivo)
+        return bool(
+            registro
+            and registro["hash_entrada"] == hash_entrada
+            and registro["modelo"] == self.modelo
+            and registro["hash_prompt"] == self.hash_prompt
+            and os.path.exists(registro["saida"])
+        )
+
+    def pendentes(self, pasta_entrada, arquivos):
+        """Filtra a lista de arquivos, retornando [(nome, hash_entrada)] dos que precisam ser (re)processados."""
+        pendentes = []
+        for nome_arquivo in arquivos:
+            hash_entrada = hash_arquivo(os.path.join(pasta_entrada, nome_arquivo))
+            if not self.atualizado(nome_arquivo, hash_entrada):
+                pendentes.append((nome_arquivo, hash_entrada))
+
+        pulados = len(arquivos) - len(pendentes)
+        if pulados:
+            print(f"[{self.etapa}] {pulados} de {len(arquivos)} arquivos já estão atualizados e serão pulados "
+                  f"(use --forcar para reprocessar tudo).")
+        return pendentes
+
+    def registrar(self, nome_arquivo, hash_entrada, caminho_saida):
+        registro = {
+            "etapa": self.etapa,
+            "arquivo": nome_arquivo,
+            "hash_entrada": hash_entrada,
+            "modelo": self.modelo,
+            "hash_prompt": self.hash_prompt,
+            "saida": caminho_saida,
+        }
+        with self.lock:
+            self.registros[nome_arquivo] = registro
+            with open(self.caminho, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
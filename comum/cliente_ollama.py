@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- CONFIGURAÇÕES ---
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+# Requisições simultâneas ao Ollama; acompanhe o OLLAMA_NUM_PARALLEL do servidor
+OLLAMA_MAX_EM_VOO = int(os.environ.get("OLLAMA_MAX_EM_VOO", "4"))
+
+class ClienteOllama:
+    """
+    Cliente compartilhado pelas etapas do pipeline: uma sessão keep-alive com pool de
+    conexões, no máximo max_em_voo requisições simultâneas (para qualquer thread que
+    chame post, não só as do mapear) e contadores de vazão por etapa.
+    """
+    def __init__(self, etapa, max_em_voo=OLLAMA_MAX_EM_VOO, base_url=OLLAMA_URL):
+        self.etapa = etapa
+        self.base_url = base_url.rstrip("/")
+        self.max_em_voo = max_em_voo
+
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max_em_voo)
+        self.sessao.mount("http://", adaptador)
+        self.sessao.mount("https://", adaptador)
+        self.executor = ThreadPoolExecutor(max_workers=max_em_voo, thread_name_prefix=etapa)
+        self.vagas = threading.BoundedSemaphore(max_em_voo)
+
+        self.lock = threading.Lock()
+        self.inicio = time.monotonic()
+        self.chamadas = 0
+        self.erros = 0
+        self.itens = 0
+        self.tempo_chamadas = 0.0
+        self.em_voo = 0
+        self.pico_em_voo = 0
+        self.latencias = []  # duração de cada chamada (percentis do benchmark.py)
+        # Tokens informados pelo Ollama nas respostas (prompt_eval_count / eval_count)
+        self.tokens_entrada = 0
+        self.tokens_saida = 0
+
+    def post(self, caminho, payload, timeout=120):
+        """
+        POST em {base_url}{caminho}; retorna o JSON da resposta (erros de HTTP viram exceção).
+        Espera uma vaga se já houver max_em_voo requisições em andamento; a latência não conta a espera.
+        """
+        with self.vagas:
+            with self.lock:
+                self.em_voo += 1
+                self.pico_em_voo = max(self.pico_em_voo, self.em_voo)
+            inicio = time.monotonic()
+            try:
+                response = self.sessao.post(f"{self.base_url}{caminho}", json=payload, timeout=timeout)
+                response.raise_for_status()
+                dados = response.json()
+                with self.lock:
+                    self.tokens_entrada += dados.get("prompt_eval_count", 0)
+                    self.tokens_saida += dados.get("eval_count", 0)
+                return dados
+            except Exception:
+                with self.lock:
+                    self.erros += 1
+                raise
+            finally:
+                with self.lock:
+                    self.em_voo -= 1
+                    self.chamadas += 1
+                    self.latencias.append(time.monotonic() - inicio)
+                    self.tempo_chamadas += self.latencias[-1]
+
+    def gerar(self, payload, timeout=120):
+        return self.post("/api/generate", payload, timeout)
+
+    def chat(self, payload, timeout=90):
+        return self.post("/api/chat", payload, timeout)
+
+    def mapear(self, funcao, itens):
+        """
+        Executa funcao(item) para cada item com até max_em_voo em paralelo.
+        Os resultados saem na ordem dos itens, à medida que ficam prontos.
+        """
+        for resultado in self.executor.map(funcao, itens):
+            with self.lock:
+                self.itens += 1
+            yield resultado
+
+    def resumo(self):
+        duracao = max(time.monotonic() - self.inicio, 1e-9)
+        latencia = self.tempo_chamadas / self.chamadas if self.chamadas else 0.0
+        return (f"[{self.etapa}] {self.itens} itens ({self.itens / duracao:.2f}/s) | "
+                f"{self.chamadas} chamadas ({self.chamadas / duracao:.2f}/s), {self.erros} erros | "
+                f"latência média {latencia:.2f}s | pico em voo {self.pico_em_voo}/{self.max_em_voo}")
+
+    def fechar(self):
+        self.executor.shutdown(wait=True)
+        self.sessao.close()
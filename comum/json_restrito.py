@@ -0,0 +1,206 @@
+import torch
+from transformers import LogitsProcessor
+
+# Decodificação restrita para respostas JSON planas {"chave": "valor", ...} no transformers:
+#   - um autômato por caractere aceita apenas chaves de uma lista (ex: termos candidatos),
+#     cada uma no máximo uma vez, e valores de um enum (ex: capítulos da CID-11);
+#   - a cada passo, os tokens cujo texto levaria o autômato a um estado inválido recebem -inf,
+#     e depois do '}' final só o token de fim de sequência é permitido.
+# Assim a saída do modelo é sempre um JSON válido, sem pós-processamento por outra LLM.
+
+ESPACOS = " \n"
+MAX_ESPACOS = 2  # espaços seguidos permitidos entre os elementos (evita laços de espaços)
+# Alfabeto da trie do vocabulário, montada uma vez por tokenizer e compartilhada pelos
+# autômatos (o próprio autômato rejeita o que não lhe serve): ASCII imprimível, quebra de
+# linha e letras acentuadas. Caracteres de fora só entram se algum termo os tiver.
+ALFABETO_VOCABULARIO = frozenset(
+    [chr(c) for c in range(0x20, 0x7F)] + ["\n", "º", "ª", "°"] + [chr(c) for c in range(0xC0, 0x100)]
+)
+
+class Trie:
+    """Trie de caracteres com nós numerados (os estados do autômato precisam ser hasháveis)."""
+    def __init__(self, palavras):
+        self.filhos = [{}]
+        self.final = [False]
+        for palavra in palavras:
+            no = 0
+            for c in palavra:
+                if c not in self.filhos[no]:
+                    self.filhos.append({})
+                    self.final.append(False)
+                    self.filhos[no][c] = len(self.filhos) - 1
+                no = self.filhos[no][c]
+            self.final[no] = True
+        # Nós finais abaixo de cada nó (inclusive), para podar prefixos de chaves já usadas
+        self.finais_abaixo = [None] * len(self.filhos)
+        for no in reversed(range(len(self.filhos))):
+            abaixo = {no} if self.final[no] else set()
+            for filho in self.filhos[no].values():
+                abaixo |= self.finais_abaixo[filho]
+            self.finais_abaixo[no] = frozenset(abaixo)
+
+class AutomatoObjetoJSON:
+    """
+    Autômato do objeto {"chave": "valor", ...}. Estados são tuplas (tipo, posição, chaves usadas),
+    onde posição é o nº de espaços seguidos ou o nó da trie da string em andamento.
+    """
+    def __init__(self, chaves, valores):
+        # Strings que exigiriam escape no JSON ficam de fora
+        validas = lambda s: s and '"' not in s and "\\" not in s and all(c >= " " for c in s)
+        self.chaves = Trie(sorted({c for c in chaves if validas(c)}))
+        self.valores = Trie(sorted({v for v in valores if validas(v)}))
+        self.n_chaves = sum(self.chaves.final)
+        self.alfabeto = set("{}\":," + ESPACOS)
+        for trie in (self.chaves, self.valores):
+            for filhos in trie.filhos:
+                self.alfabeto.update(filhos)
+
+    inicio = ("inicio", 0, frozenset())
+
+    def avancar(self, estado, c):
+        tipo, pos, usados = estado
+        if tipo == "inicio":
+            return ("antes_chave", 0, usados) if c == "{" else None
+        if tipo in ("antes_chave", "depois_virgula"):
+            if c in ESPACOS:
+                return (tipo, pos + 1, usados) if pos < MAX_ESPACOS else None
+            if c == '"':
+                return ("chave", 0, usados)
+            if c == "}" and tipo == "antes_chave":
+                return ("fim", 0, usados)
+            return None
+        if tipo == "chave":
+            if c == '"':
+                return ("apos_chave", 0, usados | {pos}) if self.chaves.final[pos] and pos not in usados else None
+            proximo = self.chaves.filhos[pos].get(c)
+            if proximo is None or not self.chaves.finais_abaixo[proximo] - usados:
+                return None
+            return ("chave", proximo, usados)
+        if tipo in ("apos_chave", "antes_valor"):
+            if c in ESPACOS:
+                return (tipo, pos + 1, usados) if pos < MAX_ESPACOS else None
+            if tipo == "apos_chave" and c == ":":
+                return ("antes_valor", 0, usados)
+            if tipo == "antes_valor" and c == '"':
+                return ("valor", 0, usados)
+            return None
+        if tipo == "valor":
+            if c == '"':
+                return ("apos_valor", 0, usados) if self.valores.final[pos] else None
+            proximo = self.valores.filhos[pos].get(c)
+            return ("valor", proximo, usados) if proximo is not None else None
+        if tipo == "apos_valor":
+            if c in ESPACOS:
+                return (tipo, pos + 1, usados) if pos < MAX_ESPACOS else None
+            if c == "," and len(usados) < self.n_chaves:
+                return ("depois_virgula", 0, usados)
+            if c == "}":
+                return ("fim", 0, usados)
+            return None
+        return None
+
+    def avancar_texto(self, estado, texto):
+        for c in texto:
+            estado = self.avancar(estado, c)
+            if estado is None:
+                return None
+        return estado
+
+textos_vocabulario = {}
+
+def texto_dos_tokens(tokenizer):
+    """Texto de cada id do vocabulário ('' para tokens especiais), calculado uma vez por tokenizer."""
+    chave = id(tokenizer)
+    if chave not in textos_vocabulario:
+        especiais = set(tokenizer.all_special_ids) | set(tokenizer.get_added_vocab().values())
+        textos = []
+        for i, token in enumerate(tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))):
+            if i in especiais or token is None:
+                textos.append("")
+            elif token.startswith("<0x") and token.endswith(">") and len(token) == 6:
+                # Tokens de byte (fallback do SentencePiece): só os ASCII viram caractere
+                byte = int(token[3:5], 16)
+                textos.append(chr(byte) if byte < 0x80 else "")
+            else:
+                textos.append(token.replace("▁", " "))
+        textos_vocabulario[chave] = textos
+    return textos_vocabulario[chave]
+
+tries_vocabulario = {}
+
+def trie_vocabulario(tokenizer, alfabeto=()):
+    """
+    Trie dos textos do vocabulário que cabem em ALFABETO_VOCABULARIO (mais os caracteres
+    extras de `alfabeto`), como (filhos, ids por nó); calculada uma vez por tokenizer e alfabeto.
+    """
+    alfabeto = ALFABETO_VOCABULARIO | frozenset(alfabeto)
+    chave = (id(tokenizer), alfabeto)
+    if chave not in tries_vocabulario:
+        filhos, ids = [{}], [[]]
+        for token_id, texto in enumerate(texto_dos_tokens(tokenizer)):
+            if not texto or not set(texto) <= alfabeto:
+                continue
+            no = 0
+            for c in texto:
+                if c not in filhos[no]:
+                    filhos.append({})
+                    ids.append([])
+                    filhos[no][c] = len(filhos) - 1
+                no = filhos[no][c]
+            ids[no].append(token_id)
+        tries_vocabulario[chave] = (filhos, ids)
+    return tries_vocabulario[chave]
+
+class ProcessadorJSONRestrito(LogitsProcessor):
+    """
+    LogitsProcessor do generate com um autômato por linha do lote (cada prontuário tem suas chaves).
+    Os tokens permitidos de cada estado são calculados percorrendo a trie do vocabulário
+    (compartilhada entre prontuários e lotes) e guardados em cache.
+    """
+    def __init__(self, tokenizer, automatos, inicio_geracao, ids_fim):
+        self.textos = texto_dos_tokens(tokenizer)
+        self.automatos = automatos
+        self.estados = [a.inicio for a in automatos]
+        self.consumidos = inicio_geracao
+        self.ids_fim = list(ids_fim)
+        self.permitidos = [{} for _ in automatos]
+        self.tries_vocab = [trie_vocabulario(tokenizer, a.alfabeto) for a in automatos]
+
+    def _ids_permitidos(self, linha, estado):
+        cache = self.permitidos[linha]
+        if estado not in cache:
+            if estado is None or estado[0] == "fim":
+                permitidos = self.ids_fim
+            else:
+                automato = self.automatos[linha]
+                filhos, ids = self.tries_vocab[linha]
+                permitidos = []
+                pilha = [(0, estado)]
+                while pilha:
+                    no, atual = pilha.pop()
+                    for c, filho in filhos[no].items():
+                        proximo = automato.avancar(atual, c)
+                        if proximo is not None:
+                            permitidos.extend(ids[filho])
+                            pilha.append((filho, proximo))
+            # Sem saída (um caractere que nenhum token do vocabulário produz): encerra, e o JSON incompleto vira {}
+            cache[estado] = torch.tensor(permitidos or self.ids_fim, dtype=torch.long)
+        return cache[estado]
+
+    def __call__(self, input_ids, scores):
+        for linha, automato in enumerate(self.automatos):
+            for token_id in input_ids[linha, self.consumidos:].tolist():
+                estado = self.estados[linha]
+                if estado is None or estado[0] == "fim":
+                    break
+                self.estados[linha] = automato.avancar_texto(estado, self.textos[token_id])
+        self.consumidos = input_ids.shape[1]
+
+        mascara = torch.full_like(scores, float("-inf"))
+        for linha, estado in enumerate(self.estados):
+            mascara[linha, self._ids_permitidos(linha, estado).to(scores.device)] = 0
+        return scores + mascara
+
+    def concluido(self, linha):
+        estado = self.estados[linha]
+        return estado is not None and estado[0] == "fim"
@@ -0,0 +1,137 @@
+import argparse
+import os
+import time
+import torch
+
+# --- CONFIGURAÇÕES ---
+# Dispositivo e precisão dos modelos locais (MedGemma), escolhidos na carga:
+#   GPU  bfloat16 (float16 se a placa não suportar bf16), distribuído pelo accelerate
+#   CPU  float32 com os nn.Linear quantizados dinamicamente para int8 (pesos int8,
+#        ativações quantizadas em tempo de execução) e nº de threads explícito
+# Lidas na importação do módulo; as etapas carregam o modelo na primeira geração (ou o
+# servidor de modelo, na primeira requisição), então defina as variáveis antes de executá-las.
+DISPOSITIVO = os.environ.get("MEDGEMMA_DISPOSITIVO", "auto")  # auto | cuda | cpu
+THREADS_CPU = int(os.environ.get("MEDGEMMA_THREADS", "0"))     # 0 = padrão do torch (núcleos físicos)
+QUANTIZAR_INT8 = os.environ.get("MEDGEMMA_INT8", "1") != "0"  # só na CPU
+# Exportação para ONNX Runtime (pacote optimum[onnxruntime]), só para modelos de texto
+# (AutoModelForCausalLM); sem o cache de prefixo, que depende do cache KV do transformers
+USAR_ONNX = os.environ.get("MEDGEMMA_ONNX", "0") != "0"
+
+def escolher_dispositivo(dispositivo=DISPOSITIVO):
+    if dispositivo == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    if dispositivo == "cuda" and not torch.cuda.is_available():
+        raise RuntimeError("MEDGEMMA_DISPOSITIVO=cuda, mas nenhuma GPU está disponível.")
+    return dispositivo
+
+def escolher_dtype(dispositivo):
+    if dispositivo == "cuda":
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    # bf16 na CPU é emulado na maioria dos processadores; a quantização dinâmica parte do float32
+    return torch.float32
+
+def configurar_threads(threads=THREADS_CPU):
+    if threads:
+        torch.set_num_threads(threads)
+    return torch.get_num_threads()
+
+def carregar_onnx(modelo_id, threads=THREADS_CPU):
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError:
+        raise RuntimeError("MEDGEMMA_ONNX=1 requer o pacote optimum[onnxruntime].")
+    opcoes = onnxruntime.SessionOptions()
+    if threads:
+        opcoes.intra_op_num_threads = threads
+    return ORTModelForCausalLM.from_pretrained(modelo_id, export=True, provider="CPUExecutionProvider",
+                                               session_options=opcoes)
+
+def carregar_modelo(classe, modelo_id, dispositivo=DISPOSITIVO, threads=THREADS_CPU,
+                    int8=QUANTIZAR_INT8, onnx=USAR_ONNX):
+    """Carrega classe.from_pretrained(modelo_id) no dispositivo/precisão escolhidos; retorna o modelo em modo eval."""
+    dispositivo = escolher_dispositivo(dispositivo)
+    inicio = time.monotonic()
+    if dispositivo == "cpu":
+        threads = configurar_threads(threads)
+
+    if onnx:
+        if dispositivo != "cpu":
+            raise RuntimeError("A exportação ONNX é só para a CPU.")
+        modelo = carregar_onnx(modelo_id, threads)
+        descricao = "ONNX Runtime (float32)"
+    else:
+        dtype = escolher_dtype(dispositivo)
+        modelo = classe.from_pretrained(
+            modelo_id,
+            torch_dtype=dtype,
+            device_map="auto" if dispositivo == "cuda" else "cpu"
+        )
+        descricao = str(dtype).replace("torch.", "")
+        if dispositivo == "cpu" and int8:
+            modelo = torch.ao.quantization.quantize_dynamic(modelo, {torch.nn.Linear}, dtype=torch.qint8)
+            descricao = "int8 dinâmico"
+        modelo.eval()
+
+    extra = f", {threads} threads" if dispositivo == "cpu" else ""
+    print(f"✓ {modelo_id} carregado em {dispositivo.upper()} ({descricao}{extra}) em {time.monotonic() - inicio:.1f}s")
+    return modelo
+
+def medir_vazao(modelo, tokenizer, tokens_prompt=512, tokens_resposta=64, repeticoes=3):
+    """
+    Mede tokens/s de prefill (uma passada sobre o prompt) e de decode (geração gulosa de
+    tokens_resposta tokens, descontado o prefill). Usa a mediana das repetições.
+    """
+    texto = "Paciente refere cefaleia e febre há três dias, sem vômitos. " * tokens_prompt
+    ids = tokenizer(texto, return_tensors="pt")["input_ids"][:, :tokens_prompt].to(modelo.device)
+    mascara = torch.ones_like(ids)
+
+    with torch.no_grad():
+        # Aquecimento (alocação de memória, kernels, compilação do grafo ONNX)
+        modelo.generate(input_ids=ids, attention_mask=mascara, max_new_tokens=2, do_sample=False)
+        tempos_prefill, tempos_total = [], []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            modelo(input_ids=ids, attention_mask=mascara, use_cache=True)
+            tempos_prefill.append(time.perf_counter() - inicio)
+
+            inicio = time.perf_counter()
+            modelo.generate(input_ids=ids, attention_mask=mascara, max_new_tokens=tokens_resposta,
+                            min_new_tokens=tokens_resposta, do_sample=False)
+            tempos_total.append(time.perf_counter() - inicio)
+
+    prefill = sorted(tempos_prefill)[len(tempos_prefill) // 2]
+    total = sorted(tempos_total)[len(tempos_total) // 2]
+    return {
+        "tokens_prompt": ids.shape[1],
+        "tokens_resposta": tokens_resposta,
+        "prefill_tok_s": ids.shape[1] / prefill,
+        "decode_tok_s": tokens_resposta / max(total - prefill, 1e-9),
+    }
+
+if __name__ == "__main__":
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    parser = argparse.ArgumentParser(description="Benchmark de prefill/decode do modelo local para planejar a capacidade por 1000 prontuários.")
+    parser.add_argument("--modelo", default="google/medgemma-1.5-4b-it")
+    parser.add_argument("--dispositivo", choices=("auto", "cuda", "cpu"), default=DISPOSITIVO)
+    parser.add_argument("--threads", type=int, default=THREADS_CPU, help="Threads da CPU (0 = padrão do torch).")
+    parser.add_argument("--sem-int8", action="store_true", help="Mantém os pesos em float32 na CPU.")
+    parser.add_argument("--onnx", action="store_true", default=USAR_ONNX, help="Roda pelo ONNX Runtime (CPU).")
+    parser.add_argument("--tokens-prompt", type=int, default=512)
+    parser.add_argument("--tokens-resposta", type=int, default=64)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--prompt-por-prontuario", type=int, default=1500, help="Tokens de prompt por prontuário (para a estimativa).")
+    parser.add_argument("--resposta-por-prontuario", type=int, default=150, help="Tokens gerados por prontuário (para a estimativa).")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.modelo)
+    modelo = carregar_modelo(AutoModelForCausalLM, args.modelo, args.dispositivo, args.threads,
+                             not args.sem_int8, args.onnx)
+    r = medir_vazao(modelo, tokenizer, args.tokens_prompt, args.tokens_resposta, args.repeticoes)
+
+    segundos = args.prompt_por_prontuario / r["prefill_tok_s"] + args.resposta_por_prontuario / r["decode_tok_s"]
+    print(f"Prefill: {r['prefill_tok_s']:.1f} tok/s ({r['tokens_prompt']} tokens de prompt)")
+    print(f"Decode:  {r['decode_tok_s']:.1f} tok/s ({r['tokens_resposta']} tokens gerados)")
+    print(f"Estimativa: {segundos:.1f}s por prontuário ({args.prompt_por_prontuario} + {args.resposta_por_prontuario} tokens) "
+          f"-> {segundos * 1000 / 3600:.1f}h por 1000 prontuários em uma instância")
@@ -0,0 +1,363 @@
+import argparse
+import ast
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Raiz do projeto no path para a normalização de termos (comum/cache_decisoes.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comum.cache_decisoes import normalizar_termo
+
+# --- CONFIGURAÇÕES ---
+PORTA_PADRAO = 11434
+DIMENSAO_EMBEDDING = 1024  # a do mxbai-embed-large, usado pela busca_embedding e pelo banco_embedding
+
+# Latência por endpoint: "tipo:parâmetros" em ms (fixa:M | normal:MEDIA:DESVIO |
+# lognormal:MEDIANA:SIGMA | exponencial:MEDIA | uniforme:MIN:MAX) + custo por token/texto
+LATENCIA_GERACAO = "lognormal:300:0.5"
+LATENCIA_EMBEDDING = "lognormal:20:0.3"
+MS_POR_TOKEN_GERADO = 2.0
+MS_POR_TEXTO_EMBEDDING = 1.0
+PARALELO = 4  # como o OLLAMA_NUM_PARALLEL: requisições atendidas ao mesmo tempo, as demais esperam
+
+# Respostas "clínicas" derivadas do hash da entrada, nas proporções abaixo
+FRACAO_IGNORAR = 0.1  # entidades que o classifica manda IGNORAR
+FRACAO_VALIDOS = 0.85  # vínculos mantidos pela auditoria
+
+CAPITULOS = [f"{n:02d}" for n in range(1, 27)] + ["V", "X"]
+MOTIVOS_PADRAO = ["inferencia_sem_suporte"]
+
+# Substituto local do Ollama para medir e testar o pipeline sem modelos: implementa
+# /api/generate, /api/chat, /api/embeddings e /api/embed com respostas determinísticas
+# (a mesma entrada dá sempre a mesma saída, pelo hash do texto), no formato que cada
+# etapa espera, com latência configurável, limite de paralelismo e injeção de falhas.
+# Uso: python comum/ollama_simulado.py [--porta 11434] e OLLAMA_URL apontando para ele.
+
+def fracao(*partes):
+    """Número em [0, 1) derivado do hash das partes."""
+    digest = hashlib.sha256("\x1f".join(map(str, partes)).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") / 2**64
+
+def escolher(opcoes, *partes):
+    return opcoes[int(fracao(*partes) * len(opcoes))]
+
+def contar_tokens(texto):
+    """Aproximação de tokens (4 caracteres por token), para os contadores do Ollama."""
+    return max(1, len(texto) // 4)
+
+# --- EMBEDDINGS ---
+# Soma de vetores aleatórios por token normalizado (hashing trick), mais um componente do
+# texto inteiro: determinístico e com similaridade léxica, para a busca ter vizinhos plausíveis.
+vetores_token = {}
+lock_vetores = threading.Lock()
+
+def vetor_semente(semente, dimensao):
+    rng = np.random.default_rng(int.from_bytes(hashlib.sha256(semente.encode("utf-8")).digest()[:8], "little"))
+    return rng.standard_normal(dimensao).astype(np.float32)
+
+def embedding(texto, modelo, dimensao):
+    tokens = re.findall(r"[a-z0-9]+", normalizar_termo(texto))
+    vetor = 0.5 * vetor_semente(f"{modelo}|texto|{texto}", dimensao)
+    for token in tokens:
+        chave = (modelo, token, dimensao)
+        with lock_vetores:
+            v = vetores_token.get(chave)
+        if v is None:
+            v = vetor_semente(f"{modelo}|token|{token}", dimensao)
+            with lock_vetores:
+                vetores_token[chave] = v
+        vetor = vetor + v
+    return (vetor / np.linalg.norm(vetor)).tolist()
+
+# --- RESPOSTAS DAS ETAPAS ---
+
+def responder_classificacao(prompt):
+    """classifica_entidades (llama3): {entidade: capítulo | "IGNORAR"} para a lista do prompt."""
+    m = re.search(r"LISTA DE ENTIDADES PARA CLASSIFICAR:\n(\[.*?\])\n", prompt, re.S)
+    try:
+        entidades = ast.literal_eval(m.group(1)) if m else []
+    except (ValueError, SyntaxError):
+        entidades = []
+    return {
+        e: "IGNORAR" if fracao("ignorar", e) < FRACAO_IGNORAR else escolher(CAPITULOS, "capitulo", e)
+        for e in entidades
+    }
+
+def responder_formatacao(prompt):
+    """Formatador do classifica do MedGemma: converte as linhas 'termo -> código' da análise."""
+    m = re.search(r"### ANÁLISE MÉDICA PARA PROCESSAR:\n(.*?)\n### REGRAS", prompt, re.S)
+    pares = re.findall(r"^\W*(.+?)\s*->\s*([0-9]{2}|[VX])\b", m.group(1) if m else "", re.M)
+    return {termo.strip().lower(): codigo for termo, codigo in pares}
+
+def codigos_das_opcoes(texto):
+    return re.findall(r"- Código: (\S+) \|", texto)
+
+def responder_escolha(prompt):
+    """escolha_cid (um termo): um dos códigos oferecidos."""
+    termo = re.search(r'TERMO EXTRAÍDO: "([^"]*)"', prompt)
+    termo = termo.group(1) if termo else ""
+    codigos = codigos_das_opcoes(prompt)
+    if not codigos:
+        return {"codigo": None, "reasoning": "Nenhuma opção oferecida."}
+    codigo = escolher(codigos, "escolha", termo, *codigos)
+    return {"codigo": codigo, "reasoning": f"Opção simulada para '{termo}'."}
+
+def responder_escolha_lote(prompt):
+    """escolha_cid (em lote): {termo: {"codigo", "reasoning"}} para cada bloco do prompt."""
+    resposta = {}
+    for bloco in re.split(r"\n\s*\d+\. (?=TERMO EXTRAÍDO)", prompt)[1:]:
+        resposta_termo = responder_escolha(bloco)
+        termo = re.search(r'TERMO EXTRAÍDO: "([^"]*)"', bloco).group(1)
+        resposta[termo] = resposta_termo
+    return resposta
+
+def responder_auditoria(prompt):
+    """seleciona_labels: veredito do vínculo termo -> código."""
+    termo = re.search(r'TERMO EXTRAÍDO: "([^"]*)"', prompt)
+    codigo = re.search(r'CÓDIGO CID-11 ATRIBUÍDO: "([^"]*)"', prompt)
+    chave = (termo.group(1) if termo else "", codigo.group(1) if codigo else "")
+    m = re.search(r"(\[(?:'[^']*',?\s*)+\])", prompt)
+    motivos = ast.literal_eval(m.group(1)) if m else MOTIVOS_PADRAO
+    valido = fracao("auditoria", *chave) < FRACAO_VALIDOS
+    return {
+        "valido": valido,
+        "motivo_tecnico": None if valido else escolher(motivos, "motivo", *chave),
+        "analise_critica": f"Veredito simulado para '{chave[0]}' -> {chave[1]}.",
+    }
+
+def responder_texto(prompt, formato_json):
+    """Resposta de uma geração: JSON no formato da etapa reconhecida pelo prompt, ou texto."""
+    if "LISTA DE ENTIDADES PARA CLASSIFICAR" in prompt:
+        resposta = responder_classificacao(prompt)
+    elif "ANÁLISE MÉDICA PARA PROCESSAR" in prompt:
+        resposta = responder_formatacao(prompt)
+    elif "Auditor Médico" in prompt:
+        resposta = responder_auditoria(prompt)
+    elif "Para cada termo" in prompt:
+        resposta = responder_escolha_lote(prompt)
+    elif "OPÇÕES:" in prompt:
+        resposta = responder_escolha(prompt)
+    elif formato_json:
+        resposta = {}
+    else:
+        return f"Resposta simulada {hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]}."
+    return json.dumps(resposta, ensure_ascii=False)
+
+# --- LATÊNCIA E FALHAS ---
+
+class Latencia:
+    """Amostra tempos (s) de uma distribuição dada como "tipo:parâmetros" em ms."""
+    def __init__(self, especificacao):
+        tipo, *parametros = especificacao.split(":")
+        self.tipo = tipo
+        self.parametros = [float(p) for p in parametros]
+        esperados = {"fixa": 1, "normal": 2, "lognormal": 2, "exponencial": 1, "uniforme": 2, "zero": 0}
+        if esperados.get(tipo) != len(self.parametros):
+            raise ValueError(f"Latência inválida: {especificacao}")
+
+    def amostrar(self, rng):
+        p = self.parametros
+        if self.tipo == "zero":
+            ms = 0.0
+        elif self.tipo == "fixa":
+            ms = p[0]
+        elif self.tipo == "normal":
+            ms = rng.gauss(p[0], p[1])
+        elif self.tipo == "lognormal":
+            ms = p[0] * math.exp(rng.gauss(0, p[1]))
+        elif self.tipo == "exponencial":
+            ms = rng.expovariate(1 / p[0])
+        else:
+            ms = rng.uniform(p[0], p[1])
+        return max(ms, 0.0) / 1000
+
+class Simulador:
+    """Estado do servidor: latências, falhas, semáforo de paralelismo e contadores."""
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.semente)
+        self.lock = threading.Lock()
+        self.vagas = threading.Semaphore(args.paralelo)
+        self.latencias = {
+            "geracao": Latencia("zero" if args.sem_latencia else args.latencia_geracao),
+            "embedding": Latencia("zero" if args.sem_latencia else args.latencia_embedding),
+        }
+        self.requisicoes = Counter()
+        self.falhas = Counter()
+        self.tokens_entrada = 0
+        self.tokens_saida = 0
+        self.textos_embedding = 0
+
+    def sortear(self, taxa):
+        with self.lock:
+            return self.rng.random() < taxa
+
+    def falha(self):
+        """Falha a injetar nesta requisição (ou None), na ordem: erro, desconexão, lentidão, JSON inválido."""
+        for nome, taxa in (("erro", self.args.taxa_erro), ("desconexao", self.args.taxa_desconexao),
+                           ("lenta", self.args.taxa_lenta), ("json_invalido", self.args.taxa_json_invalido)):
+            if taxa and self.sortear(taxa):
+                with self.lock:
+                    self.falhas[nome] += 1
+                return nome
+        return None
+
+    def esperar(self, tipo, unidades, ms_por_unidade, lenta):
+        with self.lock:
+            segundos = self.latencias[tipo].amostrar(self.rng)
+        segundos += unidades * ms_por_unidade / 1000
+        if lenta:
+            segundos += self.args.atraso_lento
+        time.sleep(segundos)
+        return segundos
+
+    def estatisticas(self):
+        with self.lock:
+            return {
+                "requisicoes": dict(self.requisicoes),
+                "falhas": dict(self.falhas),
+                "tokens_entrada": self.tokens_entrada,
+                "tokens_saida": self.tokens_saida,
+                "textos_embedding": self.textos_embedding,
+            }
+
+def criar_handler(sim):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, como o cliente compartilhado espera
+
+        def _responder(self, codigo, corpo):
+            dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            if self.path == "/api/version":
+                self._responder(200, {"version": "0.0.0-simulado"})
+            elif self.path == "/api/tags":
+                self._responder(200, {"models": []})
+            elif self.path == "/estatisticas":
+                self._responder(200, sim.estatisticas())
+            else:
+                self._responder(404, {"error": f"caminho desconhecido: {self.path}"})
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length", 0))
+            try:
+                dados = json.loads(self.rfile.read(tamanho) or b"{}")
+            except json.JSONDecodeError:
+                self._responder(400, {"error": "corpo não é JSON"})
+                return
+            rotas = {
+                "/api/generate": self._gerar,
+                "/api/chat": self._chat,
+                "/api/embeddings": self._embeddings,
+                "/api/embed": self._embed,
+            }
+            if self.path not in rotas:
+                self._responder(404, {"error": f"caminho desconhecido: {self.path}"})
+                return
+            with sim.lock:
+                sim.requisicoes[self.path] += 1
+
+            falha = sim.falha()
+            if falha == "erro":
+                self._responder(500, {"error": "falha simulada"})
+                return
+            if falha == "desconexao":
+                self.close_connection = True
+                return
+            with sim.vagas:
+                rotas[self.path](dados, falha == "lenta", falha == "json_invalido")
+
+        def _geracao(self, dados, prompt, lenta, json_invalido):
+            texto = responder_texto(prompt, dados.get("format") == "json")
+            if json_invalido:
+                texto = texto[:max(1, len(texto) // 2)]
+            entrada, saida = contar_tokens(prompt), contar_tokens(texto)
+            duracao = sim.esperar("geracao", saida, sim.args.ms_por_token, lenta)
+            with sim.lock:
+                sim.tokens_entrada += entrada
+                sim.tokens_saida += saida
+            return texto, {
+                "model": dados.get("model", ""),
+                "done": True,
+                "total_duration": int(duracao * 1e9),
+                "prompt_eval_count": entrada,
+                "eval_count": saida,
+            }
+
+        def _gerar(self, dados, lenta, json_invalido):
+            texto, extras = self._geracao(dados, dados.get("prompt", ""), lenta, json_invalido)
+            self._responder(200, {"response": texto, **extras})
+
+        def _chat(self, dados, lenta, json_invalido):
+            mensagens = [m.get("content", "") for m in dados.get("messages", []) if m.get("role") == "user"]
+            texto, extras = self._geracao(dados, mensagens[-1] if mensagens else "", lenta, json_invalido)
+            self._responder(200, {"message": {"role": "assistant", "content": texto}, **extras})
+
+        def _vetores(self, dados, textos, lenta):
+            sim.esperar("embedding", len(textos), sim.args.ms_por_texto, lenta)
+            with sim.lock:
+                sim.textos_embedding += len(textos)
+            return [embedding(t, dados.get("model", ""), sim.args.dimensao) for t in textos]
+
+        def _embeddings(self, dados, lenta, json_invalido):
+            self._responder(200, {"embedding": self._vetores(dados, [dados.get("prompt", "")], lenta)[0]})
+
+        def _embed(self, dados, lenta, json_invalido):
+            entrada = dados.get("input", [])
+            textos = [entrada] if isinstance(entrada, str) else entrada
+            self._responder(200, {"model": dados.get("model", ""), "embeddings": self._vetores(dados, textos, lenta)})
+
+        def log_message(self, formato, *args):
+            pass  # sem uma linha por requisição
+
+    return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ollama simulado e determinístico para benchmarks e testes sem modelos.")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    parser.add_argument("--dimensao", type=int, default=DIMENSAO_EMBEDDING, help="Dimensão dos embeddings.")
+    parser.add_argument("--paralelo", type=int, default=PARALELO, help="Requisições atendidas ao mesmo tempo (OLLAMA_NUM_PARALLEL).")
+    parser.add_argument("--latencia-geracao", default=LATENCIA_GERACAO, help="Distribuição de /api/generate e /api/chat (ms).")
+    parser.add_argument("--latencia-embedding", default=LATENCIA_EMBEDDING, help="Distribuição de /api/embeddings e /api/embed (ms).")
+    parser.add_argument("--ms-por-token", type=float, default=MS_POR_TOKEN_GERADO, help="Custo extra por token gerado.")
+    parser.add_argument("--ms-por-texto", type=float, default=MS_POR_TEXTO_EMBEDDING, help="Custo extra por texto embutido.")
+    parser.add_argument("--sem-latencia", action="store_true", help="Responde imediatamente (só o custo do servidor).")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de requisições com HTTP 500.")
+    parser.add_argument("--taxa-desconexao", type=float, default=0.0, help="Fração de conexões fechadas sem resposta.")
+    parser.add_argument("--taxa-lenta", type=float, default=0.0, help="Fração de requisições com --atraso-lento extra.")
+    parser.add_argument("--atraso-lento", type=float, default=150.0, help="Atraso extra (s) das requisições lentas (acima dos timeouts).")
+    parser.add_argument("--taxa-json-invalido", type=float, default=0.0, help="Fração de gerações com o JSON truncado.")
+    parser.add_argument("--semente", type=int, default=0, help="Semente das latências e das falhas.")
+    args = parser.parse_args()
+    for tipo in ("latencia_geracao", "latencia_embedding"):
+        Latencia(getattr(args, tipo))  # valida a especificação antes de subir
+
+    sim = Simulador(args)
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.porta), criar_handler(sim))
+    servidor.daemon_threads = True
+    print(f"Ollama simulado em http://127.0.0.1:{args.porta} | paralelo {args.paralelo} | "
+          f"geração {sim.latencias['geracao'].tipo}, embedding {sim.latencias['embedding'].tipo} | "
+          f"falhas: erro {args.taxa_erro}, desconexão {args.taxa_desconexao}, lenta {args.taxa_lenta}, "
+          f"JSON inválido {args.taxa_json_invalido}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        print(json.dumps(sim.estatisticas(), ensure_ascii=False, indent=2))
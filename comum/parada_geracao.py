@@ -0,0 +1,97 @@
+import threading
+import torch
+from transformers import StoppingCriteria
+
+from comum.json_restrito import texto_dos_tokens
+
+# Parada antecipada da geração no transformers: o texto de cada linha do lote é acompanhado
+# token a token e a linha é dada como concluída assim que a resposta está completa, sem
+# esperar o EOS nem o max_new_tokens (o modelo costuma continuar escrevendo depois do JSON).
+#   "json"   a profundidade de {} / [] volta a zero depois do primeiro que abriu (ignora
+#            os que estão dentro de strings);
+#   "lista"  a lista 'termo -> código' termina numa linha vazia ou numa linha sem '->',
+#            ou quando o modelo responde "Nenhum termo enquadrável".
+
+FORMATOS = ("json", "lista")
+FRASE_SEM_TERMOS = "nenhum termo enquadrável"
+
+class ParadaRespostaCompleta(StoppingCriteria):
+    """StoppingCriteria por linha do lote; guarda quantos tokens cada resposta precisou."""
+    def __init__(self, tokenizer, n_linhas, inicio_geracao, ids_fim, formato="json"):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato de parada desconhecido: {formato}")
+        self.textos = texto_dos_tokens(tokenizer)
+        self.formato = formato
+        self.inicio = inicio_geracao
+        self.ids_fim = set(ids_fim)
+        self.estados = [{"profundidade": 0, "aberto": False, "string": False, "escape": False,
+                         "linha": "", "itens": 0} for _ in range(n_linhas)]
+        self.necessarios = [None] * n_linhas
+
+    def _fim_json(self, e, c):
+        if e["string"]:
+            if e["escape"]:
+                e["escape"] = False
+            elif c == "\\":
+                e["escape"] = True
+            elif c == '"':
+                e["string"] = False
+        elif c in "{[":
+            e["profundidade"] += 1
+            e["aberto"] = True
+        elif e["aberto"] and c in "}]":
+            e["profundidade"] -= 1
+            return e["profundidade"] == 0
+        elif e["aberto"] and c == '"':
+            e["string"] = True
+        return False
+
+    def _fim_lista(self, e, c):
+        if c != "\n":
+            e["linha"] += c
+            return FRASE_SEM_TERMOS in e["linha"].lower()
+        linha, e["linha"] = e["linha"].strip(), ""
+        if "->" in linha:
+            e["itens"] += 1
+            return False
+        # Linha vazia ou texto solto depois dos itens: a lista acabou
+        return e["itens"] > 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        gerados = input_ids.shape[1] - self.inicio
+        concluidos = []
+        for linha, e in enumerate(self.estados):
+            if self.necessarios[linha] is None and gerados > 0:
+                token_id = input_ids[linha, -1].item()
+                fim = self._fim_json if self.formato == "json" else self._fim_lista
+                if token_id in self.ids_fim or any(fim(e, c) for c in self.textos[token_id]):
+                    self.necessarios[linha] = gerados
+            concluidos.append(self.necessarios[linha] is not None)
+        return torch.tensor(concluidos, dtype=torch.bool, device=input_ids.device)
+
+class ContagemTokens:
+    """Acumula, por geração, os tokens gerados, os necessários e o limite (max_new_tokens)."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.respostas = 0
+        self.gerados = 0
+        self.necessarios = 0
+        self.limite = 0
+
+    def registrar(self, parada, n_gerados, limite):
+        """Registra um lote; retorna a linha de log (gerados x necessários) dessa geração."""
+        necessarios = [n if n is not None else n_gerados for n in parada.necessarios]
+        with self.lock:
+            self.respostas += len(necessarios)
+            self.gerados += n_gerados * len(necessarios)
+            self.necessarios += sum(necessarios)
+            self.limite += limite * len(necessarios)
+        return (f"{n_gerados} tokens gerados por resposta | necessários {min(necessarios)}-{max(necessarios)} "
+                f"| limite {limite}")
+
+    def resumo(self):
+        if not self.respostas:
+            return "Parada antecipada: nenhuma geração."
+        economia = (1 - self.gerados / self.limite) * 100 if self.limite else 0
+        return (f"Parada antecipada: {self.respostas} respostas | {self.gerados} tokens gerados, "
+                f"{self.necessarios} necessários, limite {self.limite} ({economia:.1f}% do limite evitado)")
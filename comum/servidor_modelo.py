@@ -0,0 +1,200 @@
+import collections
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# --- CONFIGURAÇÕES ---
+# Endereço do servidor de modelo local (ex: http://localhost:8765). Com ele definido, as
+# etapas do MedGemma mandam as gerações para o servidor em vez de carregar o modelo.
+SERVIDOR_MODELO = os.environ.get("MEDGEMMA_SERVIDOR", "")
+PORTA_PADRAO = 8765
+JANELA_MICROLOTE = 0.02   # segundos esperando outros pedidos da mesma operação
+MAX_PEDIDOS_LOTE = 16     # pedidos juntados num microlote
+
+# Servidor de inferência de longa duração: o modelo é carregado uma vez por máquina e
+# atendido por HTTP em localhost. Os pedidos entram numa fila única; uma thread os junta
+# em microlotes (mesma operação, até MAX_PEDIDOS_LOTE ou JANELA_MICROLOTE) e chama a
+# função da operação com a lista inteira, então um só processo usa a GPU/CPU por vez.
+
+class Pedido:
+    def __init__(self, operacao, dados):
+        self.operacao = operacao
+        self.dados = dados
+        self.chegada = time.monotonic()
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+class ServidorModelo:
+    """
+    operacoes: {nome: funcao} onde funcao(lista de dados) -> lista de resultados (mesma ordem).
+    validacoes: {nome: funcao(dados)} opcional, que levanta ValueError para pedidos inválidos.
+    resumos: funções sem argumentos cujas linhas entram no /status (ex: contadores das etapas).
+    """
+    def __init__(self, operacoes, validacoes=None, resumos=(), janela=JANELA_MICROLOTE,
+                 max_pedidos=MAX_PEDIDOS_LOTE):
+        self.operacoes = operacoes
+        self.validacoes = validacoes or {}
+        self.resumos = list(resumos)
+        self.janela = janela
+        self.max_pedidos = max_pedidos
+        self.fila = queue.Queue()
+        self.adiados = collections.deque()  # pedidos de outra operação que chegaram durante um microlote
+
+        self.lock = threading.Lock()
+        self.pedidos = 0
+        self.lotes = 0
+        self.erros = 0
+        self.espera = 0.0
+        self.tempo_execucao = 0.0
+
+    def enfileirar(self, operacao, dados):
+        """Coloca o pedido na fila e espera o resultado (levanta a exceção da operação, se houver)."""
+        if operacao in self.validacoes:
+            self.validacoes[operacao](dados)
+        pedido = Pedido(operacao, dados)
+        self.fila.put(pedido)
+        pedido.evento.wait()
+        if pedido.erro:
+            raise pedido.erro
+        return pedido.resultado
+
+    def _proximo_lote(self):
+        primeiro = self.adiados.popleft() if self.adiados else self.fila.get()
+        lote = [p for p in self.adiados if p.operacao == primeiro.operacao][:self.max_pedidos - 1]
+        for p in lote:
+            self.adiados.remove(p)
+        lote.insert(0, primeiro)
+
+        prazo = time.monotonic() + self.janela
+        while len(lote) < self.max_pedidos:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                pedido = self.fila.get(timeout=restante)
+            except queue.Empty:
+                break
+            (lote if pedido.operacao == primeiro.operacao else self.adiados).append(pedido)
+        return lote
+
+    def _despachar(self):
+        while True:
+            lote = self._proximo_lote()
+            inicio = time.monotonic()
+            try:
+                resultados = self.operacoes[lote[0].operacao]([p.dados for p in lote])
+                for pedido, resultado in zip(lote, resultados):
+                    pedido.resultado = resultado
+            except Exception as e:
+                print(f" [servidor] Erro em {lote[0].operacao} ({len(lote)} pedidos): {e}")
+                for pedido in lote:
+                    pedido.erro = e
+            fim = time.monotonic()
+            with self.lock:
+                self.lotes += 1
+                self.pedidos += len(lote)
+                self.erros += sum(1 for p in lote if p.erro)
+                self.espera += sum(inicio - p.chegada for p in lote)
+                self.tempo_execucao += fim - inicio
+            for pedido in lote:
+                pedido.evento.set()
+
+    def status(self):
+        with self.lock:
+            return {
+                "pedidos": self.pedidos,
+                "lotes": self.lotes,
+                "erros": self.erros,
+                "pedidos_por_lote": round(self.pedidos / self.lotes, 2) if self.lotes else 0,
+                "espera_media_s": round(self.espera / self.pedidos, 4) if self.pedidos else 0,
+                "execucao_media_s": round(self.tempo_execucao / self.lotes, 4) if self.lotes else 0,
+                "na_fila": self.fila.qsize() + len(self.adiados),
+                "resumos": [resumo() for resumo in self.resumos],
+            }
+
+    def servir(self, porta=PORTA_PADRAO, host="127.0.0.1"):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _responder(self, codigo, corpo):
+                dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+                self.send_response(codigo)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def do_GET(self):
+                if self.path == "/status":
+                    self._responder(200, servidor.status())
+                else:
+                    self._responder(404, {"erro": f"Caminho desconhecido: {self.path}"})
+
+            def do_POST(self):
+                operacao = self.path.strip("/")
+                if operacao not in servidor.operacoes:
+                    self._responder(404, {"erro": f"Operação desconhecida: {operacao}"})
+                    return
+                try:
+                    tamanho = int(self.headers.get("Content-Length", 0))
+                    dados = json.loads(self.rfile.read(tamanho) or b"{}")
+                    self._responder(200, servidor.enfileirar(operacao, dados))
+                except ValueError as e:
+                    self._responder(400, {"erro": str(e)})
+                except Exception as e:
+                    self._responder(500, {"erro": f"{type(e).__name__}: {e}"})
+
+            def log_message(self, formato, *args):
+                pass  # sem uma linha por requisição
+
+        threading.Thread(target=self._despachar, name="despachante", daemon=True).start()
+        http = ThreadingHTTPServer((host, porta), Handler)
+        http.daemon_threads = True
+        print(f"Servidor de modelo em http://{host}:{porta} (microlotes de até {self.max_pedidos} pedidos, "
+              f"janela de {self.janela * 1000:.0f} ms)")
+        try:
+            http.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            http.server_close()
+            print(json.dumps(self.status(), ensure_ascii=False, indent=2))
+
+class ClienteServidorModelo:
+    """Cliente das etapas: uma sessão keep-alive por processo, compartilhada pelas threads."""
+    def __init__(self, base_url=SERVIDOR_MODELO):
+        self.base_url = base_url.rstrip("/")
+        self.sessao = requests.Session()
+
+    def chamar(self, operacao, dados, timeout=1800):
+        response = self.sessao.post(f"{self.base_url}/{operacao}", json=dados, timeout=timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"Servidor de modelo ({operacao}): {response.json().get('erro', response.text)}")
+        return response.json()
+
+    def resumo(self):
+        try:
+            status = self.sessao.get(f"{self.base_url}/status", timeout=10).json()
+        except requests.RequestException as e:
+            return f"Servidor de modelo {self.base_url} indisponível: {e}"
+        linhas = [f"Servidor de modelo {self.base_url}: {status['pedidos']} pedidos em {status['lotes']} microlotes "
+                  f"({status['pedidos_por_lote']} por lote) | espera média {status['espera_media_s']}s | "
+                  f"{status['erros']} erros"]
+        return "\n".join(linhas + status["resumos"])
+
+clientes = {}
+lock_clientes = threading.Lock()
+
+def cliente_servidor(base_url=None):
+    """Cliente compartilhado por endereço (as duas etapas do MedGemma podem usar o mesmo servidor)."""
+    base_url = base_url or SERVIDOR_MODELO
+    with lock_clientes:
+        if base_url not in clientes:
+            clientes[base_url] = ClienteServidorModelo(base_url)
+        return clientes[base_url]
@@ -0,0 +1,298 @@
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from comum.cliente_ollama import OLLAMA_MAX_EM_VOO
+from comum.servidor_modelo import cliente_servidor
+
+# --- CONFIGURAÇÕES ---
+# Executar a partir da raiz do projeto (mesmos caminhos relativos das etapas isoladas)
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+BACKENDS = ("llama3", "medgemma")
+ETAPAS = ("classifica_entidades", "busca_embedding", "escolha_cid", "seleciona_labels")
+TAMANHO_FILA = 16  # prontuários aguardando entre uma etapa e a seguinte
+JANELA_LOTE = 0.05  # segundos esperando a fila encher para formar um lote (etapas em lote)
+
+# Pipeline em fluxo: cada prontuário passa por classifica -> busca -> escolha -> auditoria
+# em memória. As etapas são ligadas por filas limitadas e rodam ao mesmo tempo, cada uma
+# com suas threads; os JSONs intermediários só são gravados com --salvar-intermediarios.
+
+FIM = object()
+
+def carregar_etapa(backend, etapa):
+    """
+    Importa processamento_{backend}/{etapa}/{etapa}.py com um nome próprio, para que
+    as duas variantes de uma mesma etapa possam coexistir no processo.
+    Só as etapas escolhidas são importadas (as do MedGemma carregam o modelo na primeira geração).
+    """
+    caminho = os.path.join(RAIZ, f"processamento_{backend}", etapa, f"{etapa}.py")
+    spec = importlib.util.spec_from_file_location(f"{backend}_{etapa}", caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+def pasta_saida(modulo):
+    """Pasta onde a etapa isolada grava seus resultados (usada para os intermediários)."""
+    for nome in ("PASTA_SAIDA", "PASTA_FINAL", "PASTA_AUDITADA"):
+        if hasattr(modulo, nome):
+            return getattr(modulo, nome)
+    return None
+
+# Função de cada etapa que processa um prontuário (dict) em memória e o devolve
+FUNCOES_ETAPA = {
+    "classifica_entidades": "classificar_prontuario",
+    "busca_embedding": "buscar_prontuario",
+    "escolha_cid": "refinar_prontuario",
+    "seleciona_labels": "auditar_prontuario",
+}
+
+# Versão em lote (lista de prontuários -> (índice, dados) por prontuário pronto), usada pelo
+# MedGemma local: os prontuários da fila são agrupados por comprimento numa só geração
+FUNCOES_LOTE = {
+    "classifica_entidades": "classificar_lote",
+}
+
+def gravar_json(pasta, nome_arquivo, dados):
+    with open(os.path.join(pasta, nome_arquivo), 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+
+class Etapa:
+    """
+    Uma etapa do pipeline: N threads lendo da fila de entrada e escrevendo na de saída.
+    Com funcao_lote, cada thread tira da fila até tamanho_lote prontuários e os processa juntos.
+    """
+    def __init__(self, nome, backend, funcao, workers, pasta_intermediaria=None, funcao_lote=None, tamanho_lote=1):
+        self.nome = nome
+        self.backend = backend
+        self.funcao = funcao
+        self.workers = workers
+        self.pasta_intermediaria = pasta_intermediaria
+        self.funcao_lote = funcao_lote
+        self.tamanho_lote = tamanho_lote if funcao_lote else 1
+        self.lotes = 0
+        self.lock = threading.Lock()
+        self.ativos = workers
+        self.processados = 0
+        self.erros = 0
+        self.tempo = 0.0
+
+    def _coletar(self, entrada):
+        """Espera um item e junta os que chegarem em até JANELA_LOTE, até tamanho_lote (FIM encerra a coleta)."""
+        itens = [entrada.get()]
+        prazo = time.monotonic() + JANELA_LOTE
+        while itens[-1] is not FIM and len(itens) < self.tamanho_lote:
+            try:
+                itens.append(entrada.get(timeout=max(prazo - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return itens
+
+    def _entregar(self, nome_arquivo, dados, saida):
+        if self.pasta_intermediaria:
+            gravar_json(self.pasta_intermediaria, nome_arquivo, dados)
+        with self.lock:
+            self.processados += 1
+        saida.put((nome_arquivo, dados))
+
+    def _processar(self, nome_arquivo, dados, saida):
+        inicio = time.monotonic()
+        try:
+            dados = self.funcao(dados)
+            self._entregar(nome_arquivo, dados, saida)
+        except Exception as e:
+            print(f" [{self.nome}] Erro em {nome_arquivo}, prontuário descartado: {e}")
+            with self.lock:
+                self.erros += 1
+        finally:
+            with self.lock:
+                self.tempo += time.monotonic() - inicio
+
+    def _processar_lote(self, itens, saida):
+        inicio = time.monotonic()
+        pendentes = dict(enumerate(itens))
+        try:
+            for i, dados in self.funcao_lote([dados for _, dados in itens]):
+                nome_arquivo, _ = pendentes.pop(i)
+                self._entregar(nome_arquivo, dados, saida)
+        except Exception as e:
+            nomes = ", ".join(nome for nome, _ in pendentes.values())
+            print(f" [{self.nome}] Erro no lote de {len(itens)}, prontuários descartados ({nomes}): {e}")
+            with self.lock:
+                self.erros += len(pendentes)
+        finally:
+            with self.lock:
+                self.lotes += 1
+                self.tempo += time.monotonic() - inicio
+
+    def _trabalhar(self, entrada, saida):
+        while True:
+            itens = self._coletar(entrada)
+            fim = itens[-1] is FIM
+            if fim:
+                itens.pop()
+
+            if self.funcao_lote:
+                if itens:
+                    self._processar_lote(itens, saida)
+            else:
+                for nome_arquivo, dados in itens:
+                    self._processar(nome_arquivo, dados, saida)
+
+            if fim:
+                # Devolve o sinal para os outros workers da etapa; o último avisa a próxima
+                entrada.put(FIM)
+                with self.lock:
+                    self.ativos -= 1
+                    ultimo = self.ativos == 0
+                if ultimo:
+                    saida.put(FIM)
+                return
+
+    def iniciar(self, entrada, saida):
+        threads = [
+            threading.Thread(target=self._trabalhar, args=(entrada, saida), name=f"{self.nome}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in threads:
+            t.start()
+        return threads
+
+    def resumo(self):
+        media = self.tempo / max(self.processados + self.erros, 1)
+        lotes = f", {self.lotes} lotes de até {self.tamanho_lote}" if self.funcao_lote else ""
+        return (f"[{self.nome} / {self.backend}] {self.processados} prontuários, {self.erros} erros | "
+                f"{media:.2f}s por prontuário em {self.workers} worker(s){lotes}")
+
+def persistir_a_cada(funcao, cache, n):
+    """
+    Envolve a função da busca para gravar o cache de embeddings a cada n prontuários,
+    como a etapa isolada faz por janela: uma interrupção não perde os embeddings já pagos.
+    """
+    contador = itertools.count(1)
+    def envolvida(dados):
+        dados = funcao(dados)
+        if next(contador) % n == 0:
+            cache.persistir()
+        return dados
+    return envolvida
+
+def produzir(pasta_entrada, arquivos, fila):
+    for nome_arquivo in arquivos:
+        try:
+            with open(os.path.join(pasta_entrada, nome_arquivo), 'r', encoding='utf-8') as f:
+                fila.put((nome_arquivo, json.load(f)))
+        except Exception as e:
+            print(f" Erro ao ler {nome_arquivo}, ignorado: {e}")
+    fila.put(FIM)
+
+def executar(backends, pasta_entrada=None, pasta_final=None, salvar_intermediarios=False,
+             workers=OLLAMA_MAX_EM_VOO, tamanho_fila=TAMANHO_FILA, usar_cache=True, modo_busca=None, nprobe=None):
+    """
+    backends: {etapa: "llama3" | "medgemma"} para cada uma das quatro etapas.
+    modo_busca/nprobe: sobrescrevem MODO_BUSCA/NPROBE do busca_embedding (None = padrão da etapa).
+    """
+    modulos = {etapa: carregar_etapa(backends[etapa], etapa) for etapa in ETAPAS}
+
+    busca = modulos["busca_embedding"]
+    if modo_busca:
+        busca.MODO_BUSCA = modo_busca
+    if nprobe:
+        busca.NPROBE = nprobe
+    if usar_cache:
+        busca.cache_embeddings = busca.CacheEmbeddings()
+
+    pasta_entrada = pasta_entrada or modulos["classifica_entidades"].PASTA_ENTRADA
+    pasta_final = pasta_final or pasta_saida(modulos["seleciona_labels"])
+    if not os.path.exists(pasta_final): os.makedirs(pasta_final)
+
+    etapas = []
+    for etapa in ETAPAS:
+        intermediaria = pasta_saida(modulos[etapa]) if salvar_intermediarios and etapa != ETAPAS[-1] else None
+        if intermediaria and not os.path.exists(intermediaria): os.makedirs(intermediaria)
+        # O MedGemma local roda em uma GPU: uma thread por etapa, em lotes se a etapa os tiver.
+        # Com o servidor de modelo (MEDGEMMA_SERVIDOR), várias threads alimentam os microlotes
+        # dele, como as do Ollama.
+        local = getattr(modulos[etapa], "SERVIDOR_MODELO", None) == ""
+        medgemma_local = backends[etapa] == "medgemma" and local
+        funcao_lote = getattr(modulos[etapa], FUNCOES_LOTE.get(etapa, ""), None) if medgemma_local else None
+        funcao = getattr(modulos[etapa], FUNCOES_ETAPA[etapa])
+        if etapa == "busca_embedding" and busca.cache_embeddings:
+            funcao = persistir_a_cada(funcao, busca.cache_embeddings, busca.JANELA_PRONTUARIOS)
+        etapas.append(Etapa(etapa, backends[etapa], funcao, 1 if medgemma_local else workers, intermediaria,
+                            funcao_lote, getattr(modulos[etapa], "TAMANHO_LOTE_MAX", 1)))
+
+    arquivos = sorted(f for f in os.listdir(pasta_entrada) if f.endswith('.json'))
+    print(f"Pipeline em fluxo: {len(arquivos)} prontuários de {pasta_entrada} -> {pasta_final}")
+    print("   " + " -> ".join(f"{e.nome} ({e.backend})" for e in etapas) + "\n")
+
+    try:
+        inicio = time.monotonic()
+        filas = [queue.Queue(tamanho_fila) for _ in range(len(etapas) + 1)]
+        threading.Thread(target=produzir, args=(pasta_entrada, arquivos, filas[0]), daemon=True).start()
+        for etapa, entrada, saida in zip(etapas, filas, filas[1:]):
+            etapa.iniciar(entrada, saida)
+
+        concluidos = 0
+        while True:
+            item = filas[-1].get()
+            if item is FIM:
+                break
+            nome_arquivo, dados = item
+            gravar_json(pasta_final, nome_arquivo, dados)
+            concluidos += 1
+            print(f"[{concluidos}/{len(arquivos)}] Concluído: {nome_arquivo} ({len(dados.get('labels', {}))} labels)")
+
+        duracao = time.monotonic() - inicio
+        print(f"\n{concluidos} de {len(arquivos)} prontuários em {duracao:.1f}s "
+              f"({concluidos / max(duracao, 1e-9):.2f} prontuários/s)")
+        for etapa in etapas:
+            print(etapa.resumo())
+        servidores = {getattr(m, "SERVIDOR_MODELO", "") for m in modulos.values()} - {""}
+        for modulo in modulos.values():
+            if hasattr(modulo, "cliente"):
+                print(modulo.cliente.resumo())
+            if getattr(modulo, "cache_decisoes", None):
+                print(modulo.cache_decisoes.resumo())
+            if getattr(modulo, "indice_lexico", None):
+                print(f"{modulo.indice_lexico.resumo()} (buscas vetoriais evitadas)")
+            if getattr(modulo, "escolhas_evitadas", 0):
+                print(f"[escolha_cid] {modulo.escolhas_evitadas} escolhas evitadas pelo índice léxico")
+            if hasattr(modulo, "contagem_tokens") and not modulo.SERVIDOR_MODELO:
+                print(modulo.contagem_tokens.resumo())
+            if getattr(modulo, "auditorias_puladas", 0):
+                print(f"[seleciona_labels] {modulo.auditorias_puladas} auditorias evitadas pelo cache de decisões")
+        for servidor in servidores:
+            print(cliente_servidor(servidor).resumo())
+        if busca.cache_embeddings:
+            print(busca.cache_embeddings.resumo())
+    finally:
+        # Também em erro ou Ctrl-C: grava o que falta do cache de embeddings
+        if busca.cache_embeddings:
+            busca.cache_embeddings.fechar()
+            busca.cache_embeddings = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Executa as quatro etapas do pipeline em fluxo, sem pastas intermediárias.")
+    parser.add_argument("--backend", choices=BACKENDS, default="llama3", help="Backend padrão de todas as etapas.")
+    for etapa in ETAPAS:
+        parser.add_argument(f"--{etapa.split('_')[0]}", choices=BACKENDS, help=f"Backend da etapa {etapa}.")
+    parser.add_argument("--entrada", help="Pasta de prontuários (padrão: a do classifica_entidades escolhido).")
+    parser.add_argument("--saida", help="Pasta dos prontuários auditados (padrão: a do seleciona_labels escolhido).")
+    parser.add_argument("--salvar-intermediarios", action="store_true", help="Grava também a saída de cada etapa na pasta de costume.")
+    parser.add_argument("--workers", type=int, default=OLLAMA_MAX_EM_VOO, help="Threads por etapa que usa o Ollama.")
+    parser.add_argument("--fila", type=int, default=TAMANHO_FILA, help="Capacidade das filas entre as etapas.")
+    parser.add_argument("--sem-cache", action="store_true", help="Não usa o cache de embeddings de consulta.")
+    parser.add_argument("--modo-busca", choices=("capitulo", "global", "vizinhos"), help="Modo do busca_embedding (padrão: o da etapa).")
+    parser.add_argument("--nprobe", type=int, help="Grupos do índice global visitados por consulta (padrão: o da etapa).")
+    args = parser.parse_args()
+
+    backends = {etapa: getattr(args, etapa.split('_')[0]) or args.backend for etapa in ETAPAS}
+    executar(backends, args.entrada, args.saida, args.salvar_intermediarios, args.workers, args.fila, not args.sem_cache,
+             args.modo_busca, args.nprobe)
@@ -1,113 +1,552 @@
+import argparse
+import hashlib
 import json
 import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
 import requests
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+
+# Raiz do projeto no path para o manifesto (comum/) e o índice aproximado (codigos_cid/indice_ann.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from comum.checkpoint import ManifestoEtapa, assinatura, hash_arquivo
+from codigos_cid.indice_ann import NOME_INDICE
+from codigos_cid.indice_lexico import ARQUIVO_INDICE as ARQUIVO_INDICE_LEXICO, ORIGEM_LEXICO, carregar_indice_lexico
 
 # --- CONFIGURAÇÕES ---
 OLLAMA_API_EMBED = "http://localhost:11434/api/embeddings"
+OLLAMA_API_EMBED_LOTE = "http://localhost:11434/api/embed"
 EMBED_MODEL = "mxbai-embed-large"
 PASTA_ENTRADA = "processamento/classifica_entidades/prontuarios_vazios_classificados"
 PASTA_SAIDA = "processamento/busca_embedding/prontuarios_vazios_busca"
 PASTA_BANCOS = "embedding_cid"
 
-# Cache para evitar ler o mesmo arquivo de capítulo várias vezes no mesmo processo
+# Cache dos embeddings de consulta, compartilhado entre execuções e entre as variantes do pipeline
+ARQUIVO_CACHE_EMBEDDINGS = "embedding_cid/cache_consultas.sqlite"
+CAPACIDADE_CACHE_MEMORIA = 4096
+
+# Embeddings de consulta em lote: prontuários lidos por janela e textos por chamada ao /api/embed
+JANELA_PRONTUARIOS = 8
+TAMANHO_LOTE_EMBED = 64
+
+# Onde procurar as opções de cada termo:
+#   "capitulo"  apenas no capítulo atribuído pelo classifica_entidades (busca exata)
+#   "global"    em toda a CID-11 pelo índice aproximado (codigos_cid/indice_ann.py construir)
+#   "vizinhos"  capítulo atribuído + vizinhos mais próximos de qualquer capítulo pelo índice
+# Sem o índice construído, "global" e "vizinhos" caem para a busca no capítulo (com um aviso)
+MODOS_BUSCA = ("capitulo", "global", "vizinhos")
+MODO_BUSCA = "capitulo"
+NPROBE = 8  # grupos do índice visitados por consulta: mais = mais recall, mais latência
+
+# Atalho léxico: termos que são exatamente um título da CID-11 (ou abreviação conhecida)
+# no capítulo atribuído não passam pela busca nem pela escolha da LLM
+# (codigos_cid/indice_lexico.py construir; sem o índice o atalho fica desligado)
+USAR_INDICE_LEXICO = True
+
+# Cache para evitar ler o mesmo arquivo de capítulo várias vezes no mesmo processo.
+# As matrizes são np.memmap somente leitura: o conteúdo fica no cache de páginas do
+# sistema, compartilhado entre processos, e não precisa ser descartado entre prontuários.
 cache_capitulos = {}
+lock_bancos = threading.Lock()  # carga/conversão de um banco por vez (as threads do pipeline.py disputam o mesmo capítulo)
+
+class CacheEmbeddings:
+    """
+    Cache endereçado por conteúdo: a chave é (modelo, texto exato da consulta).
+    Mantém um LRU limitado em memória na frente de um SQLite em disco e conta acertos e faltas.
+    Pode ser compartilhado entre threads (o pipeline.py roda as etapas em paralelo).
+    """
+    def __init__(self, caminho=ARQUIVO_CACHE_EMBEDDINGS, capacidade=CAPACIDADE_CACHE_MEMORIA):
+        pasta = os.path.dirname(caminho)
+        if pasta and not os.path.exists(pasta): os.makedirs(pasta)
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (chave TEXT PRIMARY KEY, vetor BLOB)")
+        self.conn.commit()
+        self.memoria = OrderedDict()
+        self.capacidade = capacidade
+        self.acertos_memoria = 0
+        self.acertos_disco = 0
+        self.faltas = 0
+
+    @staticmethod
+    def chave(modelo, texto):
+        return hashlib.sha256(f"{modelo}\0{texto}".encode("utf-8")).hexdigest()
+
+    def _lembrar(self, chave, vetor):
+        self.memoria[chave] = vetor
+        self.memoria.move_to_end(chave)
+        if len(self.memoria) > self.capacidade:
+            self.memoria.popitem(last=False)
+
+    def obter(self, modelo, texto):
+        with self.lock:
+            return self._obter(self.chave(modelo, texto))
+
+    def _obter(self, chave):
+        if chave in self.memoria:
+            self.memoria.move_to_end(chave)
+            self.acertos_memoria += 1
+            return self.memoria[chave]
+
+        linha = self.conn.execute("SELECT vetor FROM embeddings WHERE chave = ?", (chave,)).fetchone()
+        if linha:
+            vetor = np.frombuffer(linha[0], dtype=np.float32)
+            self._lembrar(chave, vetor)
+            self.acertos_disco += 1
+            return vetor
+
+        self.faltas += 1
+        return None
+
+    def salvar(self, modelo, texto, vetor):
+        chave = self.chave(modelo, texto)
+        vetor = np.asarray(vetor, dtype=np.float32)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", (chave, vetor.tobytes()))
+            self._lembrar(chave, vetor)
+
+    def resumo(self):
+        consultas = self.acertos_memoria + self.acertos_disco + self.faltas
+        taxa = (consultas - self.faltas) / consultas * 100 if consultas else 0
+        return (f"Cache de embeddings: {consultas} consultas | {self.acertos_memoria} em memória | "
+                f"{self.acertos_disco} em disco | {self.faltas} geradas pelo modelo | acerto {taxa:.1f}%")
+
+    def persistir(self):
+        with self.lock:
+            self.conn.commit()
+
+    def fechar(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+cache_embeddings = None
+indice_global = None  # False depois de uma tentativa de carga sem o índice construído
+indice_lexico = None
+lock_carga = threading.Lock()  # os índices são carregados uma única vez mesmo com várias threads (pipeline.py)
 
 def get_query_embedding(text):
-    """Gera o embedding para a busca usando o Ollama."""
+    """Gera o embedding para a busca usando o Ollama (consultando antes o cache, se ativo)."""
+    if cache_embeddings:
+        vetor = cache_embeddings.obter(EMBED_MODEL, text)
+        if vetor is not None:
+            return vetor
+
     payload = {"model": EMBED_MODEL, "prompt": text}
     try:
         response = requests.post(OLLAMA_API_EMBED, json=payload, timeout=60)
-        return response.json().get("embedding")
+        vetor = response.json().get("embedding")
     except Exception as e:
         print(f" Erro ao gerar embedding de busca: {e}")
         return None
 
-def carregar_banco(capitulo):
-    """Carrega o banco do capítulo para a memória (com cache)."""
-    if capitulo in cache_capitulos:
-        return cache_capitulos[capitulo]
-    
-    nome_arquivo = f"{capitulo}.jsonl" if os.path.exists(os.path.join(PASTA_BANCOS, f"{capitulo}.jsonl")) else f"{capitulo}.json"
-    caminho_banco = os.path.join(PASTA_BANCOS, nome_arquivo)
-    
-    if not os.path.exists(caminho_banco):
+    if not vetor:
         return None
+    vetor = np.asarray(vetor, dtype=np.float32)
+    if cache_embeddings:
+        cache_embeddings.salvar(EMBED_MODEL, text, vetor)
+    return vetor
+
+def montar_consulta(termo, contexto):
+    return f"Termo: {termo} | Contexto: {contexto}"
+
+def obter_embeddings_lote(textos):
+    """
+    Gera os embeddings de vários textos de consulta, retornando {texto: vetor}.
+    O que não está no cache vai ao Ollama em lotes de TAMANHO_LOTE_EMBED por chamada;
+    se um lote falhar, seus textos são tentados um a um.
+    """
+    vetores = {}
+    faltantes = []
+    for texto in dict.fromkeys(textos):
+        vetor = cache_embeddings.obter(EMBED_MODEL, texto) if cache_embeddings else None
+        if vetor is not None:
+            vetores[texto] = vetor
+        else:
+            faltantes.append(texto)
+
+    sessao = requests.Session()
+    for inicio in range(0, len(faltantes), TAMANHO_LOTE_EMBED):
+        lote = faltantes[inicio:inicio + TAMANHO_LOTE_EMBED]
+        try:
+            response = sessao.post(OLLAMA_API_EMBED_LOTE, json={"model": EMBED_MODEL, "input": lote}, timeout=300)
+            response.raise_for_status()
+            embeddings = response.json()["embeddings"]
+        except Exception as e:
+            print(f" Erro no lote de embeddings ({len(lote)} textos), tentando um a um: {e}")
+            for texto in lote:
+                vetor = get_query_embedding(texto)
+                if vetor is not None:
+                    vetores[texto] = vetor
+            continue
+
+        for texto, vetor in zip(lote, embeddings):
+            vetor = np.asarray(vetor, dtype=np.float32)
+            vetores[texto] = vetor
+            if cache_embeddings:
+                cache_embeddings.salvar(EMBED_MODEL, texto, vetor)
+    sessao.close()
+    return vetores
+
+def normalizar(matriz):
+    """Normaliza as linhas (norma L2 = 1) para que o produto interno seja o cosseno."""
+    matriz = np.ascontiguousarray(matriz, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
 
-    dados_capitulo = []
+def converter_banco_jsonl(capitulo, caminho_banco):
+    """
+    Converte um banco {capitulo}.jsonl antigo para o formato do banco_embedding.py
+    ({capitulo}.npy normalizado + {capitulo}.meta.jsonl). Feito uma única vez por banco.
+    """
+    metadados, vetores = [], []
     with open(caminho_banco, 'r', encoding='utf-8') as f:
         for linha in f:
             if linha.strip():
-                dados_capitulo.append(json.loads(linha))
-    
-    cache_capitulos[capitulo] = dados_capitulo
-    return dados_capitulo
+                item = json.loads(linha)
+                metadados.append({"id": item["id"], "text": item["text"], "hash": None})
+                vetores.append(item["embedding"])
+
+    if not vetores:
+        return False
+
+    caminho_matriz = os.path.join(PASTA_BANCOS, f"{capitulo}.npy")
+    caminho_meta = os.path.join(PASTA_BANCOS, f"{capitulo}.meta.jsonl")
+
+    # Temporários com nome único: outro processo pode estar convertendo o mesmo banco
+    descritor, temp_matriz = tempfile.mkstemp(dir=PASTA_BANCOS, prefix=f"{capitulo}.npy.", suffix=".tmp")
+    with os.fdopen(descritor, 'wb') as f:
+        np.save(f, normalizar(np.array(vetores, dtype=np.float32)))
+    descritor, temp_meta = tempfile.mkstemp(dir=PASTA_BANCOS, prefix=f"{capitulo}.meta.", suffix=".tmp")
+    with os.fdopen(descritor, 'w', encoding='utf-8') as f:
+        for meta in metadados:
+            f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+
+    # Metadados por último: a matriz já está no lugar quando o par fica visível
+    os.replace(temp_matriz, caminho_matriz)
+    os.replace(temp_meta, caminho_meta)
+    return True
+
+def carregar_banco(capitulo):
+    """
+    Carrega o banco do capítulo (com cache).
+    Retorna {"ids", "textos", "matriz"}, com a matriz float32 normalizada mapeada
+    do disco via np.memmap. Bancos {capitulo}.jsonl antigos são convertidos na primeira leitura.
+    """
+    if capitulo in cache_capitulos:
+        return cache_capitulos[capitulo]
+    with lock_bancos:
+        # Outra thread pode ter carregado (ou convertido) o banco enquanto esta esperava
+        if capitulo not in cache_capitulos:
+            banco = ler_banco(capitulo)
+            if not banco:
+                return None
+            cache_capitulos[capitulo] = banco
+        return cache_capitulos[capitulo]
+
+def ler_banco(capitulo):
+    """Lê o banco do capítulo do disco, convertendo o formato antigo se preciso; None se não existe."""
+    caminho_matriz = os.path.join(PASTA_BANCOS, f"{capitulo}.npy")
+    caminho_meta = os.path.join(PASTA_BANCOS, f"{capitulo}.meta.jsonl")
+
+    if not os.path.exists(caminho_meta):
+        nome_arquivo = f"{capitulo}.jsonl" if os.path.exists(os.path.join(PASTA_BANCOS, f"{capitulo}.jsonl")) else f"{capitulo}.json"
+        caminho_banco = os.path.join(PASTA_BANCOS, nome_arquivo)
+
+        if not os.path.exists(caminho_banco):
+            return None
+
+        print(f"   Convertendo banco {nome_arquivo} para matriz mapeável (apenas uma vez)...")
+        if not converter_banco_jsonl(capitulo, caminho_banco):
+            return None
+
+    with open(caminho_meta, 'r', encoding='utf-8') as f:
+        metadados = [json.loads(linha) for linha in f if linha.strip()]
+    if not metadados:
+        return None
+
+    return {
+        "ids": [m["id"] for m in metadados],
+        "textos": [m["text"] for m in metadados],
+        "matriz": np.load(caminho_matriz, mmap_mode='r')
+    }
+
+def top_k_banco(banco, consultas, top_k=5):
+    """
+    Pontua várias consultas contra o banco com um único produto de matrizes
+    e seleciona os Top K de cada uma com argpartition.
+    Retorna uma lista de candidatos por consulta, no formato [{codigo: {...}}].
+    """
+    consultas = normalizar(np.atleast_2d(consultas))
+    scores = consultas @ banco["matriz"].T
+    k = min(top_k, scores.shape[1])
+    if k == 0:
+        return [[] for _ in range(len(consultas))]
+
+    resultados = []
+    for linha in scores:
+        melhores = np.argpartition(-linha, k - 1)[:k]
+        # Ordena por score decrescente; empates mantêm a ordem do banco
+        melhores = melhores[np.lexsort((melhores, -linha[melhores]))]
+        resultados.append([
+            {
+                banco["ids"][i]: {
+                    "confidence_embedding": round(float(linha[i]), 4),
+                    "text": banco["textos"][i]  # TEXTO COMPLETO PRESERVADO AQUI
+                }
+            }
+            for i in melhores
+        ])
+    return resultados
 
 def buscar_no_banco_memoria(termo, contexto, capitulo, top_k=5):
     """Realiza a busca vetorial usando os dados carregados em memória."""
-    banco_dados = carregar_banco(capitulo)
+    banco = carregar_banco(capitulo)
     
-    if not banco_dados:
+    if not banco:
         return []
 
     # 1. Gerar embedding do termo de busca
-    query_text = f"Termo: {termo} | Contexto: {contexto}"
+    query_text = montar_consulta(termo, contexto)
     query_vec = get_query_embedding(query_text)
-    if not query_vec: return []
-    query_vec = np.array(query_vec).reshape(1, -1)
-
-    candidatos = []
-
-    # 2. Comparar com os itens do banco
-    for item in banco_dados:
-        item_vec = np.array(item["embedding"]).reshape(1, -1)
-        score = cosine_similarity(query_vec, item_vec)[0][0]
-        
-        candidatos.append({
-            item["id"]: {
-                "confidence_embedding": round(float(score), 4),
-                "text": item["text"]  # TEXTO COMPLETO PRESERVADO AQUI
-            }
-        })
+    if query_vec is None: return []
 
-    # 3. Ordenar e retornar os Top K
-    candidatos.sort(key=lambda x: list(x.values())[0]["confidence_embedding"], reverse=True)
-    return candidatos[:top_k]
+    # 2. Comparar com todos os itens do banco de uma vez e retornar os Top K
+    return top_k_banco(banco, query_vec, top_k)[0]
 
-def processar_busca_final():
-    if not os.path.exists(PASTA_SAIDA): os.makedirs(PASTA_SAIDA)
+def carregar_indice_global():
+    """Carrega (uma vez) o índice IVF de todo o catálogo; None se ele ainda não foi construído."""
+    global indice_global
+    with lock_carga:
+        if indice_global is None:
+            from codigos_cid.indice_ann import IndiceIVF
+            try:
+                indice_global = IndiceIVF(PASTA_BANCOS)
+            except FileNotFoundError:
+                print(f" Aviso: índice global não encontrado em {PASTA_BANCOS}; buscando só no capítulo "
+                      f"(rode codigos_cid/indice_ann.py construir).")
+                indice_global = False
+                return None
+            tamanhos = {}
+            for cap in indice_global.tamanhos:
+                banco = carregar_banco(cap)
+                tamanhos[cap] = len(banco["ids"]) if banco else 0
+            if indice_global.desatualizado(tamanhos):
+                print(" Aviso: índice global desatualizado em relação aos bancos; rode indice_ann.py construir.")
+    return indice_global or None
+
+def buscar_global(consultas, top_k=5):
+    """Top K de cada consulta em toda a CID-11, no mesmo formato de top_k_banco."""
+    resultados = []
+    for encontrados in carregar_indice_global().buscar(normalizar(consultas), top_k, NPROBE):
+        opcoes = []
+        for capitulo, linha, score in encontrados:
+            banco = carregar_banco(capitulo)
+            if not banco or linha >= len(banco["ids"]):
+                continue
+            opcoes.append({
+                banco["ids"][linha]: {
+                    "confidence_embedding": round(score, 4),
+                    "text": banco["textos"][linha]
+                }
+            })
+        resultados.append(opcoes)
+    return resultados
+
+def mesclar_opcoes(*listas, top_k=5):
+    """Junta listas de opções sem repetir código e mantém as Top K por score."""
+    melhores = {}
+    for lista in listas:
+        for opcao in lista:
+            codigo, detalhes = next(iter(opcao.items()))
+            if codigo not in melhores or detalhes["confidence_embedding"] > melhores[codigo]["confidence_embedding"]:
+                melhores[codigo] = detalhes
+    ordenadas = sorted(melhores.items(), key=lambda x: x[1]["confidence_embedding"], reverse=True)
+    return [{codigo: detalhes} for codigo, detalhes in ordenadas[:top_k]]
+
+def buscar_termos_no_capitulo(termos, contexto, capitulo, top_k=5, vetores_consulta=None):
+    """
+    Busca vários termos do mesmo capítulo com uma única multiplicação de matrizes.
+    vetores_consulta ({texto da consulta: vetor}) permite reaproveitar embeddings já gerados em lote.
+    Conforme MODO_BUSCA, soma ou troca o capítulo pela busca aproximada em toda a CID-11.
+    Retorna {termo: opcoes}; termos sem embedding ficam com lista vazia.
+    """
+    modo = MODO_BUSCA if MODO_BUSCA == "capitulo" or carregar_indice_global() else "capitulo"
+    banco = carregar_banco(capitulo) if modo != "global" else None
+    if not banco and modo == "capitulo":
+        return {termo: [] for termo in termos}
+
+    consultas = {termo: montar_consulta(termo, contexto) for termo in termos}
+    if vetores_consulta is None:
+        vetores_consulta = obter_embeddings_lote(list(consultas.values()))
+
+    vetores = {termo: vetores_consulta[texto] for termo, texto in consultas.items() if texto in vetores_consulta}
+
+    resultado = {termo: [] for termo in termos}
+    if vetores:
+        matriz_consultas = np.stack(list(vetores.values()))
+        opcoes = top_k_banco(banco, matriz_consultas, top_k) if banco else [[] for _ in vetores]
+        if modo != "capitulo":
+            globais = buscar_global(matriz_consultas, top_k)
+            opcoes = [mesclar_opcoes(a, b, top_k=top_k) for a, b in zip(opcoes, globais)]
+        resultado.update(zip(vetores.keys(), opcoes))
+    return resultado
+
+def carregar_atalho_lexico():
+    """Carrega (uma vez) o índice léxico dos títulos, se ativo e já construído."""
+    global indice_lexico
+    if not USAR_INDICE_LEXICO:
+        return None
+    with lock_carga:
+        if indice_lexico is None:
+            indice_lexico = carregar_indice_lexico()
+    return indice_lexico
 
-    for nome_arquivo in os.listdir(PASTA_ENTRADA):
-        if not nome_arquivo.endswith('.json'): continue
-        
-        # Limpar o cache a cada novo prontuário para não sobrecarregar a RAM 
-        # (Opcional, dependendo do tamanho da sua base CID)
-        cache_capitulos.clear()
-        
-        print(f"Processando busca vetorial: {nome_arquivo}")
-        with open(os.path.join(PASTA_ENTRADA, nome_arquivo), 'r', encoding='utf-8') as f:
-            dados = json.load(f)
-
-        contexto = dados.get("text", "")
-        labels = dados.get("labels", {})
-        novos_labels = {}
+def termos_para_busca(dados):
+    """Termos do prontuário que precisam da busca vetorial (os demais saem pelo índice léxico)."""
+    labels = dados.get("labels", {})
+    indice = carregar_atalho_lexico()
+    if not indice:
+        return list(labels)
+    return [termo for termo, info in labels.items() if not indice.candidatos_no_capitulo(termo, info.get("capitulo"))]
 
+def buscar_prontuario(dados, vetores_consulta=None):
+    """Substitui os labels do prontuário pelas Top K opções de cada termo, agrupando por capítulo."""
+    contexto = dados.get("text", "")
+    labels = dados.get("labels", {})
+    novos_labels = {}
+
+    # Termos que são um título da CID-11 no capítulo já têm a resposta (opção única)
+    por_titulo = {}
+    indice = carregar_atalho_lexico()
+    if indice:
         for termo, info in labels.items():
-            cap = info.get("capitulo")
-            print(f"   -> Buscando '{termo}' no capítulo {cap}")
-            
-            opcoes = buscar_no_banco_memoria(termo, contexto, cap)
-            
+            opcao = indice.resolver(termo, info.get("capitulo"))
+            if opcao:
+                por_titulo[termo] = [opcao]
+
+    # Agrupa os demais termos por capítulo para pontuar todos contra o banco de uma vez
+    termos_por_capitulo = {}
+    for termo, info in labels.items():
+        if termo not in por_titulo:
+            termos_por_capitulo.setdefault(info.get("capitulo"), []).append(termo)
+
+    # Fora do processamento em janelas (ex: pipeline.py), as consultas do prontuário vão num só lote
+    if vetores_consulta is None:
+        vetores_consulta = obter_embeddings_lote([
+            montar_consulta(termo, contexto) for termos in termos_por_capitulo.values() for termo in termos
+        ])
+
+    opcoes_por_termo = {}
+    for cap, termos in termos_por_capitulo.items():
+        print(f"   -> Buscando {len(termos)} termo(s) no capítulo {cap}: {', '.join(termos)}")
+        opcoes_por_termo.update(buscar_termos_no_capitulo(termos, contexto, cap, vetores_consulta=vetores_consulta))
+
+    for termo, info in labels.items():
+        if termo in por_titulo:
             novos_labels[termo] = {
-                "capitulo": cap,
-                "opcoes": opcoes
+                "capitulo": info.get("capitulo"),
+                "opcoes": por_titulo[termo],
+                "origem": ORIGEM_LEXICO
             }
+        else:
+            novos_labels[termo] = {
+                "capitulo": info.get("capitulo"),
+                "opcoes": opcoes_por_termo[termo]
+            }
+
+    dados["labels"] = novos_labels
+    return dados
+
+def impressao_artefatos():
+    """
+    Impressão digital dos dados que a busca lê, para o manifesto: hash do .meta.jsonl e
+    tamanho/data do .npy de cada banco e, se em uso, dos arquivos do índice IVF e do índice
+    léxico. Reconstruir qualquer um deles invalida as saídas já gravadas.
+    """
+    def estado(caminho):
+        if not os.path.exists(caminho):
+            return None
+        info = os.stat(caminho)
+        return [info.st_size, info.st_mtime_ns]
+
+    impressao = {}
+    if os.path.exists(PASTA_BANCOS):
+        for nome in sorted(os.listdir(PASTA_BANCOS)):
+            if nome.endswith(".meta.jsonl"):
+                capitulo = nome[:-len(".meta.jsonl")]
+                impressao[capitulo] = [hash_arquivo(os.path.join(PASTA_BANCOS, nome)),
+                                       estado(os.path.join(PASTA_BANCOS, f"{capitulo}.npy"))]
+    if MODO_BUSCA != "capitulo":
+        base = os.path.join(PASTA_BANCOS, NOME_INDICE)
+        impressao["indice_ivf"] = [estado(base + ".npz"), estado(base + ".vetores.npy")]
+    if USAR_INDICE_LEXICO:
+        impressao["indice_lexico"] = estado(ARQUIVO_INDICE_LEXICO)
+    return impressao
 
-        dados["labels"] = novos_labels
-        
-        with open(os.path.join(PASTA_SAIDA, nome_arquivo), 'w', encoding='utf-8') as f:
-            json.dump(dados, f, ensure_ascii=False, indent=2)
+def processar_busca_final(usar_cache=True, forcar=False):
+    global cache_embeddings
+    if not os.path.exists(PASTA_SAIDA): os.makedirs(PASTA_SAIDA)
+    if usar_cache: cache_embeddings = CacheEmbeddings()
+
+    arquivos = [f for f in os.listdir(PASTA_ENTRADA) if f.endswith('.json')]
+
+    # Pula prontuários cuja entrada, modelo, modo de busca e bancos/índices não mudaram desde a última execução
+    manifesto = ManifestoEtapa(PASTA_SAIDA, "busca_embedding", EMBED_MODEL,
+                               assinatura(montar_consulta, MODO_BUSCA, NPROBE, USAR_INDICE_LEXICO,
+                                          impressao_artefatos()), forcar)
+    hashes = dict(manifesto.pendentes(PASTA_ENTRADA, arquivos))
+    arquivos = list(hashes)
+
+    # Os prontuários são lidos em janelas: todas as consultas da janela viram
+    # poucas chamadas em lote ao /api/embed e depois são distribuídas aos termos
+    for inicio in range(0, len(arquivos), JANELA_PRONTUARIOS):
+        janela = []
+        for nome_arquivo in arquivos[inicio:inicio + JANELA_PRONTUARIOS]:
+            with open(os.path.join(PASTA_ENTRADA, nome_arquivo), 'r', encoding='utf-8') as f:
+                janela.append((nome_arquivo, json.load(f)))
+
+        textos = [
+            montar_consulta(termo, dados.get("text", ""))
+            for _, dados in janela
+            for termo in termos_para_busca(dados)
+        ]
+        print(f"Gerando {len(textos)} embeddings de consulta para {len(janela)} prontuário(s)...")
+        vetores_consulta = obter_embeddings_lote(textos)
+
+        for nome_arquivo, dados in janela:
+            print(f"Processando busca vetorial: {nome_arquivo}")
+            dados = buscar_prontuario(dados, vetores_consulta)
+
+            with open(os.path.join(PASTA_SAIDA, nome_arquivo), 'w', encoding='utf-8') as f:
+                json.dump(dados, f, ensure_ascii=False, indent=2)
+            manifesto.registrar(nome_arquivo, hashes[nome_arquivo], os.path.join(PASTA_SAIDA, nome_arquivo))
+
+        # Persiste os embeddings novos a cada janela (uma interrupção não perde o que já foi pago)
+        if cache_embeddings: cache_embeddings.persistir()
+
+    if cache_embeddings:
+        print(cache_embeddings.resumo())
+        cache_embeddings.fechar()
+        cache_embeddings = None
+    if indice_lexico:
+        print(f"{indice_lexico.resumo()} (buscas vetoriais evitadas)")
 
 if __name__ == "__main__":
-    processar_busca_final()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Busca as opções de código CID-11 de cada termo nos bancos de embeddings.")
+    parser.add_argument("--sem-cache", action="store_true", help="Não usa o cache de embeddings de consulta.")
+    parser.add_argument("--forcar", "--force", action="store_true", help="Reprocessa todos os arquivos, ignorando o manifesto.")
+    parser.add_argument("--sem-indice-lexico", action="store_true", help="Não usa o atalho léxico pelos títulos da CID-11.")
+    parser.add_argument("--modo", choices=MODOS_BUSCA, default=MODO_BUSCA, help="Onde procurar as opções de cada termo.")
+    parser.add_argument("--nprobe", type=int, default=NPROBE, help="Grupos do índice global visitados por consulta.")
+    args = parser.parse_args()
+
+    USAR_INDICE_LEXICO = not args.sem_indice_lexico
+    MODO_BUSCA = args.modo
+    NPROBE = args.nprobe
+    processar_busca_final(not args.sem_cache, args.forcar)
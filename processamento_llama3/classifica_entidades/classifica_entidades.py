@@ -1,9 +1,15 @@
+import argparse
 import json
 import os
-import requests
+import sys
+
+# Raiz do projeto no path para o cliente compartilhado do Ollama (comum/cliente_ollama.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from comum.checkpoint import ManifestoEtapa, assinatura
+from comum.cliente_ollama import ClienteOllama
 
 # --- CONFIGURAÇÕES ---
-OLLAMA_API = "http://localhost:11434/api/generate"
+# Endereço do Ollama e nº de requisições simultâneas: OLLAMA_URL e OLLAMA_MAX_EM_VOO (comum/cliente_ollama.py)
 MODELO = "llama3.1:8b"
 PASTA_ENTRADA = "semclinbr/prontuarios_vazios"
 PASTA_SAIDA = "processamento/classifica_entidades/prontuarios_vazios_classificados"
@@ -47,6 +53,8 @@ CAPITULOS_CID = {
     "X": "Códigos de extensão: Códigos suplementares usados para detalhar características adicionais, contexto ou atributos de outras categorias, não utilizados como codificação primária."
 }
 
+cliente = ClienteOllama("classifica_entidades")
+
 def chamar_llm(prompt):
     payload = {
         "model": MODELO,
@@ -56,8 +64,7 @@ def chamar_llm(prompt):
         "options": {"temperature": 0}
     }
     try:
-        response = requests.post(OLLAMA_API, json=payload, timeout=120)
-        return json.loads(response.json()['response'])
+        return json.loads(cliente.gerar(payload, timeout=120)['response'])
     except:
         return {}
 
@@ -88,61 +95,85 @@ Retorne EXCLUSIVAMENTE um JSON:
 """
     return chamar_llm(prompt)
 
-def processar():
+def extrair_candidatos(dados):
+    """Filtro de Candidatos (apenas categorias clínicas relevantes)."""
+    candidatos = []
+    for cat, termos in dados.get('entities', {}).items():
+        if cat in CATEGORIAS_CLINICAS:
+            candidatos.extend([t.lower() for t in termos])
+    
+    return list(set(candidatos)) # Limpa duplicatas
+
+def classificar_prontuario(dados):
+    """Preenche o campo 'labels' do prontuário com o capítulo de cada entidade clínica."""
+    texto = dados.get('text', "")
+    
+    # 1. Filtro de Candidatos
+    candidatos = extrair_candidatos(dados)
+    
+    # 2. Classificação em Bloco (Alta precisão e baixo ruído)
+    classificacoes = classificar_entidades(texto, candidatos)
+    
+    # 3. Formatação do campo 'labels'
+    labels_finais = {}
+    if isinstance(classificacoes, dict):
+        for termo, cap in classificacoes.items():
+            termo_low = termo.lower()
+            if cap != "IGNORAR":
+                labels_finais[termo_low] = {
+                    "capitulo": str(cap)
+                }
+
+    dados['labels'] = labels_finais
+    return dados
+
+def classificar_arquivo(nome_arquivo):
+    """Classifica um prontuário e grava o resultado. Retorna (nome, nº de candidatos, nº de labels)."""
+    with open(os.path.join(PASTA_ENTRADA, nome_arquivo), 'r', encoding='utf-8') as f:
+        dados = json.load(f)
+
+    dados = classificar_prontuario(dados)
+    
+    # Salva o resultado
+    caminho_saida = os.path.join(PASTA_SAIDA, nome_arquivo)
+    with open(caminho_saida, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+
+    return nome_arquivo, len(extrair_candidatos(dados)), len(dados['labels'])
+
+def processar(forcar=False):
     if not os.path.exists(PASTA_SAIDA): os.makedirs(PASTA_SAIDA)
     
     # Lista apenas os arquivos .json para contar o total
     arquivos = [f for f in os.listdir(PASTA_ENTRADA) if f.endswith('.json')]
-    total_arquivos = len(arquivos)
     
-    if total_arquivos == 0:
+    if len(arquivos) == 0:
         print("Nenhum arquivo encontrado para processar.")
         return
 
-    for i, nome_arquivo in enumerate(arquivos, 1):
+    # Pula prontuários cuja entrada, modelo e prompt não mudaram desde a última execução
+    manifesto = ManifestoEtapa(PASTA_SAIDA, "classifica_entidades", MODELO,
+                               assinatura(classificar_entidades, CATEGORIAS_CLINICAS, CAPITULOS_CID), forcar)
+    hashes = dict(manifesto.pendentes(PASTA_ENTRADA, arquivos))
+    total_arquivos = len(hashes)
+
+    # Vários prontuários em voo ao mesmo tempo (limite do cliente compartilhado)
+    for i, (nome_arquivo, n_candidatos, n_labels) in enumerate(cliente.mapear(classificar_arquivo, list(hashes)), 1):
+        manifesto.registrar(nome_arquivo, hashes[nome_arquivo], os.path.join(PASTA_SAIDA, nome_arquivo))
+
         # Cálculo do progresso
         percentual_concluido = (i / total_arquivos) * 100
         percentual_falta = 100 - percentual_concluido
         
-        print(f"[{i}/{total_arquivos}] -> Processando: {nome_arquivo}")
-        print(f"   Progresso: {percentual_concluido:.1f}% | Falta: {percentual_falta:.1f}%")
-        
-        with open(os.path.join(PASTA_ENTRADA, nome_arquivo), 'r', encoding='utf-8') as f:
-            dados = json.load(f)
-        
-        texto = dados.get('text', "")
-        
-        # 1. Filtro de Candidatos (apenas categorias clínicas relevantes)
-        candidatos = []
-        for cat, termos in dados.get('entities', {}).items():
-            if cat in CATEGORIAS_CLINICAS:
-                candidatos.extend([t.lower() for t in termos])
-        
-        candidatos = list(set(candidatos)) # Limpa duplicatas
-        
-        # 2. Classificação em Bloco (Alta precisão e baixo ruído)
-        print(f"   Classificando {len(candidatos)} termos encontrados...")
-        classificacoes = classificar_entidades(texto, candidatos)
-        
-        # 3. Formatação do campo 'labels'
-        labels_finais = {}
-        if isinstance(classificacoes, dict):
-            for termo, cap in classificacoes.items():
-                termo_low = termo.lower()
-                if cap != "IGNORAR":
-                    labels_finais[termo_low] = {
-                        "capitulo": str(cap)
-                    }
-
-        dados['labels'] = labels_finais
-        
-        # Salva o resultado
-        caminho_saida = os.path.join(PASTA_SAIDA, nome_arquivo)
-        with open(caminho_saida, 'w', encoding='utf-8') as f:
-            json.dump(dados, f, ensure_ascii=False, indent=2)
-        print(f"   Concluído: {nome_arquivo}\n")
+        print(f"[{i}/{total_arquivos}] -> Concluído: {nome_arquivo} ({n_labels}/{n_candidatos} termos classificados)")
+        print(f"   Progresso: {percentual_concluido:.1f}% | Falta: {percentual_falta:.1f}%\n")
     
+    print(cliente.resumo())
     print("--- Processamento Finalizado ---")
 
 if __name__ == "__main__":
-    processar()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Classifica as entidades dos prontuários nos capítulos da CID-11.")
+    parser.add_argument("--forcar", "--force", action="store_true", help="Reprocessa todos os arquivos, ignorando o manifesto.")
+    args = parser.parse_args()
+
+    processar(forcar=args.forcar)
\ No newline at end of file
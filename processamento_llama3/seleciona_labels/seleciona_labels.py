@@ -1,9 +1,17 @@
+import argparse
 import json
 import os
-import requests
+import sys
+import threading
+
+# Raiz do projeto no path para o cliente compartilhado do Ollama (comum/cliente_ollama.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from comum.checkpoint import ManifestoEtapa, assinatura
+from comum.cache_decisoes import ORIGEM_CACHE
+from comum.cliente_ollama import ClienteOllama
 
 # --- CONFIGURAÇÕES ---
-OLLAMA_API_CHAT = "http://localhost:11434/api/chat"
+# Endereço do Ollama e nº de requisições simultâneas: OLLAMA_URL e OLLAMA_MAX_EM_VOO (comum/cliente_ollama.py)
 LLM_MODEL = "llama3" 
 PASTA_ENTRADA = "processamento/escolha_cid/prontuarios_vazios_cid"
 PASTA_AUDITADA = "processamento/seleciona_labels/prontuarios_vazios_auditados"
@@ -19,6 +27,10 @@ LISTA_MOTIVOS_REPROVACAO = [
   "contexto_alucinado"
 ]
 
+cliente = ClienteOllama("seleciona_labels")
+auditorias_puladas = 0  # labels vindos do cache de decisões, que não passam pela LLM
+lock_contadores = threading.Lock()  # as etapas rodam em várias threads no pipeline.py
+
 def validar_vinculo_clinico_equilibrado(contexto, termo, codigo, descricao_cid, reasoning_original):
     # Prompt recalibrado para ser justo, mas atento a erros reais
     prompt = f"""
@@ -59,44 +71,77 @@ def validar_vinculo_clinico_equilibrado(contexto, termo, codigo, descricao_cid,
     }
 
     try:
-        response = requests.post(OLLAMA_API_CHAT, json=payload, timeout=90)
-        content = response.json().get("message", {}).get("content")
+        content = cliente.chat(payload, timeout=90).get("message", {}).get("content")
         return json.loads(content)
     except Exception:
         return None
 
-def processar_auditoria():
+def auditar_prontuario(dados):
+    """Marca cada código do prontuário com a decisão da auditoria (MANTER/REMOVER)."""
+    global auditorias_puladas
+    contexto = dados.get("text", "")
+    labels_atuais = dados.get("labels", {})
+    novos_labels = {}
+
+    for codigo, info in labels_atuais.items():
+        # Mapeamento já mantido pela auditoria muitas vezes no histórico: não é reauditado
+        if info.get("origem") == ORIGEM_CACHE:
+            info["decisao"] = "MANTER"
+            info["motivo_decisao"] = info.get("classification_reasoning")
+            info["tipo_erro_auditoria"] = None
+            novos_labels[codigo] = info
+            with lock_contadores:
+                auditorias_puladas += 1
+            continue
+
+        resultado = validar_vinculo_clinico_equilibrado(
+            contexto, info['term_original'], codigo, info['descricao_cid'], info['classification_reasoning']
+        )
+
+        if resultado:
+            is_valido = resultado.get("valido")
+            info["decisao"] = "MANTER" if is_valido else "REMOVER"
+            info["motivo_decisao"] = resultado.get("analise_critica")
+            info["tipo_erro_auditoria"] = resultado.get("motivo_tecnico") if not is_valido else None
+            novos_labels[codigo] = info
+        
+    dados["labels"] = novos_labels
+    return dados
+
+def auditar_arquivo(nome_arquivo):
+    """Audita os códigos de um prontuário e grava o resultado. Retorna (nome, mantidos, removidos)."""
+    with open(os.path.join(PASTA_ENTRADA, nome_arquivo), 'r', encoding='utf-8') as f:
+        dados = json.load(f)
+
+    dados = auditar_prontuario(dados)
+    with open(os.path.join(PASTA_AUDITADA, nome_arquivo), 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+
+    mantidos = sum(1 for info in dados["labels"].values() if info["decisao"] == "MANTER")
+    return nome_arquivo, mantidos, len(dados["labels"]) - mantidos
+
+def processar_auditoria(forcar=False):
     if not os.path.exists(PASTA_AUDITADA): os.makedirs(PASTA_AUDITADA)
     arquivos = [f for f in os.listdir(PASTA_ENTRADA) if f.endswith('.json')]
-    total = len(arquivos)
-
-    for i, nome_arquivo in enumerate(arquivos, 1):
-        with open(os.path.join(PASTA_ENTRADA, nome_arquivo), 'r', encoding='utf-8') as f:
-            dados = json.load(f)
-
-        contexto = dados.get("text", "")
-        labels_atuais = dados.get("labels", {})
-        novos_labels = {}
-
-        print(f"[{i}/{total}] Auditando (Calibrado): {nome_arquivo}")
-
-        for codigo, info in labels_atuais.items():
-            resultado = validar_vinculo_clinico_equilibrado(
-                contexto, info['term_original'], codigo, info['descricao_cid'], info['classification_reasoning']
-            )
-
-            if resultado:
-                is_valido = resultado.get("valido")
-                info["decisao"] = "MANTER" if is_valido else "REMOVER"
-                info["motivo_decisao"] = resultado.get("analise_critica")
-                info["tipo_erro_auditoria"] = resultado.get("motivo_tecnico") if not is_valido else None
-                novos_labels[codigo] = info
-            
-        dados["labels"] = novos_labels
-        with open(os.path.join(PASTA_AUDITADA, nome_arquivo), 'w', encoding='utf-8') as f:
-            json.dump(dados, f, ensure_ascii=False, indent=2)
 
+    # Pula prontuários cuja entrada, modelo e prompt não mudaram desde a última execução
+    manifesto = ManifestoEtapa(PASTA_AUDITADA, "seleciona_labels", LLM_MODEL,
+                               assinatura(validar_vinculo_clinico_equilibrado, LISTA_MOTIVOS_REPROVACAO), forcar)
+    hashes = dict(manifesto.pendentes(PASTA_ENTRADA, arquivos))
+    total = len(hashes)
+
+    # Vários prontuários em voo ao mesmo tempo (limite do cliente compartilhado)
+    for i, (nome_arquivo, mantidos, removidos) in enumerate(cliente.mapear(auditar_arquivo, list(hashes)), 1):
+        manifesto.registrar(nome_arquivo, hashes[nome_arquivo], os.path.join(PASTA_AUDITADA, nome_arquivo))
+        print(f"[{i}/{total}] Auditado (Calibrado): {nome_arquivo} | {mantidos} mantidos, {removidos} removidos")
         print(f"   Progresso: {(i/total*100):.1f}%")
 
+    print(cliente.resumo())
+    print(f"[seleciona_labels] {auditorias_puladas} auditorias evitadas pelo cache de decisões")
+
 if __name__ == "__main__":
-    processar_auditoria()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Audita os códigos CID-11 atribuídos a cada prontuário.")
+    parser.add_argument("--forcar", "--force", action="store_true", help="Reprocessa todos os arquivos, ignorando o manifesto.")
+    args = parser.parse_args()
+
+    processar_auditoria(forcar=args.forcar)
\ No newline at end of file
@@ -1,9 +1,23 @@
+import argparse
+import copy
 import json
 import os
+import sys
+import threading
+import time
 import torch
 import requests
 from tqdm import tqdm
 from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers.generation.streamers import BaseStreamer
+
+# Raiz do projeto no path para o manifesto de checkpoint (comum/checkpoint.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from comum.checkpoint import ManifestoEtapa, assinatura
+from comum.json_restrito import AutomatoObjetoJSON, ProcessadorJSONRestrito
+from comum.modelo_local import USAR_ONNX, carregar_modelo
+from comum.parada_geracao import ContagemTokens, ParadaRespostaCompleta
+from comum.servidor_modelo import SERVIDOR_MODELO, cliente_servidor
 
 # --- CONFIGURAÇÕES ---
 MODELO_MEDGEMMA = "google/medgemma-1.5-4b-it"
@@ -13,6 +27,24 @@ MODELO_LLAMA = "llama3.1:8b"
 PASTA_ENTRADA = "semclinbr/prontuarios"
 PASTA_SAIDA = "processamento_medgemma/classifica_entidades/prontuarios_classificados"
 
+# Geração em lote: prontuários de tamanho parecido (em tokens) são agrupados, preenchidos
+# à esquerda e gerados numa única chamada. O lote é limitado por TAMANHO_LOTE_MAX e pela
+# memória livre da GPU; com TAMANHO_LOTE_MAX = 1 o comportamento é o antigo, um por vez.
+MAX_NOVOS_TOKENS = 1024
+TAMANHO_LOTE_MAX = 8
+FRACAO_MEMORIA_LIVRE = 0.8  # parte da memória livre que o cache KV do lote pode ocupar
+JANELA_PRONTUARIOS = 64     # prontuários lidos por vez para formar os lotes
+
+# Reaproveita o cache KV da parte fixa do prompt (referência CID + diretrizes) em todos
+# os prontuários, em vez de recodificá-la a cada geração (--sem-cache-prefixo desliga;
+# indisponível no ONNX Runtime, que não recebe o cache KV do transformers)
+USAR_CACHE_PREFIXO = not USAR_ONNX
+
+# O MedGemma responde direto um JSON {"termo": "capítulo"}: a decodificação é restrita aos
+# termos do prontuário e aos códigos de CAPITULOS_CID, então a resposta é sempre um JSON
+# válido e o Llama formatador deixa de ser chamado (--texto-livre volta ao 'termo -> código')
+SAIDA_JSON_RESTRITA = True
+
 # Lista completa e detalhada para o MedGemma ter contexto total
 CAPITULOS_CID = {
     "01": "Algumas doenças infecciosas ou parasitárias: Doenças causadas por agentes infecciosos como bactérias, vírus, parasitas e fungos, transmitidas por contato direto, vetores, alimentos, água ou outras vias.",
@@ -46,30 +78,36 @@ CAPITULOS_CID = {
 }
 
 # --- CARREGAMENTO DO MODELO ---
-tokenizer = AutoTokenizer.from_pretrained(MODELO_MEDGEMMA)
-model_med = AutoModelForCausalLM.from_pretrained(
-    MODELO_MEDGEMMA,
-    torch_dtype=torch.bfloat16,
-    device_map="auto"
-)
+# Só na primeira geração local: importar o módulo (pipeline, servidor de modelo) não carrega
+# o modelo, e com MEDGEMMA_SERVIDOR definido ele nunca é carregado neste processo.
+# GPU (bfloat16) ou CPU (int8 dinâmico), conforme comum/modelo_local.py
+tokenizer = None
+model_med = None
+lock_modelo = threading.Lock()
 
-def chamar_medgemma_especialista(texto_completo, candidatos):
+def carregar_medgemma():
+    global tokenizer, model_med
+    with lock_modelo:
+        if model_med is None:
+            tokenizer = AutoTokenizer.from_pretrained(MODELO_MEDGEMMA)
+            # O preenchimento dos lotes é montado em gerar_lote: à esquerda do prompt, ou entre o
+            # prefixo e o sufixo quando o prefixo vem do cache; em ambos a geração começa na mesma coluna
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            model_med = carregar_modelo(AutoModelForCausalLM, MODELO_MEDGEMMA)
+
+def montar_prefixo_especialista():
     """
-    Usa o contexto total do prontuário para classificar os termos.
+    Parte fixa do prompt (papel, referência dos capítulos e diretrizes), igual em todos
+    os prontuários. Fica no início para que seu cache KV seja calculado uma única vez.
     """
     # Monta a lista de referência completa dos capítulos
     referencia_cid = "\n".join([f"Capítulo {k}: {v}" for k, v in CAPITULOS_CID.items()])
     
     # Prompt sem restrições severas de tamanho
-    prompt = f"""Você é um médico especialista em codificação diagnóstica e terminologia médica (CID-11).
+    return f"""Você é um médico especialista em codificação diagnóstica e terminologia médica (CID-11).
 Sua tarefa é cruzar os termos extraídos com o contexto clínico do prontuário para atribuir o capítulo correto.
 
-### CONTEXTO DO PRONTUÁRIO
-{texto_completo}
-
-### LISTA DE TERMOS PARA ANÁLISE
-{", ".join(candidatos)}
-
 ### REFERÊNCIA DE CAPÍTULOS CID-11
 {referencia_cid}
 
@@ -77,26 +115,210 @@ Sua tarefa é cruzar os termos extraídos com o contexto clínico do prontuário
 1. **Prioridade Diagnóstica**: Classifique apenas termos que representem entidades que se enquadrem em um capítulo específico do CID-11.
 2. **Diferenciação por Contexto**: Se um termo puder pertencer a dois capítulos, use o contexto do prontuário. (Ex: "Diabetes" em gestante pode ser Capítulo 18 em vez de 05).
 
-### FORMATO DE SAÍDA:
+{formato_saida()}"""
+
+def formato_saida():
+    if SAIDA_JSON_RESTRITA:
+        return """### FORMATO DE SAÍDA:
+Responda EXCLUSIVAMENTE com um objeto JSON plano {"termo": "código"}, com o termo como aparece na lista e o código do capítulo (ex: "01", "11", "V", "X").
+Se nenhum termo for classificável, retorne apenas: {}
+"""
+    return """### FORMATO DE SAÍDA:
 Responda EXCLUSIVAMENTE com a lista no formato 'termo -> código'. Não escreva introduções ou conclusões.
 Se nenhum termo for classificável, retorne apenas: "Nenhum termo enquadrável".
+"""
+
+def montar_sufixo_especialista(texto_completo, candidatos):
+    """Parte variável do prompt: o prontuário e seus termos, logo antes da resposta."""
+    return f"""
+### CONTEXTO DO PRONTUÁRIO
+{texto_completo}
+
+### LISTA DE TERMOS PARA ANÁLISE
+{", ".join(candidatos)}
 
 Resposta:
 """
 
-    inputs = tokenizer(prompt, return_tensors="pt").to("cuda")
-    
+# O prefixo é tokenizado sozinho (com o BOS) e os sufixos sem tokens especiais, então
+# os ids do prompt completo são sempre prefixo + sufixo, com ou sem o cache.
+# Ambos são calculados na primeira geração, depois de lidas as opções da linha de comando.
+ids_prefixo = None
+cache_prefixo = None
+tempos_primeiro_token = []
+contagem_tokens = ContagemTokens()  # tokens gerados x necessários (parada antecipada)
+
+def obter_ids_prefixo():
+    global ids_prefixo
+    if ids_prefixo is None:
+        carregar_medgemma()
+        ids_prefixo = tokenizer(montar_prefixo_especialista())["input_ids"]
+    return ids_prefixo
+
+def obter_cache_prefixo():
+    """past_key_values do prefixo fixo, calculados na primeira chamada e reaproveitados depois."""
+    global cache_prefixo
+    if cache_prefixo is None:
+        inicio = time.monotonic()
+        with torch.no_grad():
+            saida = model_med(input_ids=torch.tensor([obter_ids_prefixo()], device=model_med.device), use_cache=True)
+        cache_prefixo = saida.past_key_values
+        tqdm.write(f"  Prefixo do prompt ({len(obter_ids_prefixo())} tokens) pré-calculado em {time.monotonic() - inicio:.2f}s.")
+    return cache_prefixo
+
+class MedidorPrimeiroToken(BaseStreamer):
+    """Streamer que só marca o tempo até o primeiro token gerado (o generate envia antes o prompt)."""
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.chamadas = 0
+        self.ttft = None
+
+    def put(self, valor):
+        self.chamadas += 1
+        if self.chamadas == 2:
+            self.ttft = time.monotonic() - self.inicio
+
+    def end(self):
+        pass
+
+def ids_fim_geracao():
+    eos = model_med.generation_config.eos_token_id
+    return eos if isinstance(eos, list) else [eos]
+
+def gerar_lote(sufixos, candidatos):
+    """
+    Gera as respostas de vários prompts numa única chamada (decodificação gulosa).
+    candidatos: os termos de cada prompt, usados como chaves permitidas no modo JSON.
+    """
+    carregar_medgemma()
+    ids_prefixo = obter_ids_prefixo()
+    ids_sufixos = tokenizer(sufixos, add_special_tokens=False)["input_ids"]
+    maior = max(len(ids) for ids in ids_sufixos)
+    pad = tokenizer.pad_token_id
+
+    linhas, mascaras = [], []
+    for ids in ids_sufixos:
+        falta = maior - len(ids)
+        if USAR_CACHE_PREFIXO:
+            # O prefixo já está no cache em todas as linhas: o preenchimento fica entre ele e o sufixo
+            # (as posições saem da máscara, então o sufixo continua logo após o prefixo)
+            linhas.append(ids_prefixo + [pad] * falta + ids)
+            mascaras.append([1] * len(ids_prefixo) + [0] * falta + [1] * len(ids))
+        else:
+            linhas.append([pad] * falta + ids_prefixo + ids)
+            mascaras.append([0] * falta + [1] * (len(ids_prefixo) + len(ids)))
+    input_ids = torch.tensor(linhas, device=model_med.device)
+
+    extras = {}
+    if USAR_CACHE_PREFIXO:
+        cache = copy.deepcopy(obter_cache_prefixo())
+        if len(sufixos) > 1:
+            cache.batch_repeat_interleave(len(sufixos))
+        extras["past_key_values"] = cache
+    if SAIDA_JSON_RESTRITA:
+        automatos = [AutomatoObjetoJSON(termos, CAPITULOS_CID) for termos in candidatos]
+        extras["logits_processor"] = [ProcessadorJSONRestrito(tokenizer, automatos, input_ids.shape[1], ids_fim_geracao())]
+    # Para cada linha no '}' final (JSON) ou no fim da lista 'termo -> código' (texto livre)
+    parada = ParadaRespostaCompleta(tokenizer, len(sufixos), input_ids.shape[1], ids_fim_geracao(),
+                                    "json" if SAIDA_JSON_RESTRITA else "lista")
+
+    medidor = MedidorPrimeiroToken()
     with torch.no_grad():
         outputs = model_med.generate(
-            **inputs, 
-            max_new_tokens=1024, # Aumentado para suportar listas longas de termos
+            input_ids=input_ids,
+            attention_mask=torch.tensor(mascaras, device=model_med.device),
+            max_new_tokens=MAX_NOVOS_TOKENS, # Aumentado para suportar listas longas de termos
             temperature=0.1,
-            do_sample=False
+            do_sample=False,
+            pad_token_id=pad,
+            streamer=medidor,
+            stopping_criteria=[parada],
+            **extras
         )
+    if medidor.ttft is not None:
+        tempos_primeiro_token.append(medidor.ttft)
     
-    resposta_completa = tokenizer.decode(outputs[0], skip_special_tokens=True)
     # Extrai apenas a parte gerada após o prompt
-    return resposta_completa[len(prompt):].strip()
+    gerados = outputs[:, input_ids.shape[1]:]
+    tqdm.write(f"  Lote de {len(sufixos)}: {contagem_tokens.registrar(parada, gerados.shape[1], MAX_NOVOS_TOKENS)}")
+    return [tokenizer.decode(g, skip_special_tokens=True).strip() for g in gerados]
+
+def chamar_medgemma_especialista(texto_completo, candidatos):
+    """
+    Usa o contexto total do prontuário para classificar os termos.
+    """
+    return next(gerar_analises([montar_sufixo_especialista(texto_completo, candidatos)], [candidatos]))[1]
+
+def resumo_primeiro_token():
+    if not tempos_primeiro_token:
+        return "Tempo até o primeiro token: nenhuma geração."
+    tempos = sorted(tempos_primeiro_token)
+    modo = "com cache do prefixo" if USAR_CACHE_PREFIXO else "sem cache do prefixo"
+    return (f"Tempo até o primeiro token ({modo}): média {sum(tempos) / len(tempos):.3f}s | "
+            f"mediana {tempos[len(tempos) // 2]:.3f}s | {len(tempos)} gerações")
+
+def bytes_kv_por_token():
+    """Memória do cache KV por token: chaves + valores de todas as camadas."""
+    config = getattr(model_med.config, "text_config", model_med.config)
+    n_cabecas_kv = getattr(config, "num_key_value_heads", None) or config.num_attention_heads
+    dim_cabeca = getattr(config, "head_dim", None) or config.hidden_size // config.num_attention_heads
+    return 2 * config.num_hidden_layers * n_cabecas_kv * dim_cabeca * model_med.dtype.itemsize
+
+def tokens_por_lote():
+    """Quantos tokens (itens x comprimento) cabem num lote, pela memória livre da GPU (None na CPU)."""
+    if model_med.device.type != "cuda":
+        return None
+    livre, _ = torch.cuda.mem_get_info(model_med.device)
+    return int(livre * FRACAO_MEMORIA_LIVRE / bytes_kv_por_token())
+
+def montar_lotes(sufixos, tamanho_lote_max=TAMANHO_LOTE_MAX):
+    """
+    Agrupa os índices dos prompts em lotes de comprimento parecido: ordena pelo nº de tokens
+    e fecha o lote quando chega a tamanho_lote_max ou o cache KV não caberia na memória livre.
+    """
+    carregar_medgemma()
+    comprimentos = [len(obter_ids_prefixo()) + len(ids) for ids in tokenizer(sufixos, add_special_tokens=False)["input_ids"]]
+    orcamento = tokens_por_lote()
+
+    lotes, atual = [], []
+    for i in sorted(range(len(sufixos)), key=lambda i: comprimentos[i]):
+        # O lote é preenchido até o maior comprimento, que é o do item atual (lista ordenada)
+        custo = (len(atual) + 1) * (comprimentos[i] + MAX_NOVOS_TOKENS)
+        if atual and (len(atual) >= tamanho_lote_max or (orcamento and custo > orcamento)):
+            lotes.append(atual)
+            atual = []
+        atual.append(i)
+    if atual:
+        lotes.append(atual)
+    return lotes
+
+def gerar_adaptativo(prompts, candidatos):
+    """Gera um lote; se faltar memória, divide ao meio e tenta de novo."""
+    try:
+        return gerar_lote(prompts, candidatos)
+    except torch.cuda.OutOfMemoryError:
+        if len(prompts) == 1:
+            raise
+        torch.cuda.empty_cache()
+        meio = len(prompts) // 2
+        tqdm.write(f"  [!] Memória insuficiente para {len(prompts)} prontuários, dividindo o lote.")
+        return (gerar_adaptativo(prompts[:meio], candidatos[:meio]) +
+                gerar_adaptativo(prompts[meio:], candidatos[meio:]))
+
+def gerar_analises(prompts, candidatos, tamanho_lote_max=TAMANHO_LOTE_MAX):
+    """
+    Gera (índice, análise) para cada prompt, à medida que ficam prontas: no servidor de
+    modelo, se MEDGEMMA_SERVIDOR estiver definido, ou aqui mesmo em lotes por comprimento.
+    """
+    if SERVIDOR_MODELO:
+        resposta = cliente_servidor(SERVIDOR_MODELO).chamar("classifica", {
+            "sufixos": prompts, "candidatos": candidatos, "json_restrito": SAIDA_JSON_RESTRITA
+        })
+        yield from enumerate(resposta["analises"])
+        return
+    for lote in montar_lotes(prompts, tamanho_lote_max):
+        analises = gerar_adaptativo([prompts[j] for j in lote], [candidatos[j] for j in lote])
+        yield from zip(lote, analises)
 
 def chamar_llama_formatador(analise_medica):
     """
@@ -137,54 +359,120 @@ JSON:"""
     except:
         return {}
 
-def processar():
+def extrair_candidatos(dados):
+    return list(set([t.lower() for lista in dados.get('entities', {}).values() for t in lista]))
+
+def ler_analise(analise):
+    """No modo JSON a análise já é o objeto (a decodificação restrita garante a sintaxe)."""
+    try:
+        return json.loads(analise)
+    except json.JSONDecodeError:
+        # Só acontece se a geração parar em MAX_NOVOS_TOKENS antes do '}'
+        return {}
+
+def aplicar_analise(dados, candidatos, analise):
+    """Lê a análise do MedGemma (JSON direto ou formatada pelo Llama) e preenche o campo 'labels'."""
+    labels_finais = {}
+    
+    if candidatos:
+        # 2. JSON restrito é lido direto; texto livre passa pelo Llama formatador
+        json_classificado = ler_analise(analise) if SAIDA_JSON_RESTRITA else chamar_llama_formatador(analise)
+        
+        # 3. Integração e contagem
+        if isinstance(json_classificado, dict):
+            for termo, cap in json_classificado.items():
+                term_key = termo.lower()
+                # Garante que só incluímos o que o MedGemma realmente classificou
+                if term_key in candidatos:
+                    labels_finais[term_key] = {"capitulo": str(cap).upper()}
+    
+    dados['labels'] = labels_finais
+    return dados
+
+def classificar_prontuario(dados):
+    """Preenche o campo 'labels' do prontuário: MedGemma analisa (em JSON ou texto livre formatado pelo Llama)."""
+    candidatos = extrair_candidatos(dados)
+    
+    # 1. MedGemma analisa
+    analise = chamar_medgemma_especialista(dados.get('text', ""), candidatos) if candidatos else None
+    return aplicar_analise(dados, candidatos, analise)
+
+def classificar_lote(lista_dados, tamanho_lote_max=TAMANHO_LOTE_MAX):
+    """
+    Classifica vários prontuários, gerando as análises do MedGemma em lotes por comprimento.
+    Gera um (índice, dados) por prontuário, em ordem de conclusão.
+    """
+    candidatos = [extrair_candidatos(dados) for dados in lista_dados]
+    com_termos = [i for i, c in enumerate(candidatos) if c]
+
+    for i, dados in enumerate(lista_dados):
+        if not candidatos[i]:
+            yield i, aplicar_analise(dados, [], None)
+
+    prompts = [montar_sufixo_especialista(lista_dados[i].get('text', ""), candidatos[i]) for i in com_termos]
+    for j, analise in gerar_analises(prompts, [candidatos[i] for i in com_termos], tamanho_lote_max):
+        i = com_termos[j]
+        yield i, aplicar_analise(lista_dados[i], candidatos[i], analise)
+
+def processar(forcar=False, tamanho_lote_max=TAMANHO_LOTE_MAX):
     if not os.path.exists(PASTA_SAIDA): 
         os.makedirs(PASTA_SAIDA)
     
     arquivos = [f for f in os.listdir(PASTA_ENTRADA) if f.endswith('.json')]
+
+    # Pula prontuários cuja entrada, modelos e prompts não mudaram desde a última execução
+    modelos = MODELO_MEDGEMMA if SAIDA_JSON_RESTRITA else f"{MODELO_MEDGEMMA}+{MODELO_LLAMA}"
+    manifesto = ManifestoEtapa(PASTA_SAIDA, "classifica_entidades", modelos,
+                               assinatura(montar_prefixo_especialista(), montar_sufixo_especialista, chamar_llama_formatador,
+                                          AutomatoObjetoJSON, CAPITULOS_CID), forcar)
+    hashes = dict(manifesto.pendentes(PASTA_ENTRADA, arquivos))
+    
+    arquivos = list(hashes)
     
     # Criamos a barra de progresso principal para os arquivos
-    pbar = tqdm(arquivos, desc="Processando Prontuários", unit="arq")
+    pbar = tqdm(total=len(arquivos), desc="Processando Prontuários", unit="arq")
     
-    for nome_arquivo in pbar:
-        # Atualiza a descrição da barra com o nome do arquivo atual
-        pbar.set_postfix_str(f"Arquivo: {nome_arquivo}")
-        
-        caminho_entrada = os.path.join(PASTA_ENTRADA, nome_arquivo)
-        with open(caminho_entrada, 'r', encoding='utf-8') as f:
-            dados = json.load(f)
-        
-        texto_completo = dados.get('text', "")
-        candidatos = list(set([t.lower() for lista in dados.get('entities', {}).values() for t in lista]))
+    for inicio in range(0, len(arquivos), JANELA_PRONTUARIOS):
+        janela = arquivos[inicio:inicio + JANELA_PRONTUARIOS]
+        lista_dados = []
+        for nome_arquivo in janela:
+            with open(os.path.join(PASTA_ENTRADA, nome_arquivo), 'r', encoding='utf-8') as f:
+                lista_dados.append(json.load(f))
         
-        labels_finais = {}
-        
-        if candidatos:
-            # 1. MedGemma analisa
-            analise = chamar_medgemma_especialista(texto_completo, candidatos)
-            
-            # 2. Llama formata
-            json_classificado = chamar_llama_formatador(analise)
+        for i, dados in classificar_lote(lista_dados, tamanho_lote_max):
+            nome_arquivo = janela[i]
+            # Atualiza a descrição da barra com o nome do arquivo atual
+            pbar.set_postfix_str(f"Arquivo: {nome_arquivo}")
+            n_candidatos = len(extrair_candidatos(dados))
             
-            # 3. Integração e contagem
-            if isinstance(json_classificado, dict):
-                for termo, cap in json_classificado.items():
-                    term_key = termo.lower()
-                    # Garante que só incluímos o que o MedGemma realmente classificou
-                    if term_key in candidatos:
-                        labels_finais[term_key] = {"capitulo": str(cap).upper()}
-            
-            # Log no console acima da barra para não quebrá-la
-            tqdm.write(f"  [√] {nome_arquivo}: {len(labels_finais)}/{len(candidatos)} entidades classificadas.")
-        
-        dados['labels'] = labels_finais
+            if n_candidatos:
+                # Log no console acima da barra para não quebrá-la
+                tqdm.write(f"  [√] {nome_arquivo}: {len(dados['labels'])}/{n_candidatos} entidades classificadas.")
 
-        # Salva o resultado
-        caminho_saida = os.path.join(PASTA_SAIDA, nome_arquivo)
-        with open(caminho_saida, 'w', encoding='utf-8') as f:
-            json.dump(dados, f, ensure_ascii=False, indent=2)
+            # Salva o resultado
+            caminho_saida = os.path.join(PASTA_SAIDA, nome_arquivo)
+            with open(caminho_saida, 'w', encoding='utf-8') as f:
+                json.dump(dados, f, ensure_ascii=False, indent=2)
+            manifesto.registrar(nome_arquivo, hashes[nome_arquivo], caminho_saida)
+            pbar.update(1)
+    pbar.close()
+    if SERVIDOR_MODELO:
+        print(cliente_servidor(SERVIDOR_MODELO).resumo())
+    else:
+        print(resumo_primeiro_token())
+        print(contagem_tokens.resumo())
 
     print("\n✓ Processamento concluído com sucesso!")
 
 if __name__ == "__main__":
-    processar()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Classifica as entidades dos prontuários nos capítulos da CID-11 com o MedGemma.")
+    parser.add_argument("--forcar", "--force", action="store_true", help="Reprocessa todos os arquivos, ignorando o manifesto.")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_MAX, help="Máximo de prontuários por geração (1 = sem lote).")
+    parser.add_argument("--sem-cache-prefixo", action="store_true", help="Recodifica o prompt inteiro a cada geração (referência para o tempo até o primeiro token).")
+    parser.add_argument("--texto-livre", action="store_true", help="Resposta em 'termo -> código' formatada pelo Llama, sem decodificação restrita.")
+    args = parser.parse_args()
+
+    USAR_CACHE_PREFIXO = USAR_CACHE_PREFIXO and not args.sem_cache_prefixo
+    SAIDA_JSON_RESTRITA = not args.texto_livre
+
+    processar(forcar=args.forcar, tamanho_lote_max=args.lote)
\ No newline at end of file
@@ -1,21 +1,38 @@
+import argparse
 import json
 import os
-import requests
+import sys
+import threading
+
+# Raiz do projeto no path para o cliente compartilhado do Ollama (comum/cliente_ollama.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from comum.checkpoint import ManifestoEtapa, assinatura
+from comum.cache_decisoes import ORIGEM_CACHE, CacheDecisoes
+from comum.cliente_ollama import ClienteOllama
+from codigos_cid.indice_lexico import ORIGEM_LEXICO
 
 # --- CONFIGURAÇÕES ---
-OLLAMA_API_CHAT = "http://localhost:11434/api/chat"
+# Endereço do Ollama e nº de requisições simultâneas: OLLAMA_URL e OLLAMA_MAX_EM_VOO (comum/cliente_ollama.py)
 LLM_MODEL = "llama3" 
 PASTA_BUSCA = "processamento/busca_embedding/prontuarios_vazios_busca"
 PASTA_FINAL = "processamento/escolha_cid/prontuarios_vazios_cid"
 
+# Escolha em lote: o contexto vai uma vez por chamada com as opções de vários termos.
+# Escolhas fora das opções oferecidas (ou termos ausentes da resposta) voltam para a chamada por termo.
+ESCOLHA_EM_LOTE = True
+MAX_TERMOS_POR_CHAMADA = 20
+
+cliente = ClienteOllama("escolha_cid")
+# Decisões termo -> código aprendidas do histórico auditado (comum/cache_decisoes.py construir)
+cache_decisoes = CacheDecisoes()
+escolhas_evitadas = 0  # termos resolvidos pelo título na busca_embedding, sem chamada à LLM
+lock_contadores = threading.Lock()  # as etapas rodam em várias threads no pipeline.py
+
 def refinar_com_llm(contexto, termo, capitulo, opcoes):
     """
     Envia as opções para a LLM escolher a melhor baseada no contexto clínico.
     """
-    lista_opcoes_texto = ""
-    for opcao in opcoes:
-        for codigo, detalhes in opcao.items():
-            lista_opcoes_texto += f"- Código: {codigo} | Descrição: {detalhes['text']}\n"
+    lista_opcoes_texto = formatar_opcoes(opcoes)
 
     prompt = f"""
     Você é um especialista em codificação médica CID-11.
@@ -44,70 +61,199 @@ def refinar_com_llm(contexto, termo, capitulo, opcoes):
     }
 
     try:
-        response = requests.post(OLLAMA_API_CHAT, json=payload, timeout=90)
-        resultado = response.json().get("message", {}).get("content")
+        resultado = cliente.chat(payload, timeout=90).get("message", {}).get("content")
         return json.loads(resultado)
     except Exception as e:
         print(f"      Erro na LLM para o termo '{termo}': {e}")
         return None
 
-def processar_refinamento_final():
+def formatar_opcoes(opcoes):
+    return "".join(
+        f"- Código: {codigo} | Descrição: {detalhes['text']}\n"
+        for opcao in opcoes for codigo, detalhes in opcao.items()
+    )
+
+def refinar_termos_com_llm(contexto, termos):
+    """
+    Escolhe o código de vários termos numa única chamada. termos: {termo: (capitulo, opcoes)}.
+    Retorna {termo: {"codigo", "reasoning"}} só com as escolhas que estão entre as opções do termo.
+    """
+    blocos = ""
+    for n, (termo, (capitulo, opcoes)) in enumerate(termos.items(), 1):
+        blocos += f"""
+    {n}. TERMO EXTRAÍDO: "{termo}" | CAPÍTULO CID: {capitulo}
+    OPÇÕES:
+    {formatar_opcoes(opcoes)}"""
+
+    prompt = f"""
+    Você é um especialista em codificação médica CID-11.
+    CONTEXTO DO PRONTUÁRIO: "{contexto}"
+
+    Para cada termo abaixo estão as opções encontradas pela busca vetorial. Escolha, para cada termo,
+    a opção MAIS PRECISA dentro do contexto clínico, usando apenas os códigos listados para aquele termo.
+    Ignore o score de confiança anterior.
+    {blocos}
+
+    Responda EXCLUSIVAMENTE em formato JSON, com uma chave para cada termo (escrito exatamente como acima), seguindo este modelo:
+    {{
+        "termo": {{
+            "codigo": "O código escolhido",
+            "reasoning": "Breve explicação clínica da escolha"
+        }}
+    }}
+    """
+
+    payload = {
+        "model": LLM_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": False,
+        "format": "json"
+    }
+
+    try:
+        resultado = json.loads(cliente.chat(payload, timeout=180).get("message", {}).get("content"))
+    except Exception as e:
+        print(f"      Erro na LLM para o lote de {len(termos)} termos: {e}")
+        return {}
+    if not isinstance(resultado, dict):
+        return {}
+
+    decisoes = {}
+    for termo, decisao in resultado.items():
+        termo = termo.lower()
+        if termo not in termos or not isinstance(decisao, dict):
+            continue
+        codigos_oferecidos = {codigo for opcao in termos[termo][1] for codigo in opcao}
+        if decisao.get("codigo") in codigos_oferecidos:
+            decisoes[termo] = decisao
+    return decisoes
+
+def escolher_codigos(contexto, termos):
+    """Decisão da LLM para cada termo ({termo: (capitulo, opcoes)}), em lote quando ativo."""
+    decisoes = {}
+    if ESCOLHA_EM_LOTE and len(termos) > 1:
+        nomes = list(termos)
+        for inicio in range(0, len(nomes), MAX_TERMOS_POR_CHAMADA):
+            bloco = {t: termos[t] for t in nomes[inicio:inicio + MAX_TERMOS_POR_CHAMADA]}
+            decisoes.update(refinar_termos_com_llm(contexto, bloco))
+        faltantes = len(termos) - len(decisoes)
+        if faltantes:
+            print(f"      {faltantes} de {len(termos)} termos sem escolha válida no lote, consultando um a um.")
+
+    for termo, (cap, opcoes) in termos.items():
+        if termo not in decisoes:
+            decisoes[termo] = refinar_com_llm(contexto, termo, cap, opcoes)
+    return decisoes
+
+def montar_label(termo, cap, opcoes, codigo_eleito, reasoning):
+    # Variáveis para armazenar os dados capturados da lista original de opções
+    conf_original = 0.0
+    descricao_encontrada = ""
+
+    # Busca os dados originais (score e texto) para o código escolhido
+    for opt in opcoes:
+        if codigo_eleito in opt:
+            conf_original = opt[codigo_eleito].get("confidence_embedding")
+            descricao_encontrada = opt[codigo_eleito].get("text")
+            break
+
+    # Monta a estrutura final conforme solicitado
+    return {
+        "term_original": termo,
+        "capitulo": cap,
+        "confidence_embedding": conf_original,
+        "descricao_cid": descricao_encontrada,
+        "classification_reasoning": reasoning
+    }
+
+def refinar_prontuario(dados):
+    """Troca as opções de cada termo pelo código escolhido pela LLM (labels passam a ser indexados pelo código)."""
+    global escolhas_evitadas
+    contexto = dados.get("text", "")
+    labels_antigos = dados.get("labels", {})
+    escolhidos = {}
+
+    # Termos com mapeamento estável no histórico auditado não vão para a LLM
+    termos = {}
+    for termo, info in labels_antigos.items():
+        cap, opcoes = info.get("capitulo"), info.get("opcoes", [])
+        decisao = cache_decisoes.consultar(termo, cap) if cache_decisoes else None
+        if decisao:
+            label = montar_label(termo, cap, opcoes, decisao["codigo"],
+                                 f"Mapeamento estável no histórico auditado ({decisao['frequencia']}x, "
+                                 f"concordância {decisao['concordancia']}).")
+            label["descricao_cid"] = label["descricao_cid"] or decisao["descricao_cid"]
+            label["origem"] = ORIGEM_CACHE
+            escolhidos[termo] = (decisao["codigo"], label)
+        elif info.get("origem") == ORIGEM_LEXICO and len(opcoes) == 1:
+            # O termo é o próprio título do código no capítulo: não há o que escolher
+            codigo = next(iter(opcoes[0]))
+            label = montar_label(termo, cap, opcoes, codigo, "Termo idêntico ao título do código CID-11 no capítulo.")
+            label["origem"] = ORIGEM_LEXICO
+            escolhidos[termo] = (codigo, label)
+            with lock_contadores:
+                escolhas_evitadas += 1
+        elif opcoes:
+            termos[termo] = (cap, opcoes)
+
+    decisoes = escolher_codigos(contexto, termos)
+    for termo, (cap, opcoes) in termos.items():
+        decisao = decisoes.get(termo)
+        if decisao:
+            escolhidos[termo] = (decisao.get("codigo"), montar_label(termo, cap, opcoes, decisao.get("codigo"), decisao.get("reasoning")))
+
+    # Atualiza a estrutura do JSON (na ordem original dos termos)
+    novos_labels = {}
+    for termo in labels_antigos:
+        if termo in escolhidos:
+            codigo, label = escolhidos[termo]
+            novos_labels[codigo] = label
+    dados["labels"] = novos_labels
+    return dados
+
+def refinar_arquivo(nome_arquivo):
+    """Escolhe o código de cada termo de um prontuário e grava o resultado. Retorna (nome, nº de labels)."""
+    with open(os.path.join(PASTA_BUSCA, nome_arquivo), 'r', encoding='utf-8') as f:
+        dados = json.load(f)
+
+    dados = refinar_prontuario(dados)
+    
+    # Salva o resultado final
+    with open(os.path.join(PASTA_FINAL, nome_arquivo), 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+
+    return nome_arquivo, len(dados["labels"])
+
+def processar_refinamento_final(forcar=False):
     if not os.path.exists(PASTA_FINAL): os.makedirs(PASTA_FINAL)
     
     arquivos = [f for f in os.listdir(PASTA_BUSCA) if f.endswith('.json')]
-    total = len(arquivos)
-
-    for i, nome_arquivo in enumerate(arquivos, 1):
-        print(f"[{i}/{total}] Refinando: {nome_arquivo}...")
-        
-        with open(os.path.join(PASTA_BUSCA, nome_arquivo), 'r', encoding='utf-8') as f:
-            dados = json.load(f)
-
-        contexto = dados.get("text", "")
-        labels_antigos = dados.get("labels", {})
-        novos_labels = {}
-
-        for termo, info in labels_antigos.items():
-            opcoes = info.get("opcoes", [])
-            cap = info.get("capitulo")
-            
-            if not opcoes: continue
-
-            print(f"   -> Refinando escolha para: {termo}")
-            decisao = refinar_com_llm(contexto, termo, cap, opcoes)
-
-            if decisao:
-                codigo_eleito = decisao.get("codigo")
-                
-                # Variáveis para armazenar os dados capturados da lista original de opções
-                conf_original = 0.0
-                descricao_encontrada = ""
-
-                # Busca os dados originais (score e texto) para o código que a LLM escolheu
-                for opt in opcoes:
-                    if codigo_eleito in opt:
-                        conf_original = opt[codigo_eleito].get("confidence_embedding")
-                        descricao_encontrada = opt[codigo_eleito].get("text")
-                        break
-
-                # Monta a estrutura final conforme solicitado
-                novos_labels[codigo_eleito] = {
-                    "term_original": termo,
-                    "capitulo": cap,
-                    "confidence_embedding": conf_original,
-                    "descricao_cid": descricao_encontrada,
-                    "classification_reasoning": decisao.get("reasoning")
-                }
-
-        # Atualiza a estrutura do JSON
-        dados["labels"] = novos_labels
-        
-        # Salva o resultado final
-        with open(os.path.join(PASTA_FINAL, nome_arquivo), 'w', encoding='utf-8') as f:
-            json.dump(dados, f, ensure_ascii=False, indent=2)
+
+    # Pula prontuários cuja entrada, modelo e prompt não mudaram desde a última execução
+    manifesto = ManifestoEtapa(PASTA_FINAL, "escolha_cid", LLM_MODEL, assinatura(refinar_com_llm, refinar_termos_com_llm, ESCOLHA_EM_LOTE,
+                                                                         cache_decisoes.assinatura() if cache_decisoes else None), forcar)
+    hashes = dict(manifesto.pendentes(PASTA_BUSCA, arquivos))
+    total = len(hashes)
+
+    # Vários prontuários em voo ao mesmo tempo (limite do cliente compartilhado)
+    for i, (nome_arquivo, n_labels) in enumerate(cliente.mapear(refinar_arquivo, list(hashes)), 1):
+        manifesto.registrar(nome_arquivo, hashes[nome_arquivo], os.path.join(PASTA_FINAL, nome_arquivo))
+        print(f"[{i}/{total}] Refinado: {nome_arquivo} ({n_labels} códigos escolhidos)")
 
         percentual_falta = 100 - ((i / total) * 100)
         print(f"   Falta: {percentual_falta:.1f}% para concluir todos os arquivos.\n")
 
+    print(cliente.resumo())
+    if cache_decisoes: print(cache_decisoes.resumo())
+    print(f"[escolha_cid] {escolhas_evitadas} escolhas evitadas pelo índice léxico")
+
 if __name__ == "__main__":
-    processar_refinamento_final()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Escolhe o código CID-11 de cada termo entre as opções da busca vetorial.")
+    parser.add_argument("--forcar", "--force", action="store_true", help="Reprocessa todos os arquivos, ignorando o manifesto.")
+    parser.add_argument("--por-termo", action="store_true", help="Uma chamada à LLM por termo, sem o modo em lote.")
+    parser.add_argument("--sem-cache-decisoes", action="store_true", help="Não usa o cache de decisões do histórico auditado.")
+    args = parser.parse_args()
+
+    ESCOLHA_EM_LOTE = not args.por_termo
+    if args.sem_cache_decisoes: cache_decisoes = None
+    processar_refinamento_final(forcar=args.forcar)
\ No newline at end of file
@@ -1,8 +1,19 @@
+import argparse
 import json
 import os
+import sys
+import threading
 import torch
 from transformers import AutoProcessor, PaliGemmaForConditionalGeneration
 
+# Raiz do projeto no path para o manifesto de checkpoint (comum/checkpoint.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from comum.cache_decisoes import ORIGEM_CACHE
+from comum.checkpoint import ManifestoEtapa, assinatura
+from comum.modelo_local import carregar_modelo
+from comum.parada_geracao import ContagemTokens, ParadaRespostaCompleta
+from comum.servidor_modelo import SERVIDOR_MODELO, cliente_servidor
+
 # --- CONFIGURAÇÕES ---
 MODEL_ID = "google/medgemma-4b-it"
 PASTA_ENTRADA = "processamento/escolha_cid/prontuarios_vazios_cid"
@@ -19,15 +30,65 @@ LISTA_MOTIVOS_REPROVACAO = [
     "contexto_alucinado"
 ]
 
+# Auditoria em lote: o prontuário vai uma vez só, com todos os códigos, e a resposta é uma
+# lista JSON de vereditos. Códigos sem veredito válido voltam para a auditoria individual.
+AUDITORIA_EM_LOTE = True
+TOKENS_POR_VEREDITO = 128
+
+auditorias_puladas = 0  # labels vindos do cache de decisões, que não passam pelo MedGemma
+lock_contadores = threading.Lock()  # as etapas rodam em várias threads no pipeline.py
+contagem_tokens = ContagemTokens()  # tokens gerados x necessários (parada no fim do JSON)
+
 # --- CARREGAMENTO DO MODELO (UMA VEZ) ---
-print("Carregando MedGemma localmente...")
-processor = AutoProcessor.from_pretrained(MODEL_ID)
-model = PaliGemmaForConditionalGeneration.from_pretrained(
-    MODEL_ID,
-    torch_dtype=torch.bfloat16,
-    device_map="auto"
-)
-print(f"✓ Modelo carregado na GPU: {torch.cuda.is_available()}")
+# Só na primeira geração local; com MEDGEMMA_SERVIDOR definido as gerações vão para o
+# servidor de modelo e o MedGemma não é carregado neste processo.
+# GPU (bfloat16) ou CPU (int8 dinâmico), conforme comum/modelo_local.py
+processor = None
+model = None
+lock_modelo = threading.Lock()
+
+def carregar_medgemma():
+    global processor, model
+    with lock_modelo:
+        if model is None:
+            print("Carregando MedGemma localmente...")
+            processor = AutoProcessor.from_pretrained(MODEL_ID)
+            model = carregar_modelo(PaliGemmaForConditionalGeneration, MODEL_ID, onnx=False)
+
+def gerar_resposta(prompt, max_new_tokens):
+    """
+    Roda o MedGemma sobre o prompt e retorna o texto decodificado (só a parte gerada).
+    A geração para assim que o objeto/lista JSON da resposta fecha.
+    """
+    if SERVIDOR_MODELO:
+        return cliente_servidor(SERVIDOR_MODELO).chamar("seleciona", {
+            "prompt": prompt, "max_new_tokens": max_new_tokens
+        })["resposta"]
+    carregar_medgemma()
+
+    # Prepara input
+    inputs = processor(text=prompt, return_tensors="pt")
+    
+    # Move para o dispositivo do modelo (GPU ou CPU)
+    inputs = {k: v.to(model.device) for k, v in inputs.items()}
+    
+    n_prompt = inputs["input_ids"].shape[1]
+    eos = model.generation_config.eos_token_id
+    parada = ParadaRespostaCompleta(processor.tokenizer, 1, n_prompt, eos if isinstance(eos, list) else [eos])
+    
+    # Gera resposta
+    with torch.no_grad():
+        output_ids = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            temperature=0.2,  # Baixa temperatura para respostas mais consistentes
+            do_sample=False,
+            stopping_criteria=[parada]
+        )
+    print(f"   Geração: {contagem_tokens.registrar(parada, output_ids.shape[1] - n_prompt, max_new_tokens)}")
+    
+    # Decodifica
+    return processor.decode(output_ids[0][n_prompt:], skip_special_tokens=True)
 
 def validar_vinculo_clinico_equilibrado(contexto, termo, codigo, descricao_cid, reasoning_original):
     """
@@ -58,24 +119,7 @@ Responda APENAS em JSON válido (sem explicações adicionais):
 }}"""
 
     try:
-        # Prepara input
-        inputs = processor(text=prompt, return_tensors="pt")
-        
-        # Move para GPU se disponível
-        if torch.cuda.is_available():
-            inputs = {k: v.cuda() for k, v in inputs.items()}
-        
-        # Gera resposta
-        with torch.no_grad():
-            output_ids = model.generate(
-                **inputs,
-                max_new_tokens=256,
-                temperature=0.2,  # Baixa temperatura para respostas mais consistentes
-                do_sample=False
-            )
-        
-        # Decodifica
-        response_text = processor.decode(output_ids[0], skip_special_tokens=True)
+        response_text = gerar_resposta(prompt, max_new_tokens=256)
         
         # Extrai JSON da resposta
         # MedGemma pode incluir o prompt na resposta, então procura por "{"
@@ -96,14 +140,139 @@ Responda APENAS em JSON válido (sem explicações adicionais):
         print(f"⚠ Erro na inferência: {e}")
         return None
 
-def processar_auditoria():
+def validar_vinculos_em_lote(contexto, labels):
+    """
+    Audita todos os códigos de um prontuário numa única chamada ao MedGemma.
+    Retorna {codigo: veredito} apenas com os vereditos bem formados; None se a resposta não tiver uma lista JSON.
+    """
+    itens = "\n".join(
+        f'{n}. CÓDIGO: "{codigo}" | TERMO: "{info["term_original"]}" | DESCRIÇÃO: "{info["descricao_cid"]}" | '
+        f'JUSTIFICATIVA DO SISTEMA: "{info["classification_reasoning"]}"'
+        for n, (codigo, info) in enumerate(labels.items(), 1)
+    )
+
+    prompt = f"""Você é um Auditor Médico Especialista. Sua missão é garantir que a codificação CID-11 seja CLINICAMENTE COERENTE com o prontuário.
+
+CONTEÚDO DO PRONTUÁRIO: "{contexto}"
+
+CÓDIGOS CID-11 ATRIBUÍDOS (avalie cada um separadamente):
+{itens}
+
+DIRETRIZES DE AUDITORIA:
+1. MANTER se o código CID representa fielmente o termo ou uma condição clínica diretamente relacionada descrita no prontuário.
+2. REMOVER se houver contradição óbvia (ex: termo negado "sem dor" mapeado para "dor").
+3. REMOVER se a associação for puramente imaginária ou sem qualquer base no texto (alucinação).
+4. Seja justo: se o termo for uma abreviação médica comum ou sinônimo que faz sentido no contexto, aceite a classificação.
+5. Não proponha, sugira ou infira nenhum novo código CID. Avalie exclusivamente se cada código atribuído é clinicamente válido ou inválido.
+
+Se decidir por REMOVER, use um destes motivos: {', '.join(LISTA_MOTIVOS_REPROVACAO)}
+
+Responda APENAS com uma lista JSON válida, um objeto por código, na mesma ordem (sem explicações adicionais):
+[
+    {{
+        "codigo": "código avaliado",
+        "valido": true ou false,
+        "motivo_tecnico": "nome_do_motivo_se_falso ou null",
+        "analise_critica": "Explique brevemente sua lógica clínica para manter ou remover."
+    }}
+]"""
+
+    try:
+        response_text = gerar_resposta(prompt, max_new_tokens=TOKENS_POR_VEREDITO * len(labels))
+        
+        json_start = response_text.find('[')
+        json_end = response_text.rfind(']') + 1
+        if json_start == -1 or json_end <= json_start:
+            print(f"⚠ Auditoria em lote sem lista JSON: {response_text[-100:]}")
+            return None
+        vereditos = json.loads(response_text[json_start:json_end])
+    except json.JSONDecodeError as e:
+        print(f"⚠ Erro ao decodificar a lista de vereditos: {e}")
+        return None
+    except Exception as e:
+        print(f"⚠ Erro na inferência em lote: {e}")
+        return None
+
+    if not isinstance(vereditos, list):
+        return None
+    return {
+        v["codigo"]: v for v in vereditos
+        # "codigo" não-texto (lista/objeto) é descartado antes do teste em labels, que levantaria TypeError
+        if isinstance(v, dict) and isinstance(v.get("codigo"), str) and v["codigo"] in labels
+        and isinstance(v.get("valido"), bool)
+    }
+
+def auditar_prontuario(dados):
+    """Marca cada código do prontuário com a decisão da auditoria (MANTER/REMOVER/INDETERMINADO)."""
+    global auditorias_puladas
+    contexto = dados.get("text", "")
+    novos_labels = {}
+
+    # Mapeamentos já mantidos pela auditoria muitas vezes no histórico não são reauditados
+    labels_atuais = {}
+    for codigo, info in dados.get("labels", {}).items():
+        if info.get("origem") == ORIGEM_CACHE:
+            info["decisao"] = "MANTER"
+            info["motivo_decisao"] = info.get("classification_reasoning")
+            info["tipo_erro_auditoria"] = None
+            novos_labels[codigo] = info
+            with lock_contadores:
+                auditorias_puladas += 1
+            print(f"   ✓ MANTER (cache) | {codigo}: {info['term_original']}")
+        else:
+            labels_atuais[codigo] = info
+
+    vereditos = {}
+    if AUDITORIA_EM_LOTE and len(labels_atuais) > 1:
+        vereditos = validar_vinculos_em_lote(contexto, labels_atuais) or {}
+        faltantes = len(labels_atuais) - len(vereditos)
+        print(f"   Auditoria em lote: {len(vereditos)}/{len(labels_atuais)} vereditos"
+              + (f", {faltantes} auditados individualmente" if faltantes else ""))
+    
+    for codigo, info in labels_atuais.items():
+        resultado = vereditos.get(codigo) or validar_vinculo_clinico_equilibrado(
+            contexto,
+            info['term_original'],
+            codigo,
+            info['descricao_cid'],
+            info['classification_reasoning']
+        )
+        
+        if resultado:
+            is_valido = resultado.get("valido")
+            info["decisao"] = "MANTER" if is_valido else "REMOVER"
+            info["motivo_decisao"] = resultado.get("analise_critica")
+            info["tipo_erro_auditoria"] = resultado.get("motivo_tecnico") if not is_valido else None
+            
+            # Debug: mostra decisão
+            status = "✓ MANTER" if is_valido else "✗ REMOVER"
+            print(f"   {status} | {codigo}: {info['term_original']}")
+        else:
+            info["decisao"] = "INDETERMINADO"
+            info["motivo_decisao"] = "Falha na inferência"
+            info["tipo_erro_auditoria"] = None
+            print(f"   ⚠ INDETERMINADO | {codigo}: {info['term_original']}")
+        
+        novos_labels[codigo] = info
+    
+    # Mantém a ordem original dos códigos
+    dados["labels"] = {codigo: novos_labels[codigo] for codigo in dados["labels"] if codigo in novos_labels}
+    return dados
+
+def processar_auditoria(forcar=False):
     """
     Processa todos os arquivos JSON e audita com MedGemma.
+    Arquivos já auditados com a mesma entrada, modelo e prompt são pulados (exceto com forcar).
     """
     if not os.path.exists(PASTA_AUDITADA):
         os.makedirs(PASTA_AUDITADA)
     
     arquivos = [f for f in os.listdir(PASTA_ENTRADA) if f.endswith('.json')]
+    manifesto = ManifestoEtapa(PASTA_AUDITADA, "seleciona_labels", MODEL_ID,
+                               assinatura(validar_vinculo_clinico_equilibrado, validar_vinculos_em_lote,
+                                          LISTA_MOTIVOS_REPROVACAO, AUDITORIA_EM_LOTE), forcar)
+    hashes = dict(manifesto.pendentes(PASTA_ENTRADA, arquivos))
+    arquivos = list(hashes)
     total = len(arquivos)
     
     print(f"\n{'='*60}")
@@ -116,51 +285,29 @@ def processar_auditoria():
         with open(caminho_entrada, 'r', encoding='utf-8') as f:
             dados = json.load(f)
         
-        contexto = dados.get("text", "")
-        labels_atuais = dados.get("labels", {})
-        novos_labels = {}
-        
         print(f"[{i}/{total}] Auditando: {nome_arquivo}")
-        
-        for codigo, info in labels_atuais.items():
-            resultado = validar_vinculo_clinico_equilibrado(
-                contexto,
-                info['term_original'],
-                codigo,
-                info['descricao_cid'],
-                info['classification_reasoning']
-            )
-            
-            if resultado:
-                is_valido = resultado.get("valido")
-                info["decisao"] = "MANTER" if is_valido else "REMOVER"
-                info["motivo_decisao"] = resultado.get("analise_critica")
-                info["tipo_erro_auditoria"] = resultado.get("motivo_tecnico") if not is_valido else None
-                
-                # Debug: mostra decisão
-                status = "✓ MANTER" if is_valido else "✗ REMOVER"
-                print(f"   {status} | {codigo}: {info['term_original']}")
-            else:
-                info["decisao"] = "INDETERMINADO"
-                info["motivo_decisao"] = "Falha na inferência"
-                info["tipo_erro_auditoria"] = None
-                print(f"   ⚠ INDETERMINADO | {codigo}: {info['term_original']}")
-            
-            novos_labels[codigo] = info
-        
-        dados["labels"] = novos_labels
+        dados = auditar_prontuario(dados)
         
         # Salva resultado auditado
         caminho_saida = os.path.join(PASTA_AUDITADA, nome_arquivo)
         with open(caminho_saida, 'w', encoding='utf-8') as f:
             json.dump(dados, f, ensure_ascii=False, indent=2)
+        manifesto.registrar(nome_arquivo, hashes[nome_arquivo], caminho_saida)
         
         progress = (i / total * 100)
         print(f"   Progresso: {progress:.1f}% | Salvo em: {caminho_saida}\n")
     
     print(f"\n{'='*60}")
     print(f"✓ Auditoria completa! Arquivos salvos em: {PASTA_AUDITADA}")
+    print(f"  {auditorias_puladas} auditorias evitadas pelo cache de decisões")
+    print(f"  {cliente_servidor(SERVIDOR_MODELO).resumo() if SERVIDOR_MODELO else contagem_tokens.resumo()}")
     print(f"{'='*60}")
 
 if __name__ == "__main__":
-    processar_auditoria()
+    parser = argparse.ArgumentParser(description="Audita os códigos CID-11 atribuídos a cada prontuário com o MedGemma.")
+    parser.add_argument("--forcar", "--force", action="store_true", help="Reprocessa todos os arquivos, ignorando o manifesto.")
+    parser.add_argument("--por-label", action="store_true", help="Audita um código por chamada, sem o modo em lote.")
+    args = parser.parse_args()
+
+    AUDITORIA_EM_LOTE = not args.por_label
+    processar_auditoria(forcar=args.forcar)
@@ -0,0 +1,88 @@
+import argparse
+import importlib.util
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(RAIZ)
+from comum.servidor_modelo import JANELA_MICROLOTE, MAX_PEDIDOS_LOTE, PORTA_PADRAO, ServidorModelo
+
+# Servidor de modelo das etapas do MedGemma: carrega cada modelo uma vez (na primeira
+# requisição, ou na partida com --pre-carregar) e atende, por HTTP em localhost:
+#   POST /classifica  {"sufixos", "candidatos", "json_restrito"} -> {"analises"}
+#   POST /seleciona   {"prompt", "max_new_tokens"}              -> {"resposta"}
+#   GET  /status      contadores do servidor e das etapas
+# As etapas usam o servidor quando MEDGEMMA_SERVIDOR aponta para ele, ex:
+#   python processamento_medgemma/servidor_medgemma.py &
+#   MEDGEMMA_SERVIDOR=http://localhost:8765 python pipeline.py --backend medgemma
+
+def carregar_etapa(etapa):
+    """Importa processamento_medgemma/{etapa}/{etapa}.py (a importação não carrega o modelo)."""
+    caminho = os.path.join(RAIZ, "processamento_medgemma", etapa, f"{etapa}.py")
+    spec = importlib.util.spec_from_file_location(f"medgemma_{etapa}", caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    # Dentro do servidor as gerações são sempre locais
+    modulo.SERVIDOR_MODELO = ""
+    return modulo
+
+classifica = carregar_etapa("classifica_entidades")
+seleciona = carregar_etapa("seleciona_labels")
+
+def gerar_classificacoes(pedidos):
+    """Junta os prompts de todos os pedidos do microlote e os gera em lotes por comprimento."""
+    sufixos = [s for p in pedidos for s in p["sufixos"]]
+    candidatos = [c for p in pedidos for c in p["candidatos"]]
+    analises = [None] * len(sufixos)
+    for j, analise in classifica.gerar_analises(sufixos, candidatos, classifica.TAMANHO_LOTE_MAX):
+        analises[j] = analise
+
+    respostas, inicio = [], 0
+    for p in pedidos:
+        respostas.append({"analises": analises[inicio:inicio + len(p["sufixos"])]})
+        inicio += len(p["sufixos"])
+    return respostas
+
+def validar_classificacao(dados):
+    if len(dados.get("sufixos", [])) != len(dados.get("candidatos", [])):
+        raise ValueError("'sufixos' e 'candidatos' precisam ter o mesmo tamanho.")
+    if dados.get("json_restrito", True) != classifica.SAIDA_JSON_RESTRITA:
+        modo = "JSON restrito" if classifica.SAIDA_JSON_RESTRITA else "texto livre"
+        raise ValueError(f"O servidor está no modo {modo}; use o mesmo modo na etapa ou reinicie o servidor.")
+
+def gerar_auditorias(pedidos):
+    # A auditoria gera um prompt por vez; o microlote só serializa o acesso ao modelo
+    return [{"resposta": seleciona.gerar_resposta(p["prompt"], p["max_new_tokens"])} for p in pedidos]
+
+def resumo_classifica():
+    return f"[classifica_entidades] {classifica.resumo_primeiro_token()} | {classifica.contagem_tokens.resumo()}"
+
+def resumo_seleciona():
+    return f"[seleciona_labels] {seleciona.contagem_tokens.resumo()}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local do MedGemma compartilhado pelas etapas (modelo carregado uma vez).")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    parser.add_argument("--janela-ms", type=float, default=JANELA_MICROLOTE * 1000, help="Espera por outros pedidos para formar um microlote.")
+    parser.add_argument("--max-pedidos", type=int, default=MAX_PEDIDOS_LOTE, help="Pedidos por microlote.")
+    parser.add_argument("--lote", type=int, default=classifica.TAMANHO_LOTE_MAX, help="Máximo de prontuários por geração do classifica.")
+    parser.add_argument("--texto-livre", action="store_true", help="Classifica em 'termo -> código' (as etapas também precisam de --texto-livre).")
+    parser.add_argument("--sem-cache-prefixo", action="store_true", help="Não reaproveita o cache KV do prefixo do classifica.")
+    parser.add_argument("--pre-carregar", action="store_true", help="Carrega os dois modelos antes de aceitar requisições.")
+    args = parser.parse_args()
+
+    classifica.TAMANHO_LOTE_MAX = args.lote
+    classifica.SAIDA_JSON_RESTRITA = not args.texto_livre
+    classifica.USAR_CACHE_PREFIXO = classifica.USAR_CACHE_PREFIXO and not args.sem_cache_prefixo
+    if args.pre_carregar:
+        classifica.carregar_medgemma()
+        seleciona.carregar_medgemma()
+
+    servidor = ServidorModelo(
+        {"classifica": gerar_classificacoes, "seleciona": gerar_auditorias},
+        validacoes={"classifica": validar_classificacao},
+        resumos=[resumo_classifica, resumo_seleciona],
+        janela=args.janela_ms / 1000,
+        max_pedidos=args.max_pedidos,
+    )
+    servidor.servir(args.porta)
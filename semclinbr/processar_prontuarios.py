@@ -1,70 +1,136 @@
 import xml.etree.ElementTree as ET
+import argparse
 import json
 import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 def carregar_traducoes(caminho_json):
     with open(caminho_json, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def processar_xmls(pasta_origem, pasta_destino, mapa_traducoes):
+def extrair_prontuario(caminho_xml, mapa_traducoes):
+    """
+    Lê o XML em streaming (iterparse), liberando cada anotação assim que é lida.
+    Retorna (texto, entities), com as entidades sem repetição e na ordem em que aparecem.
+    """
+    texto_prontuario = ""
+    entities = {}
+    vistos = {}
+    caminho = []
+
+    for evento, elem in ET.iterparse(caminho_xml, events=("start", "end")):
+        if evento == "start":
+            caminho.append(elem.tag)
+            continue
+        caminho.pop()
+
+        # Extração do Texto Original (filho direto da raiz)
+        if elem.tag == "TEXT" and len(caminho) == 1:
+            texto_prontuario = elem.text
+
+        # Extração e Tradução das Entidades
+        elif elem.tag == "annotation" and caminho[-1:] == ["TAGS"]:
+            tag_crua = elem.get('tag', '')
+            texto_entidade = elem.get('text', '')
+
+            # Lida com tags compostas (ex: "Temporal Concept|Abbreviation")
+            for parte in tag_crua.split('|'):
+                # Traduz usando o mapa, ou mantém o original se não encontrar
+                tag_traduzida = mapa_traducoes.get(parte.strip(), parte.strip())
+
+                if tag_traduzida not in entities:
+                    entities[tag_traduzida] = []
+                    vistos[tag_traduzida] = set()
+
+                if texto_entidade not in vistos[tag_traduzida]:
+                    vistos[tag_traduzida].add(texto_entidade)
+                    entities[tag_traduzida].append(texto_entidade)
+
+            elem.clear()
+
+    return texto_prontuario, entities
+
+def processar_arquivo(prontuario_id, caminho_xml, pasta_destino, mapa_traducoes, compacto=False):
+    """Converte um XML em JSON. Retorna (nome_saida, erro)."""
+    nome_arquivo = os.path.basename(caminho_xml)
+    try:
+        texto_prontuario, entities = extrair_prontuario(caminho_xml, mapa_traducoes)
+
+        # Montagem da Estrutura Final
+        dados_processados = {
+            "prontuario_id": prontuario_id,
+            "text": texto_prontuario,
+            "entities": entities,
+            "labels": {} # Campo vazio conforme solicitado
+        }
+
+        # Salvamento do arquivo JSON
+        nome_saida = os.path.splitext(nome_arquivo)[0] + ".json"
+        caminho_saida = os.path.join(pasta_destino, nome_saida)
+
+        with open(caminho_saida, 'w', encoding='utf-8') as f_json:
+            if compacto:
+                json.dump(dados_processados, f_json, ensure_ascii=False, separators=(',', ':'))
+            else:
+                json.dump(dados_processados, f_json, ensure_ascii=False, indent=2)
+
+        return nome_saida, None
+
+    except Exception as e:
+        return None, e
+
+# Mapa de traduções de cada processo do pool (enviado uma vez, no initializer)
+_mapa_worker = None
+
+def _iniciar_worker(mapa_traducoes):
+    global _mapa_worker
+    _mapa_worker = mapa_traducoes
+
+def _processar_lote(lote, pasta_origem, pasta_destino, compacto):
+    return [
+        (nome, *processar_arquivo(idx, os.path.join(pasta_origem, nome), pasta_destino, _mapa_worker, compacto))
+        for idx, nome in lote
+    ]
+
+def processar_xmls(pasta_origem, pasta_destino, mapa_traducoes, workers=1, compacto=False, tamanho_lote=64):
+    """
+    Converte todos os XMLs da pasta. Os arquivos são ordenados pelo nome e o prontuario_id
+    é a posição nessa ordem, então o id não depende do os.listdir nem da ordem dos workers.
+    Com workers > 1 os arquivos são distribuídos em lotes para um pool de processos.
+    """
     # Cria a pasta de destino se não existir
     if not os.path.exists(pasta_destino):
         os.makedirs(pasta_destino)
 
     # Lista todos os arquivos XML na pasta de origem
-    arquivos_xml = [f for f in os.listdir(pasta_origem) if f.endswith('.xml')]
-
-    for idx, nome_arquivo in enumerate(arquivos_xml, start=1):
-        caminho_xml = os.path.join(pasta_origem, nome_arquivo)
-        
-        try:
-            tree = ET.parse(caminho_xml)
-            root = tree.getroot()
-
-            # Extração do Texto Original
-            texto_prontuario = root.find('TEXT').text if root.find('TEXT') is not None else ""
-
-            # Extração e Tradução das Entidades
-            entities = {}
-            tags_node = root.find('TAGS')
-            if tags_node is not None:
-                for ann in tags_node.findall('annotation'):
-                    tag_crua = ann.get('tag', '')
-                    texto_entidade = ann.get('text', '')
-
-                    # Lida com tags compostas (ex: "Temporal Concept|Abbreviation")
-                    partes_tag = tag_crua.split('|')
-                    
-                    for parte in partes_tag:
-                        # Traduz usando o mapa, ou mantém o original se não encontrar
-                        tag_traduzida = mapa_traducoes.get(parte.strip(), parte.strip())
-
-                        if tag_traduzida not in entities:
-                            entities[tag_traduzida] = []
-                        
-                        if texto_entidade not in entities[tag_traduzida]:
-                            entities[tag_traduzida].append(texto_entidade)
-
-            # Montagem da Estrutura Final
-            dados_processados = {
-                "prontuario_id": idx,
-                "text": texto_prontuario,
-                "entities": entities,
-                "labels": {} # Campo vazio conforme solicitado
-            }
-
-            # Salvamento do arquivo JSON
-            nome_saida = os.path.splitext(nome_arquivo)[0] + ".json"
-            caminho_saida = os.path.join(pasta_destino, nome_saida)
-
-            with open(caminho_saida, 'w', encoding='utf-8') as f_json:
-                json.dump(dados_processados, f_json, ensure_ascii=False, indent=2)
+    arquivos_xml = sorted(f for f in os.listdir(pasta_origem) if f.endswith('.xml'))
+    tarefas = list(enumerate(arquivos_xml, start=1))
+    inicio = time.monotonic()
+    erros = 0
 
-            print(f"Sucesso: {nome_arquivo} -> {nome_saida}")
+    if workers > 1:
+        lotes = [tarefas[i:i + tamanho_lote] for i in range(0, len(tarefas), tamanho_lote)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker, initargs=(mapa_traducoes,)) as executor:
+            n = len(lotes)
+            resultados = executor.map(_processar_lote, lotes, [pasta_origem] * n, [pasta_destino] * n, [compacto] * n)
+            for nome_arquivo, nome_saida, erro in (r for lote in resultados for r in lote):
+                if erro:
+                    erros += 1
+                    print(f"Erro ao processar {nome_arquivo}: {erro}")
+    else:
+        for idx, nome_arquivo in tarefas:
+            nome_saida, erro = processar_arquivo(idx, os.path.join(pasta_origem, nome_arquivo), pasta_destino, mapa_traducoes, compacto)
+            if erro:
+                erros += 1
+                print(f"Erro ao processar {nome_arquivo}: {erro}")
+            else:
+                print(f"Sucesso: {nome_arquivo} -> {nome_saida}")
 
-        except Exception as e:
-            print(f"Erro ao processar {nome_arquivo}: {e}")
+    duracao = time.monotonic() - inicio
+    print(f"{len(tarefas) - erros}/{len(tarefas)} prontuários convertidos em {duracao:.1f}s "
+          f"({len(tarefas) / max(duracao, 1e-9):.1f} arquivos/s, {workers} processo(s))")
 
 if __name__ == "__main__":
     # Configurações de caminhos
@@ -72,6 +138,11 @@ if __name__ == "__main__":
     PASTA_SAIDA = "processamento/prontuarios_processados"
     ARQUIVO_TRADUCAO = "processamento/traducao_entidades.json"
 
+    parser = argparse.ArgumentParser(description="Converte os XMLs do SemClinBR em JSON.")
+    parser.add_argument("--workers", type=int, default=1, help="Processos em paralelo (padrão: 1).")
+    parser.add_argument("--compacto", action="store_true", help="Grava JSON sem indentação.")
+    args = parser.parse_args()
+
     # Execução
     traducoes = carregar_traducoes(ARQUIVO_TRADUCAO)
-    processar_xmls(PASTA_ENTRADA, PASTA_SAIDA, traducoes)
\ No newline at end of file
+    processar_xmls(PASTA_ENTRADA, PASTA_SAIDA, traducoes, args.workers, args.compacto)
\ No newline at end of file